@@ -0,0 +1,25 @@
+"""
+Generadores de jerarquías ARX como funciones de biblioteca.
+
+Cada generador recibe los valores de una columna (array, Series o cualquier
+iterable) y devuelve la jerarquía como tabla por columnas
+{"level0": [...], ..., "root": [...]}; io.write_table la escribe en CSV.
+Los scripts jerarquias-*-v2.py son CLIs finos sobre estas funciones.
+"""
+from .numeric import numeric_hierarchy
+from .postal_code import postal_code_hierarchy
+from .education import education_hierarchy
+from .localities import localities_hierarchy, read_dictionary
+from .locality_index import LocalityIndex, load_index
+from .io import write_table
+
+__all__ = [
+    "numeric_hierarchy",
+    "postal_code_hierarchy",
+    "education_hierarchy",
+    "localities_hierarchy",
+    "read_dictionary",
+    "LocalityIndex",
+    "load_index",
+    "write_table",
+]
@@ -0,0 +1,81 @@
+"""
+Jerarquía de titulaciones por palabras clave (ES/EN):
+
+  level0 (título) -> level1 (categoría) -> level2 (macro-categoría) -> root
+"""
+import unicodedata
+from typing import Dict, Iterable, List
+
+from .io import unique_strings
+
+
+def strip_accents(s: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+def norm(s: str) -> str:
+    s = (s or "").strip().lower()
+    s = strip_accents(s)
+    return " ".join(s.split())
+
+
+# Palabras clave (ES/EN) para detección
+KEYS = {
+    "doctorado": [
+        "doctorado", "phd", "ph.d", "doctoral", "doctorate", "doctor"
+    ],
+    "master": [
+        "master", "maestria", "msc", "mba", "m. sc", "m.sc", "ms", "mres",
+        "posgrado", "postgrado", "post-grado", "post graduate", "postgraduate", "graduate degree (master)"
+    ],
+    "grado": [
+        "grado", "licenciatura", "diplomatura", "bachelor", "bsc", "b.sc", "ba",
+        "undergraduate", "college degree", "first cycle"
+    ],
+    "fp": [
+        "fp", "formacion profesional", "ciclo formativo", "vocational", "vet", "technical diploma",
+        "tecnico", "tecnica", "tecnico superior"
+    ],
+    "bachillerato": [
+        "bachillerato", "high school", "a-level", "alevel", "secondary (upper)"
+    ],
+    "secundaria": [
+        "secundaria", "eso", "middle school", "secondary", "compulsory secondary"
+    ],
+    "primaria": [
+        "primaria", "primary", "elementary"
+    ],
+}
+
+# Mapa de categoría -> macro-categoría (nivel superior)
+MACRO = {
+    "grado": "Universitaria",
+    "master": "Universitaria",
+    "doctorado": "Universitaria",
+    "fp": "Pre-universitaria",
+    "bachillerato": "Pre-universitaria",
+    "secundaria": "Básica",
+    "primaria": "Básica",
+    "otros": "Otros"
+}
+
+# Orden de prioridad: si un valor matchea varias, gana la más alta
+PRIORITY = ["doctorado", "master", "grado", "fp", "bachillerato", "secundaria", "primaria"]
+
+def classify(leaf_raw: str) -> str:
+    s = norm(leaf_raw)
+    for cat in PRIORITY:
+        for kw in KEYS[cat]:
+            if kw in s:
+                return cat
+    return "otros"
+
+def education_hierarchy(values: Iterable, root: str = "*") -> Dict[str, List[str]]:
+    """Tabla por columnas (level0, level1, level2, root), un título por fila en orden de aparición."""
+    leaves = unique_strings(values)
+    cats = [classify(leaf) for leaf in leaves]
+    return {
+        "level0": leaves,
+        "level1": [cat.capitalize() for cat in cats],
+        "level2": [MACRO.get(cat, "Otros") for cat in cats],
+        "root": [root] * len(leaves),
+    }
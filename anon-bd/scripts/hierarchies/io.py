@@ -0,0 +1,250 @@
+"""
+Entrada / salida de los generadores de jerarquías.
+
+Lectura en streaming: los generadores solo necesitan una columna, así que se
+leen SOLO las columnas pedidas y por bloques de filas, con memoria acotada
+por el tamaño del bloque y por el nº de valores distintos, no por el de filas:
+
+  - iter_chunks:    DataFrames de chunk_rows filas con las columnas pedidas
+  - unique_values:  valores únicos (sin vacíos, con strip) en orden de aparición
+  - ValueCounts:    conteo exacto de valores numéricos por bloques; se puede
+                    fusionar (merge) y da los mismos cuantiles que np.quantile
+                    (method="linear") sobre la columna completa
+
+Motores (--engine):
+  - pandas:  read_csv con usecols + chunksize (por defecto)
+  - pyarrow: lector CSV en streaming de pyarrow (opcional; columnas como texto)
+  - csv:     módulo csv de la biblioteca estándar, sin dependencias
+
+Salida: las jerarquías son tablas por columnas ({"level0": [...], ..., "root": [...]})
+y write_table las escribe como CSV para ARX.
+"""
+from __future__ import annotations
+
+import csv
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+ENGINES = ("pandas", "pyarrow", "csv")
+DEFAULT_ENGINE = "pandas"
+DEFAULT_CHUNK_ROWS = 500_000
+DEFAULT_ENCODING = "utf-8-sig"
+
+# bytes por fila que se suponen para traducir chunk_rows al block_size de pyarrow
+PYARROW_BYTES_PER_ROW = 64
+
+
+class MissingColumnError(ValueError):
+    def __init__(self, path: str, columns: List[str], header: List[str]):
+        self.columns = columns
+        self.header = header
+        super().__init__(f"La(s) columna(s) {columns} no existe(n) en {path}. Columnas: {header}")
+
+
+def sniff_delimiter(path: str, sample_size: int = 4096, fallback: str = ",",
+                    encoding: str = DEFAULT_ENCODING) -> str:
+    with open(path, "r", encoding=encoding, newline="") as f:
+        sample = f.read(sample_size)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=[",", ";", "|", "\t"]).delimiter
+    except Exception:
+        return fallback
+
+
+def read_header(path: str, sep: str = ",", encoding: str = DEFAULT_ENCODING) -> List[str]:
+    with open(path, "r", encoding=encoding, newline="") as f:
+        return next(csv.reader(f, delimiter=sep), [])
+
+
+def _check_columns(path, columns, sep, encoding):
+    header = read_header(path, sep, encoding)
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise MissingColumnError(path, missing, header)
+    return header
+
+
+def iter_chunks(path: str, columns: List[str], sep: str = ",", chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                engine: str = DEFAULT_ENGINE, as_str: bool = True,
+                encoding: str = DEFAULT_ENCODING) -> Iterator[pd.DataFrame]:
+    """
+    DataFrames de hasta chunk_rows filas con solo `columns`. Con as_str=True
+    los valores son texto tal cual ("" si la celda está vacía, como
+    csv.DictReader); con as_str=False (solo motor pandas) se infieren los tipos
+    igual que en un pd.read_csv completo.
+    """
+    header = _check_columns(path, columns, sep, encoding)
+
+    if engine == "pandas":
+        kw = dict(dtype=str, keep_default_na=False, na_filter=False) if as_str else {}
+        for chunk in pd.read_csv(path, sep=sep, usecols=columns, chunksize=chunk_rows,
+                                 encoding=encoding, **kw):
+            yield chunk.fillna("") if as_str else chunk
+
+    elif engine == "pyarrow":
+        try:
+            import pyarrow as pa
+            from pyarrow import csv as pacsv
+        except ImportError:
+            raise SystemExit("pyarrow no está instalado (pip install pyarrow); usa --engine pandas o csv.")
+        reader = pacsv.open_csv(
+            path,
+            read_options=pacsv.ReadOptions(block_size=max(1 << 20, chunk_rows * PYARROW_BYTES_PER_ROW),
+                                           encoding="utf8"),
+            parse_options=pacsv.ParseOptions(delimiter=sep),
+            convert_options=pacsv.ConvertOptions(
+                include_columns=columns,
+                column_types={c: pa.string() for c in columns},
+                strings_can_be_null=False,
+                quoted_strings_can_be_null=False,
+            ),
+        )
+        for batch in reader:
+            yield batch.to_pandas()
+
+    elif engine == "csv":
+        idx = [header.index(c) for c in columns]
+        with open(path, "r", encoding=encoding, newline="") as f:
+            r = csv.reader(f, delimiter=sep)
+            next(r, None)
+            buf = []
+            for row in r:
+                if not row:
+                    continue
+                buf.append([row[i] if i < len(row) else "" for i in idx])
+                if len(buf) >= chunk_rows:
+                    yield pd.DataFrame(buf, columns=columns)
+                    buf = []
+            if buf:
+                yield pd.DataFrame(buf, columns=columns)
+
+    else:
+        raise ValueError(f"Motor desconocido '{engine}' (opciones: {', '.join(ENGINES)})")
+
+
+def unique_values(path: str, column: str, sep: str = ",", chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                  engine: str = DEFAULT_ENGINE, encoding: str = DEFAULT_ENCODING) -> List[str]:
+    """Valores no vacíos (con strip) de la columna, sin repetir y en orden de primera aparición."""
+    seen = {}
+    for chunk in iter_chunks(path, [column], sep=sep, chunk_rows=chunk_rows, engine=engine,
+                             encoding=encoding):
+        s = chunk[column].str.strip()
+        for v in pd.unique(s[s != ""]):
+            seen.setdefault(v, None)
+    return list(seen)
+
+
+class ValueCounts:
+    """
+    Conteo exacto de los valores numéricos de una columna, acumulado por
+    bloques: xs (valores distintos, ordenados) y counts. Es un resumen
+    fusionable sin pérdida, así que los cuantiles son exactos; la memoria
+    crece con el nº de valores distintos.
+    """
+
+    def __init__(self):
+        self.xs = np.empty(0, dtype=float)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.all_int = True  # como pd.to_numeric sobre la columna entera: int64 si no hay decimales ni NaN
+
+    def add(self, values) -> None:
+        """Añade un bloque (Series o array); lo no numérico se descarta como hace pd.to_numeric(errors='coerce')."""
+        series = pd.to_numeric(pd.Series(values), errors="coerce")
+        if not pd.api.types.is_integer_dtype(series.dtype):
+            self.all_int = False
+        arr = series.to_numpy(dtype=float, na_value=np.nan)
+        arr = arr[~np.isnan(arr)]
+        xs, counts = np.unique(arr, return_counts=True)
+        self._merge(xs, counts)
+
+    def merge(self, other: "ValueCounts") -> None:
+        self.all_int = self.all_int and other.all_int
+        self._merge(other.xs, other.counts)
+
+    def _merge(self, xs, counts) -> None:
+        if xs.size == 0:
+            return
+        all_xs = np.concatenate([self.xs, xs])
+        all_counts = np.concatenate([self.counts, counts])
+        self.xs, inv = np.unique(all_xs, return_inverse=True)
+        self.counts = np.bincount(inv, weights=all_counts, minlength=self.xs.size).astype(np.int64)
+
+    @property
+    def n(self) -> int:
+        return int(self.counts.sum())
+
+    def unique(self) -> np.ndarray:
+        """Valores distintos ordenados (enteros si la columna entera lo sería)."""
+        return self.xs.astype(np.int64) if self.all_int else self.xs
+
+    def min(self) -> float:
+        return float(self.xs[0])
+
+    def _at(self, positions: np.ndarray) -> np.ndarray:
+        # valor en la posición p de la columna ordenada (con repeticiones)
+        cum = np.cumsum(self.counts)
+        return self.xs[np.searchsorted(cum, positions, side="right")]
+
+    def quantile(self, qs) -> np.ndarray:
+        """
+        Igual que np.quantile(columna, qs, method="linear"): mismo índice
+        virtual (n - 1) * q y misma interpolación (_lerp de numpy).
+        """
+        qs = np.asarray(qs, dtype=float)
+        n = self.n
+        virtual = (n - 1) * qs
+        prev = np.floor(virtual)
+        nxt = prev + 1
+        above = virtual >= n - 1
+        prev[above] = n - 1
+        nxt[above] = n - 1
+        a = self._at(prev.astype(np.int64))
+        b = self._at(nxt.astype(np.int64))
+        # numpy calcula gamma con el índice anterior ya recortado a -1; con a == b da igual
+        gamma = virtual - np.where(above, -1.0, prev)
+        diff = b - a
+        out = a + diff * gamma
+        hi = gamma >= 0.5
+        out[hi] = (b - diff * (1 - gamma))[hi]
+        return out
+
+
+def count_values(path: str, column: str, sep: str = ",", chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                 engine: str = DEFAULT_ENGINE, encoding: str = DEFAULT_ENCODING) -> ValueCounts:
+    """ValueCounts de una columna numérica leída en streaming."""
+    acc = ValueCounts()
+    # con pandas se dejan inferir los tipos, para leer los números igual que un read_csv completo
+    for chunk in iter_chunks(path, [column], sep=sep, chunk_rows=chunk_rows, engine=engine,
+                             as_str=(engine != "pandas"), encoding=encoding):
+        acc.add(chunk[column])
+    return acc
+
+
+Table = Dict[str, Sequence]
+
+
+def unique_strings(values: Iterable) -> List[str]:
+    """Valores no vacíos (con strip, sin nulos) sin repetir, en orden de primera aparición."""
+    seen = {}
+    for v in values:
+        if v is None or (isinstance(v, float) and v != v):
+            continue
+        v = str(v).strip()
+        if v:
+            seen.setdefault(v, None)
+    return list(seen)
+
+
+def table_rows(table: Table) -> Iterator[list]:
+    """Filas de una tabla por columnas."""
+    return (list(r) for r in zip(*table.values()))
+
+
+def write_table(table: Table, path: str, lineterminator: str = "\r\n") -> None:
+    """Escribe la tabla como CSV (cabecera = nombres de columna)."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f, lineterminator=lineterminator)
+        w.writerow(list(table))
+        w.writerows(table_rows(table))
@@ -0,0 +1,96 @@
+"""
+Jerarquía de localidades: municipio/localidad -> provincia -> ccaa -> root,
+con un diccionario de referencia (CSV, delimitador autodetectado).
+"""
+import csv
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .io import unique_strings
+
+# distancia de edición máxima de un casado aproximado, como fracción de la longitud de la clave;
+# 0 = desactivado (solo exacto y variantes): un nombre parecido puede ser otro municipio
+# (Lérida → Mérida), así que el casado aproximado hay que pedirlo (p.ej. 0.2)
+DEFAULT_FUZZY_RATIO = 0.0
+
+def norm(s):
+    return (s or "").strip().lower()
+
+def sniff_reader(fh, sample_size=4096, fallback_delimiter=","):
+    sample = fh.read(sample_size)
+    fh.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=[",",";","|","\t"])
+    except Exception:
+        class SimpleDialect(csv.excel):
+            delimiter = fallback_delimiter
+        dialect = SimpleDialect()
+    return dialect
+
+def read_rows(dict_csv):
+    """Filas (municipio, provincia, ccaa) del diccionario, sin las de municipio vacío."""
+    with open(dict_csv, "r", encoding="utf-8-sig", newline="") as f:
+        dialect = sniff_reader(f)
+        r = csv.DictReader(f, dialect=dialect)
+
+        # Columnas esperadas (case-insensitive). Permitimos 'localidad' como alias de 'municipio'.
+        cols_lower = { (c or "").strip().lower(): c for c in r.fieldnames if c }
+        municipio_col = cols_lower.get("municipio") or cols_lower.get("localidad")
+        provincia_col = cols_lower.get("provincia")
+        ccaa_col      = cols_lower.get("ccaa")
+
+        if not (municipio_col and provincia_col and ccaa_col):
+            raise ValueError(
+                "El diccionario debe tener columnas municipio/localidad, provincia y ccaa.\n"
+                f"Encontradas: {r.fieldnames}\n"
+                "Ejemplos válidos de cabecera: "
+                "['municipio;provincia;ccaa'], ['localidad;provincia;ccaa;país'], ['municipio,provincia,ccaa']"
+            )
+
+        for row in r:
+            mun  = (row[municipio_col] or "").strip()
+            prov = (row[provincia_col] or "").strip()
+            ccaa = (row[ccaa_col] or "").strip()
+            if mun:
+                yield mun, prov, ccaa
+
+def read_dictionary(dict_csv):
+    """
+    Acepta cabeceras:
+      - municipio / localidad  (cualquiera de las dos)
+      - provincia
+      - ccaa
+    Delimitador detectado automáticamente (',' o ';', etc).
+    Devuelve dict: key=municipio(lower), value=(provincia, ccaa) con nombres originales.
+    """
+    return {norm(mun): (prov, ccaa) for mun, prov, ccaa in read_rows(dict_csv)}
+
+def localities_hierarchy(values: Iterable, dictionary, fuzzy_ratio: float = DEFAULT_FUZZY_RATIO,
+                         resolved: Optional[dict] = None) -> Tuple[Dict[str, List[str]], List[str]]:
+    """
+    (tabla por columnas level0, level1, level2, root con una fila por localidad
+    distinta, ordenadas; localidades sin entrada en el diccionario, que no
+    tienen fila).
+
+    `dictionary` es un LocalityIndex (load_index) o un dict de read_dictionary.
+    Las localidades que no casan exactas se buscan por variante (acentos,
+    artículo, denominación bilingüe) y, con fuzzy_ratio > 0, por distancia de
+    edición; si se pasa `resolved` se rellena con {localidad: (nombre en el
+    diccionario, "variant" | "fuzzy")}.
+    """
+    from .locality_index import LocalityIndex  # importa este módulo
+    index = dictionary if isinstance(dictionary, LocalityIndex) else LocalityIndex.from_dict(dictionary)
+    table = {"level0": [], "level1": [], "level2": [], "root": []}
+    missing = []
+    for mun in sorted(unique_strings(values)):
+        match, how = index.lookup(mun, fuzzy_ratio)
+        if match is None:
+            missing.append(mun)
+            continue
+        name, prov, ccaa = match
+        if resolved is not None and how != "exact":
+            resolved[mun] = (name, how)
+        table["level0"].append(mun)
+        table["level1"].append(prov)
+        table["level2"].append(ccaa)
+        table["root"].append("*")
+    return table, missing
@@ -0,0 +1,253 @@
+"""
+Índice del diccionario de localidades, cacheado en disco.
+
+read_dictionary parsea el CSV (~8.000 filas, delimitador detectado) en cada
+ejecución y solo casa por lower() exacto: "La Coruña" frente a "A Coruña", o
+"Alfàs del Pi" frente a "Alfàs del Pi (l')", dejaban la localidad sin mapeo y
+la jerarquía fallaba entera. LocalityIndex guarda:
+
+  - el diccionario exacto de siempre (municipio en minúsculas → provincia, ccaa)
+  - claves plegadas: sin acentos ni puntuación, sin artículo inicial o final
+    entre paréntesis ("Baña (A)" y "A Baña" → "bana") y una por cada nombre
+    de las denominaciones bilingües ("Alcoy/Alcoi" → "alcoy", "alcoi")
+  - un índice de trigramas de las claves plegadas para buscar candidatos de
+    casado aproximado (opcional, fuzzy_ratio > 0), que se ordenan por
+    distancia de edición; solo se acepta un candidato que le saque un margen
+    claro al siguiente
+
+Se guarda con pickle junto al CSV (<csv>.idx.pkl) con la SHA-256 del CSV como
+firma: el CSV solo se vuelve a parsear cuando cambia su contenido.
+"""
+import hashlib
+import os
+import pickle
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .localities import DEFAULT_FUZZY_RATIO, norm, read_rows
+
+INDEX_VERSION = 1
+
+# candidatos (los que más trigramas comparten) a los que se calcula la distancia
+FUZZY_CANDIDATES = 20
+# un casado aproximado solo se acepta si el siguiente municipio más cercano está
+# al menos a esta distancia de más ("lerida": merida a 1, cerda a 2 → se rechaza)
+FUZZY_MARGIN = 2
+
+_ARTICLES = r"(?:el|la|los|las|lo|a|o|os|as|es|sa|ses|els|les|l'|s')"
+_LEADING_ARTICLE = re.compile(rf"^(?:{_ARTICLES}\s+|[ls]')(?=\S)")
+_TRAILING_ARTICLE = re.compile(rf"\s*\(\s*{_ARTICLES}\s*\)$")
+_PUNCT = re.compile(r"[\s\-'’`´.,()]+")
+
+Match = Tuple[str, str, str]  # (nombre en el diccionario, provincia, ccaa)
+
+
+def fold(s) -> str:
+    """Minúsculas, sin acentos (ñ → n) y con los espacios recortados."""
+    s = unicodedata.normalize("NFKD", norm(s))
+    return "".join(ch for ch in s if not unicodedata.combining(ch))
+
+
+def name_keys(name) -> List[str]:
+    """Claves plegadas de un nombre: una por denominación, sin artículo ni puntuación."""
+    keys = []
+    for part in fold(name).replace("’", "'").split("/"):
+        part = _TRAILING_ARTICLE.sub("", part.strip())
+        part = _LEADING_ARTICLE.sub("", part)
+        key = _PUNCT.sub(" ", part).strip()
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein acotado: cualquier valor > limit se devuelve como limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return min(prev[-1], limit + 1)
+
+
+def file_signature(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class LocalityIndex:
+    """
+    Diccionario de localidades por columnas, para que cargarlo del pickle sea
+    barato: las claves apuntan a filas (enteros) y cada fila a un lugar
+    (provincia, ccaa) de una tabla sin repetidos; los trigramas son listas de
+    posiciones concatenadas en un único array (gram_ptr / gram_ids).
+    """
+
+    def __init__(self, names: List[str], places: List[Tuple[str, str]], row_place, exact: Dict[str, int],
+                 key_pos: Dict[str, int], key_row, gram_pos: Dict[str, int], gram_ptr, gram_ids):
+        self.names = names          # fila → municipio tal cual en el diccionario
+        self.places = places        # lugares distintos (provincia, ccaa)
+        self.row_place = row_place  # fila → lugar
+        self.exact = exact          # norm(municipio) → fila (la última, como read_dictionary)
+        self.key_pos = key_pos      # clave plegada → posición
+        self.keys = list(key_pos)   # posición → clave plegada
+        self.key_row = key_row      # posición → fila; -1 si la clave es de dos lugares (ambigua)
+        self.gram_pos = gram_pos    # trigrama → tramo gram_ids[gram_ptr[g]:gram_ptr[g + 1]]
+        self.gram_ptr = gram_ptr
+        self.gram_ids = gram_ids
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Índice de filas (municipio, provincia, ccaa)."""
+        names, places, place_pos, row_place, exact, key_pos, key_row = [], [], {}, [], {}, {}, []
+        for mun, prov, ccaa in rows:
+            row = len(names)
+            names.append(mun)
+            place = place_pos.setdefault((prov, ccaa), len(places))
+            if place == len(places):
+                places.append((prov, ccaa))
+            row_place.append(place)
+            exact[norm(mun)] = row
+            for key in name_keys(mun):
+                i = key_pos.setdefault(key, len(key_row))
+                if i == len(key_row):
+                    key_row.append(row)
+                elif key_row[i] >= 0 and row_place[key_row[i]] != place:
+                    key_row[i] = -1  # misma clave en dos provincias: no se resuelve por ella
+        postings = {}
+        for i, key in enumerate(key_pos):
+            for g in trigrams(key):
+                postings.setdefault(g, []).append(i)
+        gram_pos = {g: j for j, g in enumerate(postings)}
+        sizes = [len(p) for p in postings.values()]
+        gram_ptr = np.zeros(len(sizes) + 1, dtype=np.int32)
+        np.cumsum(sizes, out=gram_ptr[1:])
+        gram_ids = np.fromiter((i for p in postings.values() for i in p), dtype=np.int32, count=int(gram_ptr[-1]))
+        return cls(names, places, np.asarray(row_place, dtype=np.int32), exact,
+                   key_pos, np.asarray(key_row, dtype=np.int32), gram_pos, gram_ptr, gram_ids)
+
+    @classmethod
+    def from_dict(cls, dictionary: Dict[str, Tuple[str, str]]):
+        """Índice de un dict de read_dictionary (los nombres quedan en minúsculas)."""
+        return cls.from_rows((mun, prov, ccaa) for mun, (prov, ccaa) in dictionary.items())
+
+    def _match(self, row: int) -> Match:
+        return (self.names[row], *self.places[self.row_place[row]])
+
+    # ---------- búsqueda ----------
+
+    def lookup(self, name, fuzzy_ratio: float = DEFAULT_FUZZY_RATIO) -> Tuple[Optional[Match], str]:
+        """
+        (nombre del diccionario, provincia, ccaa) de una localidad y cómo se ha
+        casado: "exact", "variant" (acentos / artículo / denominación) o "fuzzy";
+        (None, "missing") si no hay casado o es ambiguo.
+        """
+        row = self.exact.get(norm(name))
+        if row is not None:
+            return (name, *self.places[self.row_place[row]]), "exact"
+        keys = name_keys(name)
+        for k in keys:
+            i = self.key_pos.get(k)
+            if i is not None and self.key_row[i] >= 0:
+                return self._match(self.key_row[i]), "variant"
+        if fuzzy_ratio > 0:
+            for k in keys:
+                m = self._fuzzy(k, fuzzy_ratio)
+                if m is not None:
+                    return m, "fuzzy"
+        return None, "missing"
+
+    def _fuzzy(self, key: str, fuzzy_ratio: float) -> Optional[Match]:
+        limit = int(len(key) * fuzzy_ratio)
+        if limit < 1:
+            return None
+        grams = [self.gram_pos[g] for g in trigrams(key) if g in self.gram_pos]
+        if not grams:
+            return None
+        ids = np.concatenate([self.gram_ids[self.gram_ptr[g]:self.gram_ptr[g + 1]] for g in grams])
+        cand, shared = np.unique(ids, return_counts=True)
+        # distancias hasta limit + FUZZY_MARGIN para conocer también al segundo
+        far = limit + FUZZY_MARGIN
+        best, best_d, second_d = None, far + 1, far + 1
+        for i in cand[np.argsort(-shared, kind="stable")[:FUZZY_CANDIDATES]]:
+            row = self.key_row[i]
+            d = edit_distance(key, self.keys[i], far)
+            if row == best:
+                best_d = min(best_d, d)  # otra denominación del mismo municipio: no compite
+            elif d < best_d:
+                # una clave ambigua (-1) también cuenta como competidora
+                second_d = best_d if best is not None else second_d
+                best, best_d = row, d
+            elif d < second_d:
+                second_d = d
+        if best is None or best < 0 or best_d > limit or second_d - best_d < FUZZY_MARGIN:
+            return None  # sin candidato cercano, ambiguo o sin margen claro sobre el segundo
+        return self._match(best)
+
+    # ---------- persistencia ----------
+
+    def save(self, path: str, signature=None):
+        data = {
+            "version": INDEX_VERSION,
+            "signature": signature,
+            "names": self.names,
+            "places": self.places,
+            "row_place": self.row_place,
+            "exact": self.exact,
+            "key_pos": self.key_pos,
+            "key_row": self.key_row,
+            "gram_pos": self.gram_pos,
+            "gram_ptr": self.gram_ptr,
+            "gram_ids": self.gram_ids,
+        }
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, signature=None):
+        """Carga el índice si existe y corresponde a `signature`; si no, None."""
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if data.get("version") != INDEX_VERSION or data.get("signature") != signature:
+            return None
+        return cls(data["names"], data["places"], data["row_place"], data["exact"], data["key_pos"],
+                   data["key_row"], data["gram_pos"], data["gram_ptr"], data["gram_ids"])
+
+
+def load_index(dict_csv: str, index_path: Optional[str] = None) -> LocalityIndex:
+    """
+    Índice del diccionario: el guardado en index_path (por defecto <csv>.idx.pkl)
+    si la SHA-256 del CSV no ha cambiado; si no, se parsea el CSV y se guarda.
+    """
+    index_path = index_path or dict_csv + ".idx.pkl"
+    signature = file_signature(dict_csv)
+    index = LocalityIndex.load(index_path, signature)
+    if index is not None:
+        return index
+    index = LocalityIndex.from_rows(read_rows(dict_csv))
+    try:
+        index.save(index_path, signature)
+    except OSError as e:
+        print(f"[WARN] No se pudo guardar el índice de localidades en {index_path}: {e}")
+    return index
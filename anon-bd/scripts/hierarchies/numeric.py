@@ -0,0 +1,166 @@
+"""
+Jerarquía *leaf-per-value* para una columna NUMÉRICA.
+
+  level0 = valor hoja (valor único, como string)
+  level1..levelN = rangos: bins por cuantiles fusionados hasta tener >= k filas,
+                   y cada nivel junta los rangos del anterior de dos en dos
+  root = '*'
+
+numeric_hierarchy acepta un array / iterable de valores o un ValueCounts ya
+acumulado (ver io.count_values para leer la columna en streaming).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+import numpy as np
+
+from .io import ValueCounts
+
+@dataclass
+class Bin:
+    lo: float
+    hi: float
+    count: int  # nº de filas (del array filtrado) que caen en el bin
+
+    def size(self) -> int:
+        return self.count
+
+def quantile_edges(acc: ValueCounts, qbins: int) -> np.ndarray:
+    qs = np.linspace(0.0, 1.0, qbins + 1)
+    edges = acc.quantile(qs)  # == np.quantile(valores, qs, method="linear")
+    edges = np.unique(edges)
+    if edges.size < 2:
+        e0 = acc.min()
+        e1 = e0 + 1e-9
+        return np.array([e0, e1], dtype=float)
+    return edges.astype(float)
+
+def assign_bins(acc: ValueCounts, edges: np.ndarray) -> List[Bin]:
+    # 0..len(edges)-2; el valor máximo (== edges[-1]) ya cae en el último bin
+    bins_idx = np.digitize(acc.xs, edges[1:-1], right=True)
+    counts = np.bincount(bins_idx, weights=acc.counts, minlength=len(edges) - 1).astype(np.int64)
+    return [Bin(float(edges[i]), float(edges[i + 1]), int(counts[i])) for i in range(len(edges) - 1)]
+
+def merge_until_k(bins: List[Bin], k: int) -> List[Bin]:
+    # los bins son disjuntos: fusionar es sumar conteos (no hace falta unir índices)
+    changed = True
+    while changed:
+        changed = False
+        i = 0
+        new_bins: List[Bin] = []
+        while i < len(bins):
+            b = bins[i]
+            if b.size() >= k or i == len(bins) - 1:
+                new_bins.append(b)
+                i += 1
+            else:
+                j = i + 1
+                count = b.count
+                hi = b.hi
+                while j < len(bins) and count < k:
+                    count += bins[j].count
+                    hi = bins[j].hi
+                    j += 1
+                new_bins.append(Bin(b.lo, hi, count))
+                i = j
+                changed = True
+        bins = new_bins
+        # también fusiona por la derecha si el último se queda <k
+        if len(bins) > 1 and bins[-1].size() < k:
+            prev = bins[-2]
+            last = bins[-1]
+            bins = bins[:-2] + [Bin(prev.lo, last.hi, prev.count + last.count)]
+            changed = True
+    return bins
+
+def build_levels(bins: List[Bin]) -> List[List[Tuple[float, float]]]:
+    levels: List[List[Tuple[float, float]]] = []
+    current = [(b.lo, b.hi) for b in bins]
+    while True:
+        levels.append(current)
+        if len(current) == 1:
+            break
+        nxt: List[Tuple[float, float]] = []
+        i = 0
+        while i < len(current):
+            lo = current[i][0]
+            hi = current[i][1]
+            if i + 1 < len(current):
+                hi = current[i + 1][1]
+                i += 2
+            else:
+                i += 1
+            nxt.append((lo, hi))
+        current = nxt
+    return levels
+
+def format_range(lo: float, hi: float, dp: int) -> str:
+    if dp <= 0:
+        return f"[{int(round(lo))},{int(round(hi))})" if lo != hi else f"[{int(round(lo))},{int(round(hi))}]"
+    fmt = f"{{:.{dp}f}}"
+    a = fmt.format(lo).rstrip('0').rstrip('.')
+    b = fmt.format(hi).rstrip('0').rstrip('.')
+    return f"[{a},{b})" if lo != hi else f"[{a},{b}]"
+
+def locate_bins(values: np.ndarray, bins: List[Bin]) -> np.ndarray:
+    """
+    Bin de cada valor: el i con lo_i <= v < hi_i (el último incluye su hi).
+    Los bins son contiguos (hi_i == lo_i+1), así que basta un searchsorted
+    sobre los lo. Los valores fuera de [lo_0, hi_último] (p.ej. hojas
+    redondeadas por debajo del mínimo) van al bin de punto medio más cercano.
+    """
+    v = np.asarray(values, dtype=float)
+    los = np.array([b.lo for b in bins], dtype=float)
+    his = np.array([b.hi for b in bins], dtype=float)
+    bi = np.searchsorted(los, v, side="right") - 1
+    outside = (v < los[0]) | (v > his[-1])
+    if outside.any():
+        mids = (los + his) / 2.0
+        bi[outside] = np.abs(mids[None, :] - v[outside][:, None]).argmin(axis=1)
+    return bi
+
+def leaf_table(unique_vals: np.ndarray,
+               bins: List[Bin],
+               levels: List[List[Tuple[float, float]]],
+               dp: int) -> Dict[str, np.ndarray]:
+    """Tabla por columnas (level0..levelN, root) con una fila por valor único."""
+    bi = locate_bins(unique_vals, bins)
+
+    # hojas: enteros de una vez; con decimales, str() de cada valor (misma representación que antes)
+    if dp <= 0:
+        leaves = unique_vals.astype(np.int64).astype(str)
+    else:
+        leaves = np.array([str(v) for v in unique_vals], dtype=object)
+
+    table = {'level0': leaves}
+    # level1..levelN: etiquetas formateadas una vez por rango e indexadas por bin
+    for lvl_idx, rngs in enumerate(levels, start=1):
+        labels = np.array([format_range(lo, hi, dp) for (lo, hi) in rngs], dtype=object)
+        table[f'level{lvl_idx}'] = labels[bi >> (lvl_idx - 1)]
+    # unique_vals viene ordenado (np.unique) y las hojas son únicas: ya está en orden numérico
+    table['root'] = np.full(len(leaves), '*', dtype=object)
+    return table
+
+def numeric_hierarchy(values, bins: int = 12, k: int = 10, decimal_places: int = 0) -> Dict[str, np.ndarray]:
+    """
+    Jerarquía de una columna numérica. `values`: ValueCounts o array / iterable
+    (lo no numérico se descarta). ValueError si no hay ningún valor numérico.
+    """
+    if isinstance(values, ValueCounts):
+        acc = values
+    else:
+        acc = ValueCounts()
+        acc.add(values if hasattr(values, "__len__") else list(values))
+    if acc.n == 0:
+        raise ValueError("Sin valores numéricos válidos en la columna (todo NaN).")
+
+    # valores únicos (hojas únicas)
+    if decimal_places <= 0:
+        unique_vals = np.unique(np.round(acc.unique()).astype(int))
+    else:
+        unique_vals = acc.unique()
+
+    edges = quantile_edges(acc, max(1, bins))
+    merged = merge_until_k(assign_bins(acc, edges), max(1, k))
+    return leaf_table(unique_vals, merged, build_levels(merged), dp=max(0, decimal_places))
@@ -0,0 +1,46 @@
+"""
+Jerarquía de códigos postales: una fila por CP normalizado, truncando dígitos.
+
+  28001 -> 2800* -> 280** -> 28*** -> 2**** -> root
+"""
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+from .io import unique_strings
+
+
+def normalize_cp(cp: str, digits: int, pad_char: str = "0"):
+    s = re.sub(r"\D", "", str(cp))  # solo dígitos
+    if not s:
+        return None
+    if len(s) < digits:
+        s = s.zfill(digits)
+    elif len(s) > digits:
+        s = s[:digits]
+    return s
+
+
+def generalize_chain(cp: str):
+    # level0 = exacto; luego vamos truncando y rellenando con '*'
+    # 5 dígitos -> 4* -> 3** -> 2*** -> 1**** -> root=*
+    levels = [cp]
+    for keep in (4, 3, 2, 1):
+        levels.append(cp[:keep] + "*"*(len(cp)-keep))
+    return levels
+
+
+def postal_code_hierarchy(values: Iterable, digits: int = 5, root: str = "*") -> Dict[str, List[str]]:
+    """Tabla por columnas (level0..levelN, root), un CP normalizado por fila en orden de aparición."""
+    uniq = OrderedDict()
+    for raw in unique_strings(values):
+        cp = normalize_cp(raw, digits)
+        if cp:
+            uniq[cp] = True
+
+    chains = [generalize_chain(cp) for cp in uniq]
+    # cabecera level0..level4,root (con digits=5); sin valores, solo level0,root
+    n_levels = len(chains[0]) if chains else 1
+    table = {f"level{i}": [c[i] for c in chains] for i in range(n_levels)}
+    table["root"] = [root] * len(chains)
+    return table
@@ -8,6 +8,22 @@ def dig5(s: str) -> str:
 def trunc(cp: str, keep: int) -> str:
     return cp[:keep] + "x"*(5-keep)
 
+def cp_hier(series, out_csv, country="España"):
+    vals = series.dropna().astype(str).drop_duplicates()
+    rows = []
+    for v in vals:
+        v5 = dig5(v)
+        rows.append({
+            "level0": v5,
+            "level1": trunc(v5,4),
+            "level2": trunc(v5,3),
+            "level3": trunc(v5,2),
+            "level4": trunc(v5,1),
+            "level5": country
+        })
+
+    pd.DataFrame(rows, columns=[f"level{i}" for i in range(6)]).to_csv(out_csv, index=False)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--in",  dest="inp", required=True)
@@ -20,20 +36,7 @@ def main():
     if args.col not in df.columns:
         raise SystemExit(f"Columna '{args.col}' no encontrada en {args.inp}")
 
-    vals = df[args.col].dropna().astype(str).drop_duplicates()
-    rows = []
-    for v in vals:
-        v5 = dig5(v)
-        rows.append({
-            "level0": v5,
-            "level1": trunc(v5,4),
-            "level2": trunc(v5,3),
-            "level3": trunc(v5,2),
-            "level4": trunc(v5,1),
-            "level5": args.country
-        })
-
-    pd.DataFrame(rows, columns=[f"level{i}" for i in range(6)]).to_csv(args.out, index=False)
+    cp_hier(df[args.col], args.out, country=args.country)
 
 if __name__ == "__main__":
     main()
@@ -1,65 +1,9 @@
 #!/usr/bin/env python3
-import csv, argparse, sys, unicodedata
-from collections import OrderedDict
+# CLI de hierarchies.education: jerarquía ARX de titulaciones por palabras clave
+import argparse, sys
 
-def strip_accents(s: str) -> str:
-    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
-
-def norm(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = strip_accents(s)
-    return " ".join(s.split())
-
-# Palabras clave (ES/EN) para detección
-KEYS = {
-    "doctorado": [
-        "doctorado", "phd", "ph.d", "doctoral", "doctorate", "doctor"
-    ],
-    "master": [
-        "master", "maestria", "msc", "mba", "m. sc", "m.sc", "ms", "mres",
-        "posgrado", "postgrado", "post-grado", "post graduate", "postgraduate", "graduate degree (master)"
-    ],
-    "grado": [
-        "grado", "licenciatura", "diplomatura", "bachelor", "bsc", "b.sc", "ba",
-        "undergraduate", "college degree", "first cycle"
-    ],
-    "fp": [
-        "fp", "formacion profesional", "ciclo formativo", "vocational", "vet", "technical diploma",
-        "tecnico", "tecnica", "tecnico superior"
-    ],
-    "bachillerato": [
-        "bachillerato", "high school", "a-level", "alevel", "secondary (upper)"
-    ],
-    "secundaria": [
-        "secundaria", "eso", "middle school", "secondary", "compulsory secondary"
-    ],
-    "primaria": [
-        "primaria", "primary", "elementary"
-    ],
-}
-
-# Mapa de categoría -> macro-categoría (nivel superior)
-MACRO = {
-    "grado": "Universitaria",
-    "master": "Universitaria",
-    "doctorado": "Universitaria",
-    "fp": "Pre-universitaria",
-    "bachillerato": "Pre-universitaria",
-    "secundaria": "Básica",
-    "primaria": "Básica",
-    "otros": "Otros"
-}
-
-# Orden de prioridad: si un valor matchea varias, gana la más alta
-PRIORITY = ["doctorado", "master", "grado", "fp", "bachillerato", "secundaria", "primaria"]
-
-def classify(leaf_raw: str) -> str:
-    s = norm(leaf_raw)
-    for cat in PRIORITY:
-        for kw in KEYS[cat]:
-            if kw in s:
-                return cat
-    return "otros"
+from hierarchies import education_hierarchy, write_table
+from hierarchies.io import ENGINES, DEFAULT_ENGINE, DEFAULT_CHUNK_ROWS, MissingColumnError, unique_values
 
 def main():
     ap = argparse.ArgumentParser(description="Genera jerarquía ARX para educación (por palabras clave).")
@@ -67,32 +11,18 @@ def main():
     ap.add_argument("--col", default="education", help="Nombre de la columna (por defecto 'education')")
     ap.add_argument("--output", required=True, help="CSV de jerarquía de salida")
     ap.add_argument("--root", default="*", help="Etiqueta root (por defecto '*')")
+    ap.add_argument("--engine", choices=ENGINES, default=DEFAULT_ENGINE, help="lector del CSV (streaming por bloques)")
+    ap.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="filas por bloque de lectura")
     args = ap.parse_args()
 
-    # Valores únicos, orden estable
-    uniq = OrderedDict()
-    with open(args.input, newline="", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        if args.col not in r.fieldnames:
-            sys.exit(f"ERROR: la columna '{args.col}' no existe en {args.input}.")
-        for row in r:
-            v = (row.get(args.col) or "").strip()
-            if v:
-                uniq.setdefault(v, True)
-
-    rows = []
-    for leaf in uniq.keys():
-        cat = classify(leaf)
-        macro = MACRO.get(cat, "Otros")
-        # Formato ARX: level0 (hoja) -> level1 (categoría) -> level2 (macro) -> root
-        rows.append([leaf, cat.capitalize(), macro, args.root])
+    # Valores únicos, orden estable (solo la columna, en streaming)
+    try:
+        values = unique_values(args.input, args.col, chunk_rows=args.chunk_rows, engine=args.engine)
+    except MissingColumnError:
+        sys.exit(f"ERROR: la columna '{args.col}' no existe en {args.input}.")
 
-    # Cabecera consistente con 3 niveles + root
-    header = ["level0", "level1", "level2", "root"]
-    with open(args.output, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(header)
-        w.writerows(rows)
+    # Formato ARX: level0 (hoja) -> level1 (categoría) -> level2 (macro) -> root
+    write_table(education_hierarchy(values, root=args.root), args.output)
 
 if __name__ == "__main__":
     main()
@@ -23,6 +23,15 @@ def classify_level1(title: str) -> str:
         if re.search(p, s): return l
     return "educación secundaria o bachillerato"
 
+def education_hier(series, out_csv, root="Educación"):
+    vals = series.dropna().astype(str).drop_duplicates()
+    rows = []
+    for v in vals:
+        l1 = classify_level1(v)
+        rows.append({"level0": v, "level1": l1, "level2": L2.get(l1, "secundario"), "level3": root})
+
+    pd.DataFrame(rows, columns=["level0","level1","level2","level3"]).to_csv(out_csv, index=False)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--in",  dest="inp", required=True)
@@ -35,13 +44,7 @@ def main():
     if args.col not in df.columns:
         raise SystemExit(f"Columna '{args.col}' no encontrada en {args.inp}")
 
-    vals = df[args.col].dropna().astype(str).drop_duplicates()
-    rows = []
-    for v in vals:
-        l1 = classify_level1(v)
-        rows.append({"level0": v, "level1": l1, "level2": L2.get(l1, "secundario"), "level3": args.root})
-
-    pd.DataFrame(rows, columns=["level0","level1","level2","level3"]).to_csv(args.out, index=False)
+    education_hier(df[args.col], args.out, root=args.root)
 
 if __name__ == "__main__":
     main()
@@ -1,91 +1,35 @@
 #!/usr/bin/env python3
-import csv, argparse, os
+# CLI de hierarchies.localities: municipio/localidad → provincia → ccaa
+import argparse, os
 
-def norm(s):
-    return (s or "").strip().lower()
+from hierarchies import localities_hierarchy, load_index, write_table
+from hierarchies.localities import DEFAULT_FUZZY_RATIO
+from hierarchies.io import ENGINES, DEFAULT_ENGINE, DEFAULT_CHUNK_ROWS, MissingColumnError, unique_values, sniff_delimiter
 
-def sniff_reader(fh, sample_size=4096, fallback_delimiter=","):
-    sample = fh.read(sample_size)
-    fh.seek(0)
+def read_unique_values(csv_path, col, engine=DEFAULT_ENGINE, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # solo la columna pedida, en streaming por bloques
     try:
-        dialect = csv.Sniffer().sniff(sample, delimiters=[",",";","|","\t"])
-    except Exception:
-        class SimpleDialect(csv.excel):
-            delimiter = fallback_delimiter
-        dialect = SimpleDialect()
-    return dialect
-
-def read_unique_values(csv_path, col):
-    seen = {}
-    out  = []
-    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
-        dialect = sniff_reader(f)
-        r = csv.DictReader(f, dialect=dialect)
-        if col not in r.fieldnames:
-            raise ValueError(f"La columna '{col}' no existe en {csv_path}. Columnas: {r.fieldnames}")
-        for row in r:
-            v = (row[col] or "").strip()
-            if v and v not in seen:
-                seen[v] = True
-                out.append(v)
-    return out
-
-def read_dictionary(dict_csv):
-    """
-    Acepta cabeceras:
-      - municipio / localidad  (cualquiera de las dos)
-      - provincia
-      - ccaa
-    Delimitador detectado automáticamente (',' o ';', etc).
-    Devuelve dict: key=municipio(lower), value=(provincia, ccaa) con nombres originales.
-    """
-    with open(dict_csv, "r", encoding="utf-8-sig", newline="") as f:
-        dialect = sniff_reader(f)
-        r = csv.DictReader(f, dialect=dialect)
-
-        # Columnas esperadas (case-insensitive). Permitimos 'localidad' como alias de 'municipio'.
-        cols_lower = { (c or "").strip().lower(): c for c in r.fieldnames if c }
-        municipio_col = cols_lower.get("municipio") or cols_lower.get("localidad")
-        provincia_col = cols_lower.get("provincia")
-        ccaa_col      = cols_lower.get("ccaa")
-
-        if not (municipio_col and provincia_col and ccaa_col):
-            raise ValueError(
-                "El diccionario debe tener columnas municipio/localidad, provincia y ccaa.\n"
-                f"Encontradas: {r.fieldnames}\n"
-                "Ejemplos válidos de cabecera: "
-                "['municipio;provincia;ccaa'], ['localidad;provincia;ccaa;país'], ['municipio,provincia,ccaa']"
-            )
-
-        d = {}
-        for row in r:
-            mun  = (row[municipio_col] or "").strip()
-            prov = (row[provincia_col] or "").strip()
-            ccaa = (row[ccaa_col] or "").strip()
-            if not mun:
-                continue
-            d[norm(mun)] = (prov, ccaa)
-    return d
-
-def write_hierarchy(values, dictionary, out_path):
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    missing = []
-    with open(out_path, "w", encoding="utf-8", newline="") as f:
-        w = csv.writer(f)
-        # niveles: municipio -> provincia -> ccaa -> root
-        w.writerow(["level0","level1","level2","root"])
-        for mun in values:
-            key = norm(mun)
-            if key not in dictionary:
-                missing.append(mun)
-                continue
-            prov, ccaa = dictionary[key]
-            w.writerow([mun, prov, ccaa, "*"])
+        return unique_values(csv_path, col, sep=sniff_delimiter(csv_path), chunk_rows=chunk_rows, engine=engine)
+    except MissingColumnError as e:
+        raise ValueError(f"La columna '{col}' no existe en {csv_path}. Columnas: {e.header}")
+
+def write_hierarchy(values, dictionary, out_path, fuzzy_ratio=DEFAULT_FUZZY_RATIO):
+    if os.path.dirname(out_path):
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    resolved = {}
+    table, missing = localities_hierarchy(values, dictionary, fuzzy_ratio=fuzzy_ratio, resolved=resolved)
+    write_table(table, out_path)
+    for mun, (name, how) in resolved.items():
+        if how == "variant":
+            print(f"[INFO] '{mun}' → '{name}' (variante)")
+        else:
+            print(f"[WARN] '{mun}' → '{name}' (casado aproximado: revisa que sea el mismo municipio)")
     if missing:
         raise RuntimeError(
             "Faltan mapeos en el diccionario para los siguientes municipios/localidades:\n  - " +
             "\n  - ".join(missing)
         )
+    return len(table["level0"])
 
 def main():
     ap = argparse.ArgumentParser(
@@ -94,13 +38,18 @@ def main():
     ap.add_argument("--input",      required=True, help="CSV de datos")
     ap.add_argument("--col",        required=True, help="Nombre de la columna de municipio/localidad en el CSV de datos")
     ap.add_argument("--dictionary", required=True, help="CSV diccionario con columnas municipio/localidad,provincia,ccaa (delimitador auto)")
+    ap.add_argument("--index",      default=None, help="índice cacheado del diccionario (por defecto <dictionary>.idx.pkl; se rehace si cambia el CSV)")
+    ap.add_argument("--fuzzy-ratio", type=float, default=DEFAULT_FUZZY_RATIO,
+                    help="distancia de edición máxima del casado aproximado, como fracción de la longitud del nombre (p.ej. 0.2); "
+                         "por defecto 0 = solo exacto y variantes")
     ap.add_argument("--output",     required=True, help="Ruta del CSV de jerarquía")
+    ap.add_argument("--engine",     choices=ENGINES, default=DEFAULT_ENGINE, help="lector del CSV de datos (streaming por bloques)")
+    ap.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="filas por bloque de lectura")
     args = ap.parse_args()
 
-    uniques = read_unique_values(args.input, args.col)
-    uniques.sort()
-    dictionary = read_dictionary(args.dictionary)
-    write_hierarchy(uniques, dictionary, args.output)
+    uniques = read_unique_values(args.input, args.col, engine=args.engine, chunk_rows=args.chunk_rows)
+    dictionary = load_index(args.dictionary, args.index)
+    write_hierarchy(uniques, dictionary, args.output, fuzzy_ratio=args.fuzzy_ratio)
     print(f"OK: jerarquía localidades → {args.output} ({len(uniques)} hojas únicas)")
 
 if __name__ == "__main__":
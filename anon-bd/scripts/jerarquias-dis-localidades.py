@@ -4,17 +4,9 @@ import pandas as pd
 
 norm = lambda s: re.sub(r"\s+"," ","".join(c for c in unicodedata.normalize("NFKD",str(s).strip().lower()) if not unicodedata.combining(c)))
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--in",  dest="inp", required=True)           # dataset con columna de municipios
-    ap.add_argument("--col", dest="col", required=True)
-    ap.add_argument("--ref", dest="ref", required=True)           # CSV referencia municipio→provincia→ccaa
-    ap.add_argument("--out", dest="out", required=True)
-    ap.add_argument("--country", default="España")
-    args = ap.parse_args()
-
-    # referencia (autodetecta separador)
-    ref = pd.read_csv(args.ref, sep=None, engine="python", dtype=str, encoding="utf-8")
+def load_reference(ref_csv):
+    """Referencia municipio→provincia→ccaa (autodetecta separador): (mapa, col. provincia, col. ccaa)."""
+    ref = pd.read_csv(ref_csv, sep=None, engine="python", dtype=str, encoding="utf-8")
     ref.columns = [norm(c).replace(" ","_") for c in ref.columns]
     pick = lambda cols,cands: next((c for c in cands if c in cols), None)
 
@@ -26,13 +18,11 @@ def main():
 
     ref["_k"] = ref[c_m].map(norm)
     ref = ref.drop_duplicates("_k")
-    mp = ref.set_index("_k")[[c_p, c_c]].to_dict("index")
+    return ref.set_index("_k")[[c_p, c_c]].to_dict("index"), c_p, c_c
 
-    df = pd.read_csv(args.inp, dtype=str, encoding="utf-8")
-    if args.col not in df.columns:
-        raise SystemExit(f"Columna '{args.col}' no encontrada en {args.inp}")
-
-    vals = df[args.col].dropna().astype(str).drop_duplicates()
+def city_hier(series, out_csv, reference, country="España"):
+    mp, c_p, c_c = reference
+    vals = series.dropna().astype(str).drop_duplicates()
     rows = []
     for v in vals:
         hit = mp.get(norm(v), {})
@@ -40,10 +30,28 @@ def main():
             "level0": v,
             "level1": hit.get(c_p, "Desconocido"),
             "level2": hit.get(c_c, "Desconocido"),
-            "level3": args.country
+            "level3": country
         })
 
-    pd.DataFrame(rows, columns=["level0","level1","level2","level3"]).to_csv(args.out, index=False)
+    pd.DataFrame(rows, columns=["level0","level1","level2","level3"]).to_csv(out_csv, index=False)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in",  dest="inp", required=True)           # dataset con columna de municipios
+    ap.add_argument("--col", dest="col", required=True)
+    ap.add_argument("--ref", dest="ref", required=True)           # CSV referencia municipio→provincia→ccaa
+    ap.add_argument("--out", dest="out", required=True)
+    ap.add_argument("--country", default="España")
+    args = ap.parse_args()
+
+    # referencia (autodetecta separador)
+    reference = load_reference(args.ref)
+
+    df = pd.read_csv(args.inp, dtype=str, encoding="utf-8")
+    if args.col not in df.columns:
+        raise SystemExit(f"Columna '{args.col}' no encontrada en {args.inp}")
+
+    city_hier(df[args.col], args.out, reference, country=args.country)
 
 if __name__ == "__main__":
     main()
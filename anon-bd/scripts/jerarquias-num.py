@@ -34,6 +34,13 @@ def age_hier(series, out_csv, k=10, bins=12):
         rows.append({f"level{j}":row[j] for j in range(len(row))})
     pd.DataFrame(rows).to_csv(out_csv, index=False)
 
+def auto_bins(series, k, bins="auto"):
+    # bins: auto -> ~ 2 * floor(n/k), min 8, cap 30
+    if str(bins).lower()=="auto":
+        n_non_null = series.dropna().shape[0]
+        return min(30, max(8, 2 * (n_non_null // k)))
+    return int(bins)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--in",  dest="inp", required=True)
@@ -47,15 +54,7 @@ def main():
     if args.col not in df.columns:
         raise SystemExit(f"Columna '{args.col}' no encontrada en {args.inp}")
 
-    # bins: auto -> ~ 2 * floor(n/k), min 8, cap 30
-    if str(args.bins).lower()=="auto":
-        n_non_null = df[args.col].dropna().shape[0]
-        bins = max(8, 2 * (n_non_null // args.k))
-        bins = min(30, bins)
-    else:
-        bins = int(args.bins)
-
-    age_hier(df[args.col], args.out, k=args.k, bins=bins)
+    age_hier(df[args.col], args.out, k=args.k, bins=auto_bins(df[args.col], args.k, args.bins))
 
 if __name__ == "__main__":
     main()
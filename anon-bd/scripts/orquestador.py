@@ -1,15 +1,60 @@
 #!/usr/bin/env python3
-import os, json, subprocess, sys, yaml
+"""
+Genera las jerarquías de las columnas de config.yaml y el manifest.json.
+
+Todo en un proceso: el dataset se lee UNA vez (solo las columnas de config.yaml)
+y los generadores jerarquias-*.py se llaman como funciones (se importan con
+importlib desde este directorio; los nombres llevan guiones). Con --workers N
+cada columna se genera en un proceso de un pool.
+"""
+import os, json, sys, argparse, importlib.util, yaml
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# tipo de columna → (script generador, CSV de salida)
+GENERATORS = {
+    "age":             ("jerarquias-num.py",             "age_hierarchy.csv"),
+    "city":            ("jerarquias-dis-localidades.py", "city_hierarchy.csv"),
+    "postal_code":     ("jerarquias-dis-cp.py",          "cp_hierarchy.csv"),
+    "education_title": ("jerarquias-dis-educacion.py",   "education_hierarchy.csv"),
+}
+
+_modules = {}
 
 def ensuredir(d): os.makedirs(d, exist_ok=True)
-def run(cmd):
-    print("→", " ".join(cmd))
-    r = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    print(r.stdout)
-    if r.returncode != 0: sys.exit(r.returncode)
+
+def load_generator(script):
+    if script not in _modules:
+        name = os.path.splitext(script)[0].replace("-", "_")
+        spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, script))
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        _modules[script] = mod
+    return _modules[script]
+
+def build(typ, series, out, params):
+    """Genera la jerarquía de una columna (ya leída) con el generador de su tipo."""
+    gen = load_generator(GENERATORS[typ][0])
+    if typ == "age":
+        k = int(params.get("k", 10))
+        gen.age_hier(series, out, k=k, bins=gen.auto_bins(series, k, params.get("age_bins", "auto")))
+    elif typ == "city":
+        gen.city_hier(series, out, gen.load_reference(params["city_reference_csv"]))
+    elif typ == "postal_code":
+        gen.cp_hier(series, out)
+    elif typ == "education_title":
+        gen.education_hier(series, out)
+    return out
 
 def main():
-    cfg = yaml.safe_load(open("config.yaml", encoding="utf-8"))
+    ap = argparse.ArgumentParser(description="Genera las jerarquías ARX de config.yaml y su manifest.json.")
+    ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--workers", type=int, default=1, help="procesos para generar columnas en paralelo (1 = en este proceso)")
+    args = ap.parse_args()
+
+    cfg = yaml.safe_load(open(args.config, encoding="utf-8"))
     dataset   = cfg["dataset"]
     out_dir   = cfg.get("output_dir", "hierarchies")
     params    = cfg.get("params", {})
@@ -17,41 +62,38 @@ def main():
     roles     = cfg.get("roles", {})
     ensuredir(out_dir)
 
-    k        = str(params.get("k", 10))
-    age_bins = str(params.get("age_bins", "auto"))
-    city_ref = params.get("city_reference_csv")
-
-    manifest = {"dataset": dataset, "output_dir": out_dir, "attributes": []}
-
+    jobs = []
     for col, typ in columns.items():
-        if typ == "age":
-            out = os.path.join(out_dir, "age_hierarchy.csv")
-            run([sys.executable, "jerarquias-num.py",
-                 "--in", dataset, "--col", col, "--k", k, "--bins", age_bins, "--out", out])
-            manifest["attributes"].append({"column": col, "type": typ, "hierarchy_csv": out, "role": roles.get(col, "QI")})
-
-        elif typ == "city":
-            if not city_ref: sys.exit("Falta params.city_reference_csv en config.yaml")
-            out = os.path.join(out_dir, "city_hierarchy.csv")
-            run([sys.executable, "jerarquias-dis-localidades.py",
-                 "--in", dataset, "--col", col, "--ref", city_ref, "--out", out])
-            manifest["attributes"].append({"column": col, "type": typ, "hierarchy_csv": out, "role": roles.get(col, "QI")})
-
-        elif typ == "postal_code":
-            out = os.path.join(out_dir, "cp_hierarchy.csv")
-            run([sys.executable, "jerarquias-dis-cp.py",
-                 "--in", dataset, "--col", col, "--out", out])
-            manifest["attributes"].append({"column": col, "type": typ, "hierarchy_csv": out, "role": roles.get(col, "QI")})
-
-        elif typ == "education_title":
-            out = os.path.join(out_dir, "education_hierarchy.csv")
-            run([sys.executable, "jerarquias-dis-educacion.py",
-                 "--in", dataset, "--col", col, "--out", out])
-            manifest["attributes"].append({"column": col, "type": typ, "hierarchy_csv": out, "role": roles.get(col, "QI")})
-
-        else:
+        if typ not in GENERATORS:
             print(f"[WARN] Tipo desconocido '{typ}' para '{col}', se ignora.")
+            continue
+        if typ == "city" and not params.get("city_reference_csv"):
+            sys.exit("Falta params.city_reference_csv en config.yaml")
+        jobs.append((col, typ, os.path.join(out_dir, GENERATORS[typ][1])))
+
+    # una sola lectura del dataset, solo con las columnas que se van a generalizar
+    header = list(pd.read_csv(dataset, dtype=str, nrows=0, encoding="utf-8").columns)
+    for col, _, _ in jobs:
+        if col not in header:
+            sys.exit(f"Columna '{col}' no encontrada en {dataset}")
+    df = pd.read_csv(dataset, dtype=str, usecols=list(dict.fromkeys(col for col, _, _ in jobs)), encoding="utf-8")
+    print(f"→ {dataset}: {len(df)} filas, columnas {list(df.columns)}")
+
+    if args.workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(jobs))) as pool:
+            futs = [pool.submit(build, typ, df[col], out, params) for col, typ, out in jobs]
+            for (col, typ, out), fut in zip(jobs, futs):
+                fut.result()
+                print(f"→ {col} ({typ}) → {out}")
+    else:
+        for col, typ, out in jobs:
+            build(typ, df[col], out, params)
+            print(f"→ {col} ({typ}) → {out}")
 
+    manifest = {"dataset": dataset, "output_dir": out_dir, "attributes": [
+        {"column": col, "type": typ, "hierarchy_csv": out, "role": roles.get(col, "QI")}
+        for col, typ, out in jobs
+    ]}
     with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
         json.dump(manifest, f, ensure_ascii=False, indent=2)
     print("\n✓ Jerarquías generadas en:", out_dir)
@@ -1,13 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import argparse, re, json, time, os, sys
+import argparse, re, json, os, sys
 import mysql.connector
 import requests
 from dotenv import load_dotenv
 
-from llm_client import call_ollama  # <<< NUEVO: usamos el cliente LLM compartido
-from rag_client import RAGClient 
+from llm_client import OllamaClient, summarize_stats  # cliente LLM compartido (sesión persistente)
+from rag_client import RAGClient, RETRIEVAL_MODES
+from mysql_profiler import profile_tables, format_distinct, approx_columns_report
+from llm_pool import TokenBucket, rate_from_args, run_ordered
+from column_groups import split_columns, group_note, group_label
+from constrained_output import items_schema, RATIONALE_MAX_CHARS
+from preclassifier import PreClassifier, decided_note, merge_table_items
+from pii_detector import mask_value  # enmascarado de muestras (una pasada + checksums)
+from pii_scan import scan_tables, scan_report, format_rates, SCAN_STRATEGIES, SCAN_MAX_ROWS
 
 # --------- cargar .env ---------
 load_dotenv()
@@ -30,12 +37,25 @@ ENV_NAME = env("DB_NAME", "formacion_empleo")
 
 ENV_OLLAMA_URL = env("OLLAMA_URL", "http://localhost:11434/api/generate")
 ENV_MODEL      = env("OLLAMA_MODEL", "llama3.2:3b-instruct-q4_K_M")
+ENV_OLLAMA_RETRIES = env("OLLAMA_RETRIES", 2, int)
 
 ENV_TABLE_LIKE = env("TABLE_LIKE", "%")
 ENV_SAMPLE_ROWS= env("SAMPLE_ROWS", 5, int)
 ENV_BATCH_SIZE = env("BATCH_SIZE", 20, int)   # ya no se usa para trocear globalmente; lo mantengo por compat
 ENV_SLEEP_S    = env("SLEEP_S", 0.3, float)
+ENV_WORKERS    = env("LLM_WORKERS", 1, int)
+ENV_RATE_LIMIT = env("RATE_LIMIT", None, float)
 ENV_OUT_PRED   = env("OUT_PREDICTIONS", "predictions.json")
+ENV_RAG_RETRIEVAL = env("RAG_RETRIEVAL", "dense")
+ENV_RAG_MODE   = env("RAG_MODE", "table")
+ENV_CHUNK_COLUMNS = env("CHUNK_COLUMNS", 0, int)
+ENV_CONSTRAINED = env("CONSTRAINED_OUTPUT", 0, int)
+ENV_PRECLASSIFY = env("PRECLASSIFY", 0, int)
+ENV_PRECLASSIFY_RULES = env("PRECLASSIFY_RULES", None)
+ENV_SCAN_ROWS  = env("SCAN_ROWS", 0, int)
+ENV_SCAN_STRATEGY = env("SCAN_STRATEGY", "stratified")
+ENV_SCAN_MAX_ROWS = env("SCAN_MAX_ROWS", SCAN_MAX_ROWS, int)
+ENV_RATIONALE_MAX = env("RATIONALE_MAX_CHARS", RATIONALE_MAX_CHARS, int)
 
 # ---------- helpers ----------
 def map_mysql_type(dt: str, column_type: str) -> str:
@@ -59,22 +79,13 @@ def map_mysql_type(dt: str, column_type: str) -> str:
         return "other"
     return "other"
 
-_PATTERNS = [
-    ("IBAN", re.compile(r"[A-Z]{2}\d{2}[A-Z0-9]{10,30}", re.I)),
-    ("DNI", re.compile(r"\b\d{7,8}[A-Z]\b", re.I)),
-    ("NIE", re.compile(r"\b[XYZ]\d{7}[A-Z]\b", re.I)),
-    ("EMAIL", re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+", re.I)),
-    ("TEL", re.compile(r"\+?\d[\d\s\-\(\)]{7,}\d")),
-    ("TARJETA", re.compile(r"\b(?:\d[ -]*?){13,19}\b")),
-]
-def mask_value(v):
-    s = str(v)
-    for label, rx in _PATTERNS:
-        if rx.search(s):
-            return f"<MASK:{label}>"
-    if len(s) > 64:
-        return s[:61] + "..."
-    return s
+
+def format_llm_stats(res):
+    ttft = f"{res.ttft_s:.2f}s" if res.ttft_s is not None else "-"
+    retries = (f" reintentos={res.attempts - 1} (fallidos={res.retry_s:.2f}s backoff={res.backoff_s:.2f}s)"
+               if res.attempts > 1 else "")
+    return (f"latencia={res.latency_s:.2f}s ttft={ttft} "
+            f"tokens_prompt={res.prompt_eval_count} tokens_salida={res.eval_count}{retries}")
 
 
 def build_retrieval_query(table_name, info):
@@ -92,6 +103,18 @@ def build_retrieval_query(table_name, info):
     )
 
 
+def build_column_queries(table_name, info):
+    """
+    Una query corta por columna (para --rag_mode columns): en tablas anchas la
+    query única de build_retrieval_query supera la ventana del modelo de
+    embeddings y las últimas columnas no influyen en la recuperación.
+    """
+    return [
+        f"Columna {c['name']} ({c['llm_type']}, mysql={c['mysql_column_type']}) de la tabla {table_name}"
+        for c in info["columns"]
+    ]
+
+
 def build_context_block(chunks, max_chunks=3, max_chars_per_chunk=1200):
     """
     Convierte los chunks recuperados del RAG en un bloque de texto para el prompt,
@@ -123,11 +146,51 @@ def main():
     ap.add_argument("--batch_size", type=int, default=ENV_BATCH_SIZE, help="(compat) no se usa para mezclar tablas")
     ap.add_argument("--model", default=ENV_MODEL)
     ap.add_argument("--ollama_url", default=ENV_OLLAMA_URL)
+    ap.add_argument("--ollama_stream", action="store_true", help="usar streaming con Ollama (mide time-to-first-token)")
+    ap.add_argument("--ollama_retries", type=int, default=ENV_OLLAMA_RETRIES, help="reintentos con backoff ante errores transitorios")
     ap.add_argument("--out_predictions", default=ENV_OUT_PRED)
-    ap.add_argument("--sleep_s", type=float, default=ENV_SLEEP_S, help="pausa entre peticiones")
+    ap.add_argument("--sleep_s", type=float, default=ENV_SLEEP_S,
+                    help="(compat) pausa entre peticiones; si no se da --rate_limit equivale a 1/sleep_s peticiones/s")
+    ap.add_argument("--workers", type=int, default=ENV_WORKERS, help="nº máximo de peticiones al LLM en vuelo")
+    ap.add_argument("--rate_limit", type=float, default=ENV_RATE_LIMIT,
+                    help="peticiones/segundo al LLM (token bucket); 0 = sin límite")
     ap.add_argument("--use_rag", action="store_true", help="activar RAG para enriquecer el prompt con contexto")
+    ap.add_argument("--rag_retrieval", choices=RETRIEVAL_MODES, default=ENV_RAG_RETRIEVAL,
+                    help="dense: solo embeddings (FAISS); hybrid: FAISS + BM25 fusionados con RRF")
+    ap.add_argument("--rag_mode", choices=["table", "columns"], default=ENV_RAG_MODE,
+                    help="table: una query por tabla; columns: una query por columna, chunks ordenados por cobertura")
+    ap.add_argument("--approx_stats", action="store_true",
+                    help="estimar distinct/nulls con HyperLogLog en cliente (sin COUNT(DISTINCT) en MySQL)")
+    ap.add_argument("--approx_max_rows", type=int, default=0,
+                    help="con --approx_stats, máximo de filas leídas por tabla: las tablas más grandes se muestrean por "
+                         "estratos de la PK entera y su distinct es una cota inferior (≥). 0 = tabla completa en streaming, "
+                         "hasheando cada celda en Python: más lento que el COUNT(DISTINCT) de MySQL")
+    ap.add_argument("--scan_rows", type=int, default=ENV_SCAN_ROWS,
+                    help="filas por tabla que se escanean en busca de PII (tasas email_like=0.97… en la evidencia "
+                         "y muestras sacadas de esa muestra); 0 = sin escaneo")
+    ap.add_argument("--scan_strategy", choices=SCAN_STRATEGIES, default=ENV_SCAN_STRATEGY,
+                    help="stratified: estratos por rango de la PK entera, solo viajan ~N filas (sin PK entera "
+                         "simple → reservoir); reservoir: N filas al azar de un recorrido COMPLETO de la tabla "
+                         "(todas las filas viajan a Python, hasta --scan_max_rows); first: las N primeras filas")
+    ap.add_argument("--scan_max_rows", type=int, default=ENV_SCAN_MAX_ROWS,
+                    help="filas que lee como máximo el muestreo reservoir (LIMIT en el servidor); en tablas más "
+                         "grandes la muestra sale de las primeras filas y el informe lo marca (0 = tabla completa)")
+    ap.add_argument("--chunk_columns", type=int, default=ENV_CHUNK_COLUMNS,
+                    help="máximo de columnas por petición: las tablas más anchas se clasifican por bloques "
+                         "(en paralelo) y los items se cosen en orden (0 = sin límite)")
+    ap.add_argument("--preclassify", action="store_true", default=bool(ENV_PRECLASSIFY),
+                    help="clasificar por reglas (ejemplos del corpus RAG, --preclassify_rules, PII en las "
+                         "muestras, FKs) las columnas obvias y enviar al LLM solo las ambiguas")
+    ap.add_argument("--preclassify_rules", default=ENV_PRECLASSIFY_RULES,
+                    help="JSON {categoría: [nombres de columna]} con reglas por nombre adicionales para "
+                         "--preclassify")
+    ap.add_argument("--constrained_output", action="store_true", default=bool(ENV_CONSTRAINED),
+                    help="restringir la respuesta de Ollama al JSON schema de items ('format'): nombres de "
+                         "columna y categorías como enum, un item por columna y rationale acotado")
+    ap.add_argument("--rationale_max_chars", type=int, default=ENV_RATIONALE_MAX,
+                    help="con --constrained_output, longitud máxima del rationale de cada item")
     args = ap.parse_args()
-    rag_client = RAGClient() if args.use_rag else None
+    rag_client = RAGClient(retrieval=args.rag_retrieval) if args.use_rag else None
 
 
     print(f"[INFO] Conectando a MySQL {args.host}:{args.port} DB={args.database} con usuario '{args.user}'…")
@@ -177,60 +240,18 @@ def main():
             "ref_column": r["REFERENCED_COLUMN_NAME"],
         })
 
-    # 2) Agrupar por tabla, con stats + muestras
-    tables = {}
-    for c in cols:
-        t   = c.get("table_name",  c.get("TABLE_NAME"))
-        col = c.get("column_name", c.get("COLUMN_NAME"))
-        dt  = c.get("data_type",   c.get("DATA_TYPE"))
-        ct  = c.get("column_type", c.get("COLUMN_TYPE"))
-        nul = c.get("is_nullable", c.get("IS_NULLABLE"))
-
-        # contar filas y nulls/distinct para la columna
-        cur.execute(f"SELECT COUNT(*) AS n, SUM(CASE WHEN `{col}` IS NULL THEN 1 ELSE 0 END) AS n_null FROM `{t}`")
-        r = cur.fetchone() or {}
-        n_all = r.get("n", 0) or 0
-        n_null = r.get("n_null", 0) or 0
-
-        try:
-            cur.execute(f"SELECT COUNT(DISTINCT `{col}`) AS n_dist FROM `{t}`")
-            r2 = cur.fetchone() or {}
-            n_dist = r2.get("n_dist", 0) or 0
-        except Exception:
-            n_dist = None
-
-        # muestras (non-null)
-        samples = []
-        try:
-            cur.execute(f"SELECT `{col}` as v FROM `{t}` WHERE `{col}` IS NOT NULL LIMIT %s", (args.sample_rows,))
-            samples = [mask_value(rr["v"]) for rr in cur.fetchall()]
-        except Exception:
-            pass
-
-        llm_type = map_mysql_type(dt, ct)
-
-        tables.setdefault(t, {"row_count": None, "columns": []})
-        tables[t]["columns"].append({
-            "name": col,
-            "mysql_data_type": dt,
-            "mysql_column_type": ct,
-            "llm_type": llm_type,
-            "is_nullable": nul,
-            "n_all": n_all,
-            "n_null": n_null,
-            "n_distinct": n_dist,
-            "samples": samples,
-            "is_pk": (col in pk_map.get(t, set())),
-            "is_fk": any(fk["column"] == col for fk in fk_map.get(t, []))
-        })
-
-    # filas por tabla
-    for t in tables.keys():
-        try:
-            cur.execute(f"SELECT COUNT(*) AS n FROM `{t}`")
-            tables[t]["row_count"] = (cur.fetchone() or {}).get("n", 0)
-        except Exception:
-            tables[t]["row_count"] = None
+    # 2) Agrupar por tabla, con stats + muestras (una consulta agregada por tabla)
+    tables = profile_tables(
+        cur, cols, pk_map, fk_map,
+        sample_rows=args.sample_rows,
+        mask_fn=mask_value,
+        type_fn=map_mysql_type,
+        approx=args.approx_stats,
+        approx_max_rows=args.approx_max_rows,
+    )
+    if args.scan_rows > 0:
+        scan_tables(cur, tables, args.scan_rows, strategy=args.scan_strategy,
+                    sample_rows=args.sample_rows, mask_fn=mask_value, max_rows=args.scan_max_rows)
 
     cur.close(); conn.close()
 
@@ -257,55 +278,110 @@ Devuelve SOLO JSON con:
 
 """
 
-    all_items = []
-
+    # 3a) construir los prompts (secuencial: el RAG se consulta desde un solo hilo);
+    # con --chunk_columns las tablas anchas se parten en bloques (ver column_groups.py)
+    # y con --preclassify solo van al LLM las columnas que las reglas no resuelven
+    preclass = PreClassifier.from_sources(args.preclassify_rules or None) if args.preclassify else None
+    decided = {}
+    jobs = []
     for t, info in tables.items():
-        lines = [SYSTEM_PROMPT]
+        pending_cols = info["columns"]
+        if preclass is not None:
+            decided[t], pending_cols = preclass.split(t, info["columns"])
+        groups = split_columns(pending_cols, max_cols=args.chunk_columns)
+        if not groups:
+            continue  # tabla resuelta entera por reglas: ni RAG ni LLM
 
-        # --- RAG: recuperar contexto y añadirlo al prompt, si está activado ---
+        head = [SYSTEM_PROMPT]
+
+        # --- RAG: recuperar contexto y añadirlo al prompt, si está activado (uno por tabla) ---
         if rag_client is not None:
-            query = build_retrieval_query(t, info)
-            ctx_chunks = rag_client.retrieve_context(query, k=3)
+            if args.rag_mode == "columns":
+                ctx_chunks = rag_client.retrieve_columns_context(build_column_queries(t, info), k=3)
+            else:
+                ctx_chunks = rag_client.retrieve_context(build_retrieval_query(t, info), k=3)
             context_block = build_context_block(ctx_chunks, max_chunks=3, max_chars_per_chunk=1200)
 
-            lines.append("Tienes acceso al siguiente CONTEXTO relevante sobre anonimización y clasificación de columnas:")
-            lines.append("[CONTEXTO]")
-            lines.append(context_block)
-
-        # --- resto de prompt, como antes ---
-        lines.append(f"Tabla: {t} (filas ~ {info['row_count']})")
-        # esquema resumido con marcas
-        lines.append("Esquema:")
-        for c in info["columns"]:
-            marks = []
-            if c["is_pk"]: marks.append("PK")
-            if c["is_fk"]: marks.append("FK")
-            mark = f" [{' ,'.join(marks)}]" if marks else ""
-            lines.append(f"- {c['name']} ({c['llm_type']} | {c['mysql_column_type']}){mark}")
-
-        # evidencia por columna
-        lines.append("\nEvidencia por columna:")
-        for c in info["columns"]:
-            null_pct = round((c['n_null']/c['n_all']*100), 2) if c['n_all'] else 0
-            lines.append(f"{c['name']}: distinct={c['n_distinct']}, null_pct={null_pct}, muestras={json.dumps(c['samples'], ensure_ascii=False)}")
-
-        prompt = "\n".join(lines)
+            head.append("Tienes acceso al siguiente CONTEXTO relevante sobre anonimización y clasificación de columnas:")
+            head.append("[CONTEXTO]")
+            head.append(context_block)
+
+        for gi, (start, stop) in enumerate(groups):
+            columns = pending_cols[start:stop]
+            lines = list(head)
+
+            # --- resto de prompt, como antes ---
+            lines.append(f"Tabla: {t} (filas ~ {info['row_count']})")
+            lines.extend(group_note(pending_cols, start, stop, len(groups), gi))
+            lines.extend(decided_note(decided.get(t)))
+            # esquema resumido con marcas
+            lines.append("Esquema:")
+            for c in columns:
+                marks = []
+                if c["is_pk"]: marks.append("PK")
+                if c["is_fk"]: marks.append("FK")
+                mark = f" [{' ,'.join(marks)}]" if marks else ""
+                lines.append(f"- {c['name']} ({c['llm_type']} | {c['mysql_column_type']}){mark}")
+
+            # evidencia por columna
+            lines.append("\nEvidencia por columna:")
+            for c in columns:
+                null_pct = round((c['n_null']/c['n_all']*100), 2) if c['n_all'] else 0
+                pii = f", pii={format_rates(c['pii_rates'])}" if c.get("pii_rates") else ""
+                lines.append(f"{c['name']}: distinct={format_distinct(c)}, null_pct={null_pct}{pii}, muestras={json.dumps(c['samples'], ensure_ascii=False)}")
+
+            schema = None
+            if args.constrained_output:
+                schema = items_schema(len(columns), rationale_max=args.rationale_max_chars,
+                                      names=[c["name"] for c in columns])
+            jobs.append((t, group_label(t, len(groups), gi), "\n".join(lines), schema))
+
+    if len(jobs) > len(tables):
+        print(f"[INFO] Tablas anchas por bloques: {len(jobs)} peticiones para {len(tables)} tablas.")
+    if preclass is not None:
+        calls_without = sum(len(split_columns(info["columns"], max_cols=args.chunk_columns)) for info in tables.values())
+        preclass_report = preclass.summary(len(jobs), calls_without)
+        print(f"[INFO] Preclasificador: {preclass_report['preclassified']}/{preclass_report['columns']} columnas "
+              f"por reglas {preclass_report['by_rule']}; {preclass_report['llm_calls_avoided']} llamadas al LLM evitadas.")
+
+    # 3b) llamadas a Ollama concurrentes (máx. --workers en vuelo, ritmo por token bucket)
+    bucket = TokenBucket(rate_from_args(args.rate_limit, args.sleep_s), capacity=args.workers)
+    ollama = OllamaClient(
+        args.ollama_url, model=args.model,
+        stream=args.ollama_stream, retries=args.ollama_retries, pool_size=args.workers,
+    )
 
-        try:
-            print(prompt)
-            print("AQUI TERMINA EL PROMPT")
-            txt = call_ollama(prompt, model=args.model, ollama_url=args.ollama_url).strip()
-            print("AQUI EMPIEZA LA RESPUESTA")
-            print(txt)
-        except requests.exceptions.ConnectionError:
+    def classify(job):
+        _, _, prompt, schema = job
+        return ollama.generate(prompt, format=schema)
+
+    results = run_ordered(
+        classify, jobs,
+        max_workers=args.workers,
+        bucket=bucket,
+        fatal=(requests.exceptions.ConnectionError,),
+    )
+
+    # 3c) parseo y recolección en el orden de las tablas y de sus bloques (salida determinista)
+    llm_items = {t: [] for t in tables}
+    llm_stats = {}
+    for (t, label, prompt, _), (res, err) in zip(jobs, results):
+        print(prompt)
+        print("AQUI TERMINA EL PROMPT")
+        if isinstance(err, requests.exceptions.ConnectionError):
             print(f"[ERROR] No puedo conectar con Ollama en {args.ollama_url}. ¿Has ejecutado 'ollama serve' o levantado el contenedor?")
             sys.exit(2)
-        except requests.exceptions.RequestException as e:
-            print(f"[WARN] Tabla {t}: fallo llamando a Ollama: {e}")
+        elif isinstance(err, requests.exceptions.RequestException):
+            print(f"[WARN] Tabla {label}: fallo llamando a Ollama: {err}")
             continue
-        except Exception as e:
-            print(f"[WARN] Tabla {t}: error inesperado llamando a Ollama: {e}")
+        elif err is not None:
+            print(f"[WARN] Tabla {label}: error inesperado llamando a Ollama: {err}")
             continue
+        txt = res.text.strip()
+        llm_stats[label] = res.stats()
+        print("AQUI EMPIEZA LA RESPUESTA")
+        print(txt)
+        print(f"[STATS] Tabla {label}: {format_llm_stats(res)}")
 
         # parseo robusto
         items = []
@@ -323,7 +399,7 @@ Devuelve SOLO JSON con:
 
         # recolectar
         for it in items:
-            all_items.append({
+            llm_items[t].append({
                 "table": t,
                 "name": it.get("name",""),
                 "category": it.get("category",""),
@@ -331,11 +407,34 @@ Devuelve SOLO JSON con:
                 "confidence": it.get("confidence", None)
             })
 
-        time.sleep(args.sleep_s)
+    # preclasificadas + respuestas del LLM, en el orden de las columnas
+    all_items = [
+        it for t, info in tables.items()
+        for it in merge_table_items(info["columns"], decided.get(t), llm_items[t])
+    ]
 
     # 4) escribir predictions.json
+    ollama.close()
+    out = {"items": all_items}
+    out["llm_stats"] = {"summary": summarize_stats([r for r, _ in results]), "tables": llm_stats}
+    if preclass is not None:
+        out["preclassifier"] = preclass_report
+    print(f"[INFO] LLM: {out['llm_stats']['summary']}")
+    if args.approx_stats:
+        # informe de qué columnas usan estadísticas estimadas
+        approx_cols = approx_columns_report(tables)
+        out["profiling"] = {"approx_stats": True, "approx_columns": approx_cols}
+        print(f"[INFO] {len(approx_cols)} columnas con distinct/nulls estimados (HyperLogLog).")
+    if args.scan_rows > 0:
+        scans = scan_report(tables)
+        out.setdefault("profiling", {})["pii_scan"] = scans
+        n_pii = sum(len(r["columns"]) for r in scans)
+        print(f"[INFO] Escaneo de PII ({args.scan_strategy}, {args.scan_rows} filas/tabla): {n_pii} columnas con PII detectada.")
+        capped = [r["table"] for r in scans if r.get("capped")]
+        if capped:
+            print(f"[WARN] Escaneo reservoir limitado a las primeras {args.scan_max_rows} filas en: {', '.join(capped)}")
     with open(args.out_predictions, "w", encoding="utf-8") as f:
-        json.dump({"items": all_items}, f, ensure_ascii=False, indent=2)
+        json.dump(out, f, ensure_ascii=False, indent=2)
 
     print(f"[OK] Generado {args.out_predictions} con {len(all_items)} items.")
 
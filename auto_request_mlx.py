@@ -1,18 +1,26 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import argparse, re, json, time, os, sys, subprocess
+import argparse, re, json, time, os, sys
 import mysql.connector
 import requests
 from dotenv import load_dotenv
 
-from rag_client import RAGClient  # seguimos usando el RAG
-
-# Opcional: si quieres seguir usando el modelo base con Ollama
-try:
-    from llm_client import call_ollama
-except ImportError:
-    call_ollama = None
+from rag_client import RAGClient, RETRIEVAL_MODES  # seguimos usando el RAG
+from mysql_profiler import profile_tables, format_distinct, approx_columns_report
+from llm_pool import TokenBucket, rate_from_args, run_ordered
+from mlx_backend import get_backend
+from prompt_budget import TokenCounter, assemble, format_report, format_samples
+from column_groups import split_columns, group_note, group_label
+from constrained_output import items_schema, RATIONALE_MAX_CHARS
+from preclassifier import PreClassifier, decided_note, merge_table_items
+from pii_detector import mask_value  # enmascarado de muestras (una pasada + checksums)
+from pii_scan import scan_tables, scan_report, format_rates, SCAN_STRATEGIES, SCAN_MAX_ROWS
+from llm_cache import LLMCache, CACHE_KEY_MODES, prompt_key, schema_key
+from schema_diff import schema_from_columns, load_previous, diff_schemas, merge_items
+
+# Para seguir usando el modelo base con Ollama (y las métricas por llamada)
+from llm_client import OllamaClient, LLMResult, summarize_stats
 
 # --------- cargar .env ---------
 load_dotenv()
@@ -35,12 +43,32 @@ ENV_NAME = env("DB_NAME", "formacion_empleo")
 
 ENV_OLLAMA_URL = env("OLLAMA_URL", "http://localhost:11434/api/generate")
 ENV_MODEL      = env("OLLAMA_MODEL", "llama3.2:3b-instruct-q4_K_M")
+ENV_OLLAMA_RETRIES = env("OLLAMA_RETRIES", 2, int)
 
 ENV_TABLE_LIKE = env("TABLE_LIKE", "%")
 ENV_SAMPLE_ROWS= env("SAMPLE_ROWS", 5, int)
 ENV_BATCH_SIZE = env("BATCH_SIZE", 20, int)   # ya no se usa para trocear globalmente; lo mantengo por compat
 ENV_SLEEP_S    = env("SLEEP_S", 0.3, float)
+ENV_WORKERS    = env("LLM_WORKERS", 1, int)
+ENV_RATE_LIMIT = env("RATE_LIMIT", None, float)
 ENV_OUT_PRED   = env("OUT_PREDICTIONS", "predictions.json")
+ENV_RAG_RETRIEVAL = env("RAG_RETRIEVAL", "dense")
+ENV_RAG_MODE   = env("RAG_MODE", "table")
+ENV_CACHE_PATH = env("LLM_CACHE_PATH", None)
+ENV_MAX_PROMPT_TOKENS = env("MAX_PROMPT_TOKENS", 0, int)
+ENV_TOKENIZER  = env("PROMPT_TOKENIZER", None)
+ENV_CHUNK_COLUMNS = env("CHUNK_COLUMNS", 0, int)
+ENV_CONSTRAINED = env("CONSTRAINED_OUTPUT", 0, int)
+ENV_PRECLASSIFY = env("PRECLASSIFY", 0, int)
+ENV_PRECLASSIFY_RULES = env("PRECLASSIFY_RULES", None)
+ENV_SCAN_ROWS  = env("SCAN_ROWS", 0, int)
+ENV_SCAN_STRATEGY = env("SCAN_STRATEGY", "stratified")
+ENV_SCAN_MAX_ROWS = env("SCAN_MAX_ROWS", SCAN_MAX_ROWS, int)
+ENV_RATIONALE_MAX = env("RATIONALE_MAX_CHARS", RATIONALE_MAX_CHARS, int)
+
+# tokens del prompt que no son system prompt ni columnas (cabecera, instrucción de nº
+# de items, nota del bloque); se descuentan del presupuesto al trocear tablas anchas
+PROMPT_OVERHEAD_TOKENS = 160
 
 # ---------- helpers ----------
 def map_mysql_type(dt: str, column_type: str) -> str:
@@ -64,22 +92,13 @@ def map_mysql_type(dt: str, column_type: str) -> str:
         return "other"
     return "other"
 
-_PATTERNS = [
-    ("IBAN", re.compile(r"[A-Z]{2}\d{2}[A-Z0-9]{10,30}", re.I)),
-    ("DNI", re.compile(r"\b\d{7,8}[A-Z]\b", re.I)),
-    ("NIE", re.compile(r"\b[XYZ]\d{7}[A-Z]\b", re.I)),
-    ("EMAIL", re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+", re.I)),
-    ("TEL", re.compile(r"\+?\d[\d\s\-\(\)]{7,}\d")),
-    ("TARJETA", re.compile(r"\b(?:\d[ -]*?){13,19}\b")),
-]
-def mask_value(v):
-    s = str(v)
-    for label, rx in _PATTERNS:
-        if rx.search(s):
-            return f"<MASK:{label}>"
-    if len(s) > 64:
-        return s[:61] + "..."
-    return s
+
+def format_llm_stats(res):
+    ttft = f"{res.ttft_s:.2f}s" if res.ttft_s is not None else "-"
+    retries = (f" reintentos={res.attempts - 1} (fallidos={res.retry_s:.2f}s backoff={res.backoff_s:.2f}s)"
+               if res.attempts > 1 else "")
+    return (f"latencia={res.latency_s:.2f}s ttft={ttft} "
+            f"tokens_prompt={res.prompt_eval_count} tokens_salida={res.eval_count}{retries}")
 
 
 def build_retrieval_query(table_name, info):
@@ -97,44 +116,118 @@ def build_retrieval_query(table_name, info):
     )
 
 
-def build_context_block(chunks, max_chunks=3, max_chars_per_chunk=1200):
+def build_column_queries(table_name, info):
     """
-    Convierte los chunks recuperados del RAG en un bloque de texto para el prompt,
-    recortando para que no se dispare el tamaño.
+    Una query corta por columna (para --rag_mode columns): en tablas anchas la
+    query única de build_retrieval_query supera la ventana del modelo de
+    embeddings y las últimas columnas no influyen en la recuperación.
+    """
+    return [
+        f"Columna {c['name']} ({c['llm_type']}, mysql={c['mysql_column_type']}) de la tabla {table_name}"
+        for c in info["columns"]
+    ]
+
+
+def context_blocks(chunks, max_chunks=3, max_chars_per_chunk=1200):
     """
-    lines = []
+    Chunks del RAG como bloques (cabecera, texto) para prompt_budget.assemble.
+    Con max_chars_per_chunk=None no se recorta por caracteres (lo hace el
+    presupuesto de tokens). Cada bloque va seguido de una línea en blanco.
+    """
+    blocks = []
     for i, ch in enumerate(chunks[:max_chunks], start=1):
         src = ch.get("metadata", {}).get("source", "desconocido")
         text = ch["text"].strip()
-        if len(text) > max_chars_per_chunk:
+        if max_chars_per_chunk and len(text) > max_chars_per_chunk:
             text = text[:max_chars_per_chunk] + "..."
-        lines.append(f"--- CONTEXTO {i} (source={src}) ---")
-        lines.append(text)
-        lines.append("")  # línea en blanco
-    return "\n".join(lines)
+        blocks.append((f"--- CONTEXTO {i} (source={src}) ---", text))
+    return blocks
+
+
+def schema_line(idx, c):
+    marks = []
+    if c["is_pk"]:
+        marks.append("PK")
+    if c["is_fk"]:
+        marks.append("FK")
+    mark = f" [{' ,'.join(marks)}]" if marks else ""
+    return f"{idx}. {c['name']} ({c['llm_type']} | {c['mysql_column_type']}){mark}"
+
+
+def evidence_line(c, n_samples=None, max_chars=None):
+    null_pct = round((c['n_null'] / c['n_all'] * 100), 2) if c['n_all'] else 0
+    line = f"{c['name']}: distinct={format_distinct(c)}, null_pct={null_pct}"
+    if c.get("pii_rates"):
+        line += f", pii={format_rates(c['pii_rates'])}"
+    if n_samples != 0:
+        line += f", muestras={format_samples(c['samples'], n_samples, max_chars)}"
+    return line
+
 
+def column_cost(counter, c):
+    """Tokens que aporta una columna al prompt (esquema + evidencia completa), para --chunk_columns por presupuesto."""
+    return counter.count(schema_line(0, c)) + counter.count(evidence_line(c)) + 2
 
-def call_mlx(prompt: str, model: str, adapter_path: str, max_tokens: int = 1024) -> str:
+
+def build_table_prompt(system_prompt, t, info, ctx_chunks, counter, max_tokens=0, context_share=0.35,
+                       note_lines=None):
     """
-    Llama a mlx_lm.generate con el modelo base de MLX y el adapter LoRA indicado.
-    Devuelve el texto generado (stdout).
+    Prompt de una tabla: system prompt, contexto RAG (si hay), esquema numerado,
+    recordatorio de nº de items y evidencia por columna. Con max_tokens > 0 el
+    contexto y la evidencia se ajustan al presupuesto (ver prompt_budget.py);
+    sin presupuesto el prompt es el de siempre. Con note_lines (bloque de una
+    tabla ancha, ver column_groups.py) info["columns"] son solo las del bloque.
+    Devuelve (prompt, informe de tokens).
     """
-    cmd = [
-        "mlx_lm.generate",
-        "--model", model,
-        "--adapter-path", adapter_path,
-        "--prompt", prompt,
-        "--max-tokens", str(max_tokens),
-    ]
+    head = [system_prompt]
+    intro, blocks = [], []
+    if ctx_chunks is not None:
+        intro = [
+            "Tienes acceso al siguiente CONTEXTO relevante sobre anonimización y clasificación de columnas:",
+            "[CONTEXTO]",
+        ]
+        blocks = context_blocks(ctx_chunks, max_chunks=4, max_chars_per_chunk=None if max_tokens else 500)
+
+    # --- Esquema de la tabla y recordatorio de N columnas ---
+    num_cols = len(info["columns"])
+    tail = [f"Tabla: {t} (filas ~ {info['row_count']})"] + list(note_lines or []) + ["Esquema (columnas en orden):"]
+    for idx, c in enumerate(info["columns"], start=1):
+        tail.append(schema_line(idx, c))
+
+    # Aquí le dejamos clarísimo cuántas columnas hay y cómo mapearlas a items[i]
+    first_col_name = info["columns"][0]["name"] if info["columns"] else "columna_1"
+    where = "este bloque" if note_lines else "esta tabla"
+    tail.append(
+        f"\nEn {where} hay EXACTAMENTE {num_cols} columnas. "
+        f"El array JSON 'items' debe contener EXACTAMENTE {num_cols} elementos, "
+        f"ni uno más ni uno menos. El item 1 corresponde a la columna 1 ({first_col_name}), "
+        f"el item 2 a la columna 2, etc."
+    )
 
-    proc = subprocess.run(cmd, capture_output=True, text=True)
+    # Evidencia por columna; n_samples / max_chars los baja el presupuesto si hace falta
+    def evidence(n_samples, max_chars):
+        return ["\nEvidencia por columna:"] + [evidence_line(c, n_samples, max_chars) for c in info["columns"]]
 
-    if proc.returncode != 0:
-        raise RuntimeError(
-            f"mlx_lm.generate falló con código {proc.returncode}:\n{proc.stderr}"
-        )
+    return assemble(counter, max_tokens, head, intro, blocks, tail, evidence, context_share=context_share)
 
-    return proc.stdout.strip()
+
+def call_mlx(prompt: str, model: str, adapter_path: str, max_tokens: int = 1024,
+             backend: str = "inprocess", server: str | None = None, max_batch: int = 4,
+             schema: dict | None = None) -> str:
+    """
+    Genera con el modelo base de MLX y el adapter LoRA indicado.
+    El modelo se carga una sola vez (backend residente, ver mlx_backend.py);
+    con `server` se usa un servidor local ya levantado. Con `schema` la salida
+    va restringida por gramática (ver constrained_output.py).
+    Devuelve el texto generado.
+    """
+    mlx = get_backend(model, adapter_path, kind=backend, server=server, max_batch=max_batch)
+    return mlx.generate(prompt, max_tokens=max_tokens, schema=schema).strip()
+
+
+def max_new_tokens(n_items: int, rationale_max: int) -> int:
+    """Tokens de salida suficientes para que el JSON restringido llegue a cerrarse."""
+    return max(1024, n_items * (rationale_max // 2 + 32) + 16)
 
 
 # ---------- main ----------
@@ -152,18 +245,95 @@ def main():
     ap.add_argument("--batch_size", type=int, default=ENV_BATCH_SIZE, help="(compat) no se usa para mezclar tablas")
     ap.add_argument("--model", default=ENV_MODEL, help="Nombre del modelo (Ollama o MLX, según modo)")
     ap.add_argument("--ollama_url", default=ENV_OLLAMA_URL)
+    ap.add_argument("--ollama_stream", action="store_true", help="usar streaming con Ollama (mide time-to-first-token)")
+    ap.add_argument("--ollama_retries", type=int, default=ENV_OLLAMA_RETRIES, help="reintentos con backoff ante errores transitorios")
     ap.add_argument("--out_predictions", default=ENV_OUT_PRED)
-    ap.add_argument("--sleep_s", type=float, default=ENV_SLEEP_S, help="pausa entre peticiones")
+    ap.add_argument("--sleep_s", type=float, default=ENV_SLEEP_S,
+                    help="(compat) pausa entre peticiones; si no se da --rate_limit equivale a 1/sleep_s peticiones/s")
+    ap.add_argument("--workers", type=int, default=ENV_WORKERS, help="nº máximo de peticiones al LLM en vuelo")
+    ap.add_argument("--rate_limit", type=float, default=ENV_RATE_LIMIT,
+                    help="peticiones/segundo al LLM (token bucket); 0 = sin límite")
     ap.add_argument("--use_rag", action="store_true", help="activar RAG para enriquecer el prompt con contexto")
+    ap.add_argument("--rag_retrieval", choices=RETRIEVAL_MODES, default=ENV_RAG_RETRIEVAL,
+                    help="dense: solo embeddings (FAISS); hybrid: FAISS + BM25 fusionados con RRF")
+    ap.add_argument("--rag_mode", choices=["table", "columns"], default=ENV_RAG_MODE,
+                    help="table: una query por tabla; columns: una query por columna, chunks ordenados por cobertura")
+    ap.add_argument("--approx_stats", action="store_true",
+                    help="estimar distinct/nulls con HyperLogLog en cliente (sin COUNT(DISTINCT) en MySQL)")
+    ap.add_argument("--approx_max_rows", type=int, default=0,
+                    help="con --approx_stats, máximo de filas leídas por tabla: las tablas más grandes se muestrean por "
+                         "estratos de la PK entera y su distinct es una cota inferior (≥). 0 = tabla completa en streaming, "
+                         "hasheando cada celda en Python: más lento que el COUNT(DISTINCT) de MySQL")
+    ap.add_argument("--scan_rows", type=int, default=ENV_SCAN_ROWS,
+                    help="filas por tabla que se escanean en busca de PII (tasas email_like=0.97… en la evidencia "
+                         "y muestras sacadas de esa muestra); 0 = sin escaneo")
+    ap.add_argument("--scan_strategy", choices=SCAN_STRATEGIES, default=ENV_SCAN_STRATEGY,
+                    help="stratified: estratos por rango de la PK entera, solo viajan ~N filas (sin PK entera "
+                         "simple → reservoir); reservoir: N filas al azar de un recorrido COMPLETO de la tabla "
+                         "(todas las filas viajan a Python, hasta --scan_max_rows); first: las N primeras filas")
+    ap.add_argument("--scan_max_rows", type=int, default=ENV_SCAN_MAX_ROWS,
+                    help="filas que lee como máximo el muestreo reservoir (LIMIT en el servidor); en tablas más "
+                         "grandes la muestra sale de las primeras filas y el informe lo marca (0 = tabla completa)")
 
     # NUEVO: modo MLX
     ap.add_argument("--use_mlx", action="store_true",
                     help="usar un modelo MLX local con LoRA (en lugar de Ollama)")
     ap.add_argument("--mlx_adapter_path", default="adapters/oyama_50",
                     help="ruta al adapter LoRA de MLX (por defecto adapters/oyama_50)")
+    ap.add_argument("--mlx_backend", choices=["inprocess", "subprocess", "stub"], default="inprocess",
+                    help="inprocess: modelo residente (por defecto); subprocess: un mlx_lm.generate por tabla; "
+                         "stub: respuestas sintéticas para pruebas sin MLX")
+    ap.add_argument("--mlx_server", default=None,
+                    help="host:puerto de un servidor 'python mlx_backend.py' ya levantado (en lugar de cargar el modelo aquí)")
+    ap.add_argument("--mlx_max_batch", type=int, default=4,
+                    help="máximo de prompts de tablas distintas que se generan juntos (con --workers > 1)")
+
+    # Caché de clasificaciones (SQLite)
+    ap.add_argument("--cache_path", default=ENV_CACHE_PATH,
+                    help="fichero SQLite de caché de respuestas del LLM (si no se indica, sin caché)")
+    ap.add_argument("--cache_key", choices=CACHE_KEY_MODES, default="prompt",
+                    help="prompt: hash del prompt final; schema: huella del esquema (salta RAG y LLM si no cambia)")
+    ap.add_argument("--cache_ttl_days", type=float, default=30, help="caducidad de las entradas (0 = sin TTL)")
+    ap.add_argument("--cache_max_entries", type=int, default=10000, help="máximo de entradas (0 = sin límite)")
+
+    # Presupuesto de tokens del prompt
+    ap.add_argument("--max_prompt_tokens", type=int, default=ENV_MAX_PROMPT_TOKENS,
+                    help="presupuesto de tokens por prompt: recorta contexto RAG y comprime la evidencia "
+                         "hasta que quepa (0 = sin límite; los tokens se registran igualmente)")
+    ap.add_argument("--tokenizer", default=ENV_TOKENIZER,
+                    help="tokenizer de HuggingFace para contar tokens (por defecto el de --model con --use_mlx; "
+                         "sin tokenizer se estiman)")
+    ap.add_argument("--context_share", type=float, default=0.35,
+                    help="fracción mínima del presupuesto libre reservada al contexto RAG")
+
+    # Preclasificación por reglas
+    ap.add_argument("--preclassify", action="store_true", default=bool(ENV_PRECLASSIFY),
+                    help="clasificar por reglas (ejemplos del corpus RAG, --preclassify_rules, PII en las "
+                         "muestras, FKs) las columnas obvias y enviar al LLM solo las ambiguas")
+    ap.add_argument("--preclassify_rules", default=ENV_PRECLASSIFY_RULES,
+                    help="JSON {categoría: [nombres de columna]} con reglas por nombre adicionales para "
+                         "--preclassify")
+
+    # Salida JSON restringida
+    ap.add_argument("--constrained_output", action="store_true", default=bool(ENV_CONSTRAINED),
+                    help="restringir la respuesta al JSON schema de items (categorías, nº de items, longitud "
+                         "de rationale): 'format' de Ollama o gramática sobre los logits en MLX")
+    ap.add_argument("--rationale_max_chars", type=int, default=ENV_RATIONALE_MAX,
+                    help="con --constrained_output, longitud máxima del rationale de cada item")
+
+    # Tablas anchas por bloques de columnas
+    ap.add_argument("--chunk_columns", type=int, default=ENV_CHUNK_COLUMNS,
+                    help="máximo de columnas por petición: las tablas más anchas se clasifican por bloques "
+                         "(en paralelo) y los items se cosen en orden (0 = sin límite). Con --max_prompt_tokens "
+                         "los bloques se ajustan además al presupuesto")
+
+    # Modo incremental
+    ap.add_argument("--since", default=None, metavar="PREVIOUS_PREDICTIONS_JSON",
+                    help="solo re-perfila y re-clasifica las tablas con columnas añadidas, eliminadas o de tipo "
+                         "cambiado respecto a este predictions.json; el resto se copia tal cual")
 
     args = ap.parse_args()
-    rag_client = RAGClient() if args.use_rag else None
+    rag_client = RAGClient(retrieval=args.rag_retrieval) if args.use_rag else None
 
     print(f"[INFO] Conectando a MySQL {args.host}:{args.port} DB={args.database} con usuario '{args.user}'…")
 
@@ -189,6 +359,22 @@ def main():
     """, (args.database, args.table_like))
     cols = cur.fetchall()
 
+    # 1a) modo incremental: comparar con el esquema de la ejecución anterior
+    cur_schema = schema_from_columns(cols)
+    table_order = list(cur_schema.keys())
+    prev_items, reused_tables, since_report = {}, [], None
+    if args.since:
+        prev_schema, prev_items = load_previous(args.since)
+        diff = diff_schemas(prev_schema, cur_schema, prev_items)
+        reused_tables = diff["unchanged"]
+        since_report = {"previous": args.since, **{k: sorted(v) for k, v in diff.items()}}
+        print(
+            f"[INFO] --since {args.since}: {len(diff['added'])} nuevas, {len(diff['changed'])} cambiadas, "
+            f"{len(diff['removed'])} eliminadas, {len(diff['unchanged'])} sin cambios (se reutilizan)."
+        )
+        reused = set(reused_tables)
+        cols = [c for c in cols if c.get("table_name", c.get("TABLE_NAME")) not in reused]
+
     # 1b) PKs y FKs
     cur.execute("""
         SELECT TABLE_NAME, COLUMN_NAME
@@ -212,60 +398,18 @@ def main():
             "ref_column": r["REFERENCED_COLUMN_NAME"],
         })
 
-    # 2) Agrupar por tabla, con stats + muestras
-    tables = {}
-    for c in cols:
-        t   = c.get("table_name",  c.get("TABLE_NAME"))
-        col = c.get("column_name", c.get("COLUMN_NAME"))
-        dt  = c.get("data_type",   c.get("DATA_TYPE"))
-        ct  = c.get("column_type", c.get("COLUMN_TYPE"))
-        nul = c.get("is_nullable", c.get("IS_NULLABLE"))
-
-        # contar filas y nulls/distinct para la columna
-        cur.execute(f"SELECT COUNT(*) AS n, SUM(CASE WHEN `{col}` IS NULL THEN 1 ELSE 0 END) AS n_null FROM `{t}`")
-        r = cur.fetchone() or {}
-        n_all = r.get("n", 0) or 0
-        n_null = r.get("n_null", 0) or 0
-
-        try:
-            cur.execute(f"SELECT COUNT(DISTINCT `{col}`) AS n_dist FROM `{t}`")
-            r2 = cur.fetchone() or {}
-            n_dist = r2.get("n_dist", 0) or 0
-        except Exception:
-            n_dist = None
-
-        # muestras (non-null)
-        samples = []
-        try:
-            cur.execute(f"SELECT `{col}` as v FROM `{t}` WHERE `{col}` IS NOT NULL LIMIT %s", (args.sample_rows,))
-            samples = [mask_value(rr["v"]) for rr in cur.fetchall()]
-        except Exception:
-            pass
-
-        llm_type = map_mysql_type(dt, ct)
-
-        tables.setdefault(t, {"row_count": None, "columns": []})
-        tables[t]["columns"].append({
-            "name": col,
-            "mysql_data_type": dt,
-            "mysql_column_type": ct,
-            "llm_type": llm_type,
-            "is_nullable": nul,
-            "n_all": n_all,
-            "n_null": n_null,
-            "n_distinct": n_dist,
-            "samples": samples,
-            "is_pk": (col in pk_map.get(t, set())),
-            "is_fk": any(fk["column"] == col for fk in fk_map.get(t, []))
-        })
-
-    # filas por tabla
-    for t in tables.keys():
-        try:
-            cur.execute(f"SELECT COUNT(*) AS n FROM `{t}`")
-            tables[t]["row_count"] = (cur.fetchone() or {}).get("n", 0)
-        except Exception:
-            tables[t]["row_count"] = None
+    # 2) Agrupar por tabla, con stats + muestras (una consulta agregada por tabla)
+    tables = profile_tables(
+        cur, cols, pk_map, fk_map,
+        sample_rows=args.sample_rows,
+        mask_fn=mask_value,
+        type_fn=map_mysql_type,
+        approx=args.approx_stats,
+        approx_max_rows=args.approx_max_rows,
+    )
+    if args.scan_rows > 0:
+        scan_tables(cur, tables, args.scan_rows, strategy=args.scan_strategy,
+                    sample_rows=args.sample_rows, mask_fn=mask_value, max_rows=args.scan_max_rows)
 
     cur.close(); conn.close()
 
@@ -305,113 +449,191 @@ def main():
 
 
 
-    all_items = []
-
-    for t, info in tables.items():
-        lines = [SYSTEM_PROMPT]
-
-        # --- RAG: recuperar contexto y añadirlo al prompt, si está activado ---
-        if rag_client is not None:
-            query = build_retrieval_query(t, info)
-
-            # si quieres, puedes deducir el dominio_hint según la BD o tabla;
-            # aquí te pongo un ejemplo fijo de 'rrhh' para bases de empleo/formación:
-            domain_hint = "rrhh"  # o None si no lo sabes
-
-            ctx_chunks = rag_client.retrieve_mixed_context(
-                query,
-                scope="core",
-                domain_hint=domain_hint,
-                n_defs=1,
-                n_ejemplos=2,   # más compacto
-                n_casos_borde=1,
-                n_dominios=1,
-                n_max_total=6,
-            )
-
-            context_block = build_context_block(
-                ctx_chunks,
-                max_chunks=4,
-                max_chars_per_chunk=500,
+    cache = None
+    if args.cache_path:
+        cache = LLMCache(args.cache_path, ttl_s=args.cache_ttl_days * 86400, max_entries=args.cache_max_entries)
+    # la clave distingue backend, modelo y adapter
+    model_id = f"mlx:{args.model}" if args.use_mlx else f"ollama:{args.model}"
+    adapter_id = args.mlx_adapter_path if args.use_mlx else None
+
+    # tokens contados con el tokenizer del modelo (o estimados)
+    counter = TokenCounter(args.tokenizer or (args.model if args.use_mlx else None))
+    prompt_tokens = {}
+
+    # 3a) preclasificación por reglas (ver preclassifier.py): al LLM solo van las
+    # columnas pendientes de cada tabla (llm_tables)
+    preclass, decided, llm_tables = None, {}, tables
+    if args.preclassify:
+        preclass = PreClassifier.from_sources(args.preclassify_rules or None)
+        llm_tables = {}
+        for t, info in tables.items():
+            decided[t], pending_cols = preclass.split(t, info["columns"])
+            llm_tables[t] = dict(info, columns=pending_cols)
+
+    # 3b) bloques de columnas por tabla (ver column_groups.py); sin --chunk_columns
+    # ni --max_prompt_tokens cada tabla es un único bloque, como siempre
+    col_budget = 0
+    if args.max_prompt_tokens:
+        col_budget = args.max_prompt_tokens - counter.count(SYSTEM_PROMPT) - PROMPT_OVERHEAD_TOKENS
+        if args.use_rag:
+            col_budget = int(col_budget * (1 - args.context_share))
+        col_budget = max(1, col_budget)
+    def split(columns):
+        return split_columns(columns, max_cols=args.chunk_columns,
+                             col_cost=lambda c: column_cost(counter, c), budget=col_budget)
+
+    groups = {t: split(info["columns"]) for t, info in llm_tables.items()}
+    n_split = sum(1 for g in groups.values() if len(g) > 1)
+    if n_split:
+        print(f"[INFO] {n_split} tablas anchas se clasifican por bloques "
+              f"({sum(len(g) for g in groups.values())} peticiones para {len(tables)} tablas).")
+
+    # 3c) construir los prompts (secuencial: el RAG se consulta desde un solo hilo)
+    schema_hits = {}
+    if cache is not None and args.cache_key == "schema":
+        for t, info in llm_tables.items():
+            for start, stop in groups[t]:
+                ckey = schema_key(t, info["columns"][start:stop], model_id, adapter_id)
+                schema_hits[(t, start)] = (ckey, cache.get(ckey))
+
+    # --- RAG: contexto de todas las tablas a la vez (un batch de embeddings + una búsqueda) ---
+    rag_contexts = {}
+    if rag_client is not None:
+        rag_tables = [t for t in tables
+                      if any(schema_hits.get((t, start), (None, None))[1] is None for start, _ in groups[t])]
+
+        # si quieres, puedes deducir el dominio_hint según la BD o tabla;
+        # aquí te pongo un ejemplo fijo de 'rrhh' para bases de empleo/formación:
+        domain_hint = "rrhh"  # o None si no lo sabes
+
+        mix = dict(
+            scope="core",
+            domain_hint=domain_hint,
+            n_defs=1,
+            n_ejemplos=2,   # más compacto
+            n_casos_borde=1,
+            n_dominios=1,
+            n_max_total=6,
+        )
+        if args.rag_mode == "columns":
+            contexts = rag_client.retrieve_columns_context_many(
+                [build_column_queries(t, tables[t]) for t in rag_tables], **mix)
+        else:
+            contexts = rag_client.retrieve_mixed_context_many(
+                [build_retrieval_query(t, tables[t]) for t in rag_tables], **mix)
+        rag_contexts = dict(zip(rag_tables, contexts))
+
+    # jobs: (tabla, (inicio, fin, nº bloque, nº bloques), prompt | None, clave de caché | None, respuesta cacheada | None)
+    jobs = []
+    for t, info in llm_tables.items():
+        n_groups = len(groups[t])
+        for gi, (start, stop) in enumerate(groups[t]):
+            part = (start, stop, gi, n_groups)
+            label = group_label(t, n_groups, gi)
+            ckey, cached = schema_hits.get((t, start), (None, None))
+            if cached is not None:
+                # esquema sin cambios: ni RAG ni prompt ni LLM
+                jobs.append((t, part, None, ckey, cached))
+                continue
+
+            prompt, tok_report = build_table_prompt(
+                SYSTEM_PROMPT, t, dict(info, columns=info["columns"][start:stop]),
+                rag_contexts[t] if rag_client is not None else None,
+                counter, max_tokens=args.max_prompt_tokens, context_share=args.context_share,
+                note_lines=group_note(info["columns"], start, stop, n_groups, gi) + decided_note(decided.get(t)),
             )
-
-            lines.append("Tienes acceso al siguiente CONTEXTO relevante sobre anonimización y clasificación de columnas:")
-            lines.append("[CONTEXTO]")
-            lines.append(context_block)
-
-        # --- Esquema de la tabla y recordatorio de N columnas ---
-        num_cols = len(info["columns"])
-
-        lines.append(f"Tabla: {t} (filas ~ {info['row_count']})")
-        lines.append("Esquema (columnas en orden):")
-        for idx, c in enumerate(info["columns"], start=1):
-            marks = []
-            if c["is_pk"]:
-                marks.append("PK")
-            if c["is_fk"]:
-                marks.append("FK")
-            mark = f" [{' ,'.join(marks)}]" if marks else ""
-            lines.append(f"{idx}. {c['name']} ({c['llm_type']} | {c['mysql_column_type']}){mark}")
-
-        # Aquí le dejamos clarísimo cuántas columnas hay y cómo mapearlas a items[i]
-        first_col_name = info["columns"][0]["name"] if info["columns"] else "columna_1"
-        lines.append(
-            f"\nEn esta tabla hay EXACTAMENTE {num_cols} columnas. "
-            f"El array JSON 'items' debe contener EXACTAMENTE {num_cols} elementos, "
-            f"ni uno más ni uno menos. El item 1 corresponde a la columna 1 ({first_col_name}), "
-            f"el item 2 a la columna 2, etc."
+            prompt_tokens[label] = tok_report
+            print(f"[TOKENS] Tabla {label}: {format_report(tok_report)}")
+            cached = None
+            if cache is not None and args.cache_key == "prompt":
+                ckey = prompt_key(prompt, model_id, adapter_id)
+                cached = cache.get(ckey)
+            jobs.append((t, part, prompt, ckey, cached))
+
+    # solo van al LLM los bloques sin respuesta en caché
+    pending = [j for j in jobs if j[4] is None]
+
+    if preclass is not None:
+        calls_without = sum(len(split(info["columns"])) for info in tables.values())
+        preclass_report = preclass.summary(len(pending), calls_without, cache_hits=len(jobs) - len(pending))
+        print(f"[INFO] Preclasificador: {preclass_report['preclassified']}/{preclass_report['columns']} columnas "
+              f"por reglas {preclass_report['by_rule']}; {preclass_report['llm_calls_avoided']} llamadas al LLM evitadas.")
+
+    # 3d) llamadas al LLM concurrentes (máx. --workers en vuelo, ritmo por token bucket);
+    # los bloques de una misma tabla van en paralelo como cualquier otra petición
+    bucket = TokenBucket(rate_from_args(args.rate_limit, args.sleep_s), capacity=args.workers)
+
+    ollama = None
+    if not args.use_mlx:
+        ollama = OllamaClient(
+            args.ollama_url, model=args.model,
+            stream=args.ollama_stream, retries=args.ollama_retries, pool_size=args.workers,
         )
 
-        # Evidencia por columna (igual que antes)
-        lines.append("\nEvidencia por columna:")
-        for c in info["columns"]:
-            null_pct = round((c['n_null'] / c['n_all'] * 100), 2) if c['n_all'] else 0
-            lines.append(
-                f"{c['name']}: distinct={c['n_distinct']}, "
-                f"null_pct={null_pct}, muestras={json.dumps(c['samples'], ensure_ascii=False)}"
+    def classify(job):
+        _, (start, stop, _, _), prompt, _, _ = job
+        schema = None
+        if args.constrained_output:
+            # un item por columna del bloque, categorías del enum y rationale acotado
+            schema = items_schema(stop - start, rationale_max=args.rationale_max_chars)
+        if args.use_mlx:
+            # Usar modelo MLX + LoRA afinado (aquí solo podemos medir la latencia)
+            t0 = time.perf_counter()
+            txt = call_mlx(
+                prompt,
+                model=args.model,
+                adapter_path=args.mlx_adapter_path,
+                max_tokens=max_new_tokens(stop - start, args.rationale_max_chars) if schema else 1024,
+                backend=args.mlx_backend,
+                server=args.mlx_server,
+                # con un solo worker no hay con quién agrupar: sin BatchingBackend
+                max_batch=min(args.mlx_max_batch, max(1, args.workers)),
+                schema=schema,
             )
+            return LLMResult(text=txt, latency_s=time.perf_counter() - t0)
+        # Usar modelo base vía Ollama (como antes); con schema, salida estructurada
+        return ollama.generate(prompt, format=schema)
+
+    pending_results = iter(run_ordered(
+        classify, pending,
+        max_workers=args.workers,
+        bucket=bucket,
+        fatal=(requests.exceptions.ConnectionError,),
+    ))
+    results = [
+        (LLMResult(text=j[4], latency_s=0.0, cached=True), None) if j[4] is not None else next(pending_results)
+        for j in jobs
+    ]
 
-        prompt = "\n".join(lines)
-
-
-        try:
+    # 3e) parseo y recolección en el orden de las tablas y de sus bloques (salida determinista)
+    llm_items = {t: [] for t in tables}
+    llm_stats = {}
+    for (t, (start, stop, gi, n_groups), prompt, ckey, _), (res, err) in zip(jobs, results):
+        label = group_label(t, n_groups, gi)
+        if prompt is None:
+            print(f"[CACHE] Tabla {label}: esquema sin cambios, se reutiliza la respuesta anterior.")
+        else:
             print(prompt)
             print("AQUI TERMINA EL PROMPT")
-
-            if args.use_mlx:
-                # Usar modelo MLX + LoRA afinado
-                txt = call_mlx(
-                    prompt,
-                    model=args.model,
-                    adapter_path=args.mlx_adapter_path,
-                    max_tokens=1024,
-                ).strip()
-            else:
-                # Usar modelo base vía Ollama (como antes)
-                if call_ollama is None:
-                    raise RuntimeError("call_ollama no está disponible y --use_mlx es False")
-                txt = call_ollama(
-                    prompt,
-                    model=args.model,
-                    ollama_url=args.ollama_url
-                ).strip()
-
-            print("AQUI EMPIEZA LA RESPUESTA")
-            print(txt)
-        except requests.exceptions.ConnectionError:
+        if isinstance(err, requests.exceptions.ConnectionError):
             print(f"[ERROR] No puedo conectar con Ollama en {args.ollama_url}. ¿Has ejecutado 'ollama serve' o levantado el contenedor?")
             sys.exit(2)
-        except requests.exceptions.RequestException as e:
-            print(f"[WARN] Tabla {t}: fallo llamando a Ollama: {e}")
+        elif isinstance(err, requests.exceptions.RequestException):
+            print(f"[WARN] Tabla {label}: fallo llamando a Ollama: {err}")
             continue
-        except Exception as e:
-            print(f"[WARN] Tabla {t}: error inesperado llamando al modelo: {e}")
+        elif err is not None:
+            print(f"[WARN] Tabla {label}: error inesperado llamando al modelo: {err}")
             continue
+        txt = res.text.strip()
+        llm_stats[label] = res.stats()
+        print("AQUI EMPIEZA LA RESPUESTA")
+        print(txt)
+        print(f"[STATS] Tabla {label}: {format_llm_stats(res)}")
 
         # parseo robusto
                 # ---------- parseo robusto del JSON ----------
         items = []
-        cols_this_table = info["columns"]
+        cols_this_table = llm_tables[t]["columns"][start:stop]
 
         # 1) Intento normal: JSON completo
         try:
@@ -440,9 +662,9 @@ def main():
         if not items:
             # No hemos podido parsear nada útil:
             # generamos una fila "dummy" por cada columna para que NINGUNA tabla desaparezca.
-            print(f"[WARN] Tabla {t}: no se pudo parsear JSON de la respuesta, se generan predicciones vacías por columna.")
+            print(f"[WARN] Tabla {label}: no se pudo parsear JSON de la respuesta, se generan predicciones vacías por columna.")
             for c in cols_this_table:
-                all_items.append({
+                llm_items[t].append({
                     "table": t,
                     "name": c["name"],
                     "category": "",
@@ -457,7 +679,7 @@ def main():
 
             # 1) Emparejar las que encajan en longitud
             for c, it in zip(cols_this_table[:n_common], items[:n_common]):
-                all_items.append({
+                llm_items[t].append({
                     "table": t,
                     "name": c["name"],  # siempre el nombre real de la columna
                     "category": it.get("category", ""),
@@ -467,9 +689,9 @@ def main():
 
             # 2) Si hay MÁS columnas que items → rellenamos faltantes
             if n_cols > n_items:
-                print(f"[WARN] Tabla {t}: hay {n_cols} columnas pero solo {n_items} items, se rellenan las restantes vacías.")
+                print(f"[WARN] Tabla {label}: hay {n_cols} columnas pero solo {n_items} items, se rellenan las restantes vacías.")
                 for c in cols_this_table[n_items:]:
-                    all_items.append({
+                    llm_items[t].append({
                         "table": t,
                         "name": c["name"],
                         "category": "",
@@ -478,12 +700,53 @@ def main():
                     })
             # Si hay MÁS items que columnas, los ignoramos (no tenemos a quién asignarlos)
 
+            # solo se cachean respuestas completas (un item por columna)
+            if cache is not None and ckey and not res.cached and n_items >= n_cols:
+                cache.put(ckey, txt)
 
-        time.sleep(args.sleep_s)
+    # preclasificadas + respuestas del LLM, en el orden de las columnas
+    all_items = [
+        it for t, info in tables.items()
+        for it in merge_table_items(info["columns"], decided.get(t), llm_items[t])
+    ]
 
     # 4) escribir predictions.json
+    if ollama is not None:
+        ollama.close()
+    if args.since:
+        all_items = merge_items(table_order, all_items, prev_items, reused_tables)
+    out = {"items": all_items, "schema": cur_schema}
+    if since_report is not None:
+        out["since"] = since_report
+    out["llm_stats"] = {"summary": summarize_stats([r for r, _ in results]), "tables": llm_stats}
+    if preclass is not None:
+        out["preclassifier"] = preclass_report
+    if prompt_tokens:
+        out["prompt_tokens"] = prompt_tokens
+        over = [t for t, r in prompt_tokens.items() if r["over_budget"]]
+        if over:
+            print(f"[WARN] {len(over)} prompts exceden --max_prompt_tokens incluso comprimidos: {', '.join(over)}")
+    print(f"[INFO] LLM: {out['llm_stats']['summary']}")
+    if cache is not None:
+        cache.evict()
+        out["cache"] = cache.summary()
+        print(f"[INFO] Caché ({args.cache_key}): {out['cache']}")
+        cache.close()
+    if args.approx_stats:
+        # informe de qué columnas usan estadísticas estimadas
+        approx_cols = approx_columns_report(tables)
+        out["profiling"] = {"approx_stats": True, "approx_columns": approx_cols}
+        print(f"[INFO] {len(approx_cols)} columnas con distinct/nulls estimados (HyperLogLog).")
+    if args.scan_rows > 0:
+        scans = scan_report(tables)
+        out.setdefault("profiling", {})["pii_scan"] = scans
+        n_pii = sum(len(r["columns"]) for r in scans)
+        print(f"[INFO] Escaneo de PII ({args.scan_strategy}, {args.scan_rows} filas/tabla): {n_pii} columnas con PII detectada.")
+        capped = [r["table"] for r in scans if r.get("capped")]
+        if capped:
+            print(f"[WARN] Escaneo reservoir limitado a las primeras {args.scan_max_rows} filas en: {', '.join(capped)}")
     with open(args.out_predictions, "w", encoding="utf-8") as f:
-        json.dump({"items": all_items}, f, ensure_ascii=False, indent=2)
+        json.dump(out, f, ensure_ascii=False, indent=2)
 
     print(f"[OK] Generado {args.out_predictions} con {len(all_items)} items.")
 
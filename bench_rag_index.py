@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark recall@k vs latencia de los tipos de índice RAG (rag_index.py)
+frente a la búsqueda exacta (flat con la misma métrica).
+
+Vectores:
+  - por defecto, los embeddings de rag_corpus/chunks.jsonl
+  - con --synthetic N, N vectores aleatorios agrupados (para simular un corpus
+    de decenas de miles de chunks sin tener que embeberlo)
+Queries: --queries fichero (una por línea) o, si no, vectores del propio corpus
+con ruido gaussiano.
+
+Ejemplo:
+  python bench_rag_index.py --synthetic 50000 --k 10 --index_types flat ip hnsw ivfpq
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import rag_index
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def load_corpus_embeddings(chunks_path: str, model):
+    texts = []
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        for line in f:
+            texts.append(json.loads(line)["text"])
+    return np.asarray(model.encode(texts, batch_size=64), dtype="float32")
+
+
+def synthetic_embeddings(n: int, dim: int, n_clusters: int, seed: int):
+    # corpus "realista": vectores agrupados en temas, no ruido uniforme
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype("float32")
+    labels = rng.integers(0, n_clusters, size=n)
+    return centers[labels] + 0.35 * rng.normal(size=(n, dim)).astype("float32")
+
+
+def noisy_queries(embs, n_queries: int, seed: int):
+    rng = np.random.default_rng(seed + 1)
+    pick = rng.choice(len(embs), size=min(n_queries, len(embs)), replace=False)
+    q = embs[pick]
+    return q + 0.1 * np.std(q) * rng.normal(size=q.shape).astype("float32")
+
+
+def recall_at_k(found, truth) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def timed_search(index, queries, k: int):
+    # una query cada vez, como hace RAGClient en el caso típico
+    lat = []
+    out = np.empty((len(queries), k), dtype="int64")
+    for i in range(len(queries)):
+        t0 = time.perf_counter()
+        _, idx = index.search(queries[i:i + 1], k)
+        lat.append(time.perf_counter() - t0)
+        out[i] = idx[0]
+    lat = np.asarray(lat) * 1000
+    return out, float(np.mean(lat)), float(np.percentile(lat, 95))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Recall@k vs latencia de los índices RAG frente a flat.")
+    ap.add_argument("--chunks", default="rag_corpus/chunks.jsonl")
+    ap.add_argument("--synthetic", type=int, default=0, help="nº de vectores sintéticos (0 = usar chunks.jsonl)")
+    ap.add_argument("--dim", type=int, default=384, help="dimensión de los vectores sintéticos")
+    ap.add_argument("--clusters", type=int, default=200, help="temas de los vectores sintéticos")
+    ap.add_argument("--queries", default=None, help="fichero de queries de texto (una por línea)")
+    ap.add_argument("--n_queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--index_types", nargs="+", default=list(rag_index.INDEX_TYPES),
+                    choices=rag_index.INDEX_TYPES)
+    ap.add_argument("--metric", choices=rag_index.METRICS, default=None,
+                    help="métrica de hnsw/ivfpq (por defecto l2)")
+    ap.add_argument("--ef_search", type=int, default=None)
+    ap.add_argument("--nprobe", type=int, default=None)
+    ap.add_argument("--ivf_nlist", type=int, default=None)
+    ap.add_argument("--pq_m", type=int, default=None)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    model = None
+    if args.synthetic:
+        embs = synthetic_embeddings(args.synthetic, args.dim, args.clusters, args.seed)
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(MODEL_NAME)
+        embs = load_corpus_embeddings(args.chunks, model)
+
+    if args.queries:
+        if model is None:
+            ap.error("--queries necesita el corpus real (sin --synthetic)")
+        with open(args.queries, encoding="utf-8") as f:
+            texts = [l.strip() for l in f if l.strip()]
+        queries = np.asarray(model.encode(texts), dtype="float32")
+    else:
+        queries = noisy_queries(embs, args.n_queries, args.seed)
+
+    k = min(args.k, len(embs))
+    print(f"[INFO] {len(embs)} vectores dim={embs.shape[1]}, {len(queries)} queries, k={k}")
+
+    # verdad de referencia: búsqueda exacta con la métrica de cada índice
+    exact = {}
+    for metric in ("l2", "ip"):
+        ref, ref_cfg = rag_index.build_index(embs, rag_index.make_config("ip" if metric == "ip" else "flat"))
+        _, exact[metric] = ref.search(rag_index.prepare_queries(queries, ref_cfg), k)
+
+    print(f"{'índice':<8} {'métrica':<7} {'build_s':>8} {'recall@k':>9} {'lat_ms':>8} {'p95_ms':>8}")
+    for index_type in args.index_types:
+        metric = args.metric if index_type in ("hnsw", "ivfpq") else None
+        cfg = rag_index.make_config(index_type, metric, ef_search=args.ef_search, nprobe=args.nprobe,
+                                    ivf_nlist=args.ivf_nlist, pq_m=args.pq_m)
+        t0 = time.perf_counter()
+        index, cfg = rag_index.build_index(embs, cfg)
+        build_s = time.perf_counter() - t0
+        rag_index.apply_search_params(index, cfg, k=k)
+
+        found, lat_ms, p95_ms = timed_search(index, rag_index.prepare_queries(queries, cfg), k)
+        rec = recall_at_k(found, exact[cfg["metric"]])
+        print(f"{index_type:<8} {cfg['metric']:<7} {build_s:>8.2f} {rec:>9.3f} {lat_ms:>8.3f} {p95_ms:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,49 @@
 #!/usr/bin/env python3
-import os, json, glob, re
+"""
+Construye el índice RAG a partir de rag_corpus/raw de forma incremental:
+un manifest guarda el hash de cada documento y los ids ("vid") de sus chunks,
+y los embeddings se guardan en vectors.f32 (float32 en bruto, n x dim) alineados
+con vector_ids.npy y con las líneas de chunks.jsonl. En cada ejecución solo se
+trocean los documentos nuevos o modificados, solo se embeben los chunks cuyo
+texto no existía ya, y los vectores obsoletos se borran del índice por id.
+
+La ingesta es en streaming: los documentos se leen de uno en uno (el hash se
+calcula por bloques), se trocean en un pool de procesos con una ventana
+acotada, y los chunks nuevos se embeben en batches de tamaño fijo que se
+escriben enseguida en chunks.jsonl / vectors.f32 (y en el índice si se
+actualiza in situ). El sidecar de metadatos (offsets, ids por tipo / scope /
+dominio) y el índice BM25 se alimentan del mismo flujo de chunks, sin volver
+a leer chunks.jsonl. La memoria pico depende del batch, no del corpus
+(salvo los propios índices FAISS y BM25).
+
+Todos los ficheros se escriben en un .tmp y se renombran (os.replace); el
+manifest va el último, así que una ejecución interrumpida se repite entera.
+--full fuerza la reconstrucción completa.
+"""
+import os, json, glob, re, argparse, hashlib, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 
+from rag_client import ChunkMetaBuilder, write_chunk_sidecar, write_bm25_index
+import rag_index
+from rag_bm25 import BM25Builder, bm25_path
+
 RAW_DIR = "rag_corpus/raw"
 OUT_INDEX = "rag_corpus/index.faiss"
 OUT_CHUNKS = "rag_corpus/chunks.jsonl"
+OUT_MANIFEST = "rag_corpus/manifest.json"
+OUT_VECTORS = "rag_corpus/vectors.f32"
+OUT_VECTOR_IDS = "rag_corpus/vector_ids.npy"
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+MANIFEST_VERSION = 2
 
 CHUNK_SIZE = 400   # palabras aprox
 CHUNK_OVERLAP = 50 # solape entre chunks
+EMBED_BATCH = 256  # chunks por llamada al encoder (y por escritura)
+HASH_BLOCK = 1 << 20
 
 def split_into_paragraphs(text: str):
     paras = re.split(r'\n\s*\n', text)
@@ -23,14 +57,16 @@ def chunk_text(text: str, size_words: int = CHUNK_SIZE, overlap_words: int = CHU
     paragraphs = split_into_paragraphs(text)
     chunks = []
     current_words = []
+    last_words = []  # palabras del último chunk emitido (para el solape, sin volver a partirlo)
 
     def flush_chunk():
-        nonlocal current_words
+        nonlocal current_words, last_words
         if not current_words:
             return
         chunk_text = " ".join(current_words).strip()
         if chunk_text:
             chunks.append(chunk_text)
+            last_words = current_words
         current_words = []
 
     for para in paragraphs:
@@ -40,13 +76,13 @@ def chunk_text(text: str, size_words: int = CHUNK_SIZE, overlap_words: int = CHU
             if len(sent_words) >= size_words:
                 flush_chunk()
                 chunks.append(" ".join(sent_words))
+                last_words = sent_words
                 continue
 
             if len(current_words) + len(sent_words) > size_words:
                 flush_chunk()
                 if overlap_words > 0 and chunks:
-                    prev_words = chunks[-1].split()
-                    overlap = prev_words[-overlap_words:]
+                    overlap = last_words[-overlap_words:]
                     current_words = overlap + sent_words
                 else:
                     current_words = sent_words
@@ -56,52 +92,337 @@ def chunk_text(text: str, size_words: int = CHUNK_SIZE, overlap_words: int = CHU
     flush_chunk()
     return chunks
 
-def read_documents():
-    docs = []
-    for path in glob.glob(os.path.join(RAW_DIR, "*")):
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def iter_documents():
+    """Documentos de RAW_DIR en orden: solo ruta + hash, el texto se lee al trocear."""
+    for path in sorted(glob.glob(os.path.join(RAW_DIR, "*"))):
         if not path.lower().endswith((".md", ".txt")):
             continue
-        with open(path, "r", encoding="utf-8") as f:
-            text = f.read()
-        docs.append({
+        yield {
             "source": os.path.basename(path),
-            "text": text
-        })
-    return docs
+            "path": path,
+            "sha256": file_sha256(path),
+        }
+
+def chunk_document(path: str):
+    # se ejecuta en los procesos del pool
+    with open(path, "r", encoding="utf-8") as f:
+        return chunk_text(f.read())
+
+def ordered_map(pool, fn, items, window: int):
+    """
+    Como pool.map pero con como mucho `window` tareas en vuelo, para que los
+    resultados no se acumulen si el consumidor (el encoder) va más lento.
+    """
+    if pool is None:
+        for it in items:
+            yield fn(it)
+        return
+    pending = deque()
+    for it in items:
+        pending.append(pool.submit(fn, it))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Construye el índice RAG (FAISS + chunks.jsonl) a partir de rag_corpus/raw.")
+    ap.add_argument("--index_type", choices=rag_index.INDEX_TYPES, default="flat",
+                    help="flat (L2 exacto), ip (coseno exacto), hnsw, ivfpq")
+    ap.add_argument("--metric", choices=rag_index.METRICS, default=None,
+                    help="métrica para hnsw/ivfpq (por defecto l2; ip normaliza los vectores)")
+    ap.add_argument("--hnsw_m", type=int, default=None, help="vecinos por nodo en HNSW")
+    ap.add_argument("--ef_construction", type=int, default=None, help="efConstruction de HNSW")
+    ap.add_argument("--ef_search", type=int, default=None, help="efSearch de HNSW en búsqueda")
+    ap.add_argument("--ivf_nlist", type=int, default=None, help="nº de listas IVF (se ajusta a corpus pequeños)")
+    ap.add_argument("--pq_m", type=int, default=None, help="subvectores PQ (debe dividir la dimensión)")
+    ap.add_argument("--pq_nbits", type=int, default=None, help="bits por código PQ")
+    ap.add_argument("--nprobe", type=int, default=None, help="listas IVF visitadas en búsqueda")
+    ap.add_argument("--full", action="store_true",
+                    help="ignora el manifest y reconstruye todo (re-trocea, re-embebe y re-entrena)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="procesos para trocear documentos (1 = sin pool)")
+    ap.add_argument("--embed_batch", type=int, default=EMBED_BATCH,
+                    help="chunks por batch del encoder")
+    return ap.parse_args()
+
+def embedding_signature():
+    # si cambia cualquiera de estos, los vectores guardados no sirven
+    return {"model": MODEL_NAME, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+
+def _tmp(path):
+    return path + ".tmp"
+
+class PreviousCorpus:
+    """
+    Acceso perezoso a la ejecución anterior: las líneas de chunks.jsonl se leen
+    por offset y los vectores con np.memmap, así que no se carga el corpus entero.
+    """
+
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.dim = manifest["dim"]
+        self.ids = np.load(OUT_VECTOR_IDS)
+        self.row_by_vid = {int(v): i for i, v in enumerate(self.ids)}
+        self.offsets = []
+        with open(OUT_CHUNKS, "rb") as f:
+            pos = 0
+            for line in f:
+                self.offsets.append(pos)
+                pos += len(line)
+        if len(self.offsets) != len(self.ids) or len(self.row_by_vid) != len(self.ids):
+            raise ValueError("chunks.jsonl y vector_ids.npy no están alineados")
+        if os.path.getsize(OUT_VECTORS) != len(self.ids) * self.dim * 4:
+            raise ValueError("vectors.f32 no tiene el tamaño esperado")
+        self.vectors = (np.memmap(OUT_VECTORS, dtype="float32", mode="r", shape=(len(self.ids), self.dim))
+                        if len(self.ids) else np.zeros((0, self.dim), "float32"))
+        self._fh = open(OUT_CHUNKS, "rb")
+
+    def raw_line(self, vid) -> bytes:
+        self._fh.seek(self.offsets[self.row_by_vid[vid]])
+        return self._fh.readline()
+
+    def chunk(self, vid) -> dict:
+        return json.loads(self.raw_line(vid))
+
+    def vector(self, vid):
+        return self.vectors[self.row_by_vid[vid]]
+
+    def close(self):
+        self._fh.close()
+
+def load_state():
+    """
+    Estado de la ejecución anterior o None si no existe o no es coherente
+    (en ese caso se reconstruye todo).
+    """
+    try:
+        with open(OUT_MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            print("[INFO] Manifest de una versión anterior; se reconstruye todo.")
+            return None
+        return PreviousCorpus(manifest)
+    except FileNotFoundError:
+        return None
+    except (KeyError, ValueError, OSError) as e:
+        print(f"[WARN] Estado anterior no válido ({e}); se reconstruye todo.")
+        return None
+
+class CorpusWriter:
+    """
+    Escribe chunks.jsonl, vectors.f32 y vector_ids.npy en .tmp según llegan los
+    chunks, manteniendo el orden de los documentos. Los chunks nuevos se acumulan
+    hasta completar un batch del encoder; mientras tanto, los reutilizados que
+    vienen detrás esperan en la cola para no desordenar las líneas. Cada línea
+    escrita alimenta también los metadatos del sidecar y el índice BM25.
+    """
+
+    def __init__(self, embed_batch, encode, on_new_vectors=None):
+        self.embed_batch = max(1, embed_batch)
+        self.encode = encode
+        self.on_new_vectors = on_new_vectors
+        self.queue = []      # [(vid, raw_line | chunk_dict, vector | None)]
+        self.n_pending = 0
+        self.ids = []
+        self.dim = None
+        self.meta = ChunkMetaBuilder()
+        self.bm25 = BM25Builder()
+        self._chunks = open(_tmp(OUT_CHUNKS), "wb")
+        self._vectors = open(_tmp(OUT_VECTORS), "wb")
+
+    def add_reused(self, vid, raw_line: bytes, vec):
+        if self.n_pending:
+            self.queue.append((vid, raw_line, vec))
+        else:
+            self._write(vid, raw_line, vec)
+
+    def add_new(self, chunk: dict):
+        self.queue.append((chunk["vid"], chunk, None))
+        self.n_pending += 1
+        if self.n_pending >= self.embed_batch:
+            self.flush()
+
+    def flush(self):
+        if not self.queue:
+            return
+        new = [(i, item[1]) for i, item in enumerate(self.queue) if item[2] is None]
+        if new:
+            embs = np.asarray(self.encode([c["text"] for _, c in new]), dtype="float32")
+            for (i, c), e in zip(new, embs):
+                self.queue[i] = (c["vid"], c, e)
+            if self.on_new_vectors:
+                self.on_new_vectors(embs, [c["vid"] for _, c in new])
+        for vid, payload, vec in self.queue:
+            self._write(vid, payload, vec)
+        self.queue = []
+        self.n_pending = 0
+
+    def _write(self, vid, payload, vec):
+        if isinstance(payload, dict):
+            chunk = payload
+            payload = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        else:
+            chunk = json.loads(payload)
+        self._chunks.write(payload)
+        self.meta.add(chunk, len(payload))
+        self.bm25.add(chunk["text"])
+        vec = np.asarray(vec, dtype="float32")
+        self.dim = vec.shape[0]
+        self._vectors.write(vec.tobytes())
+        self.ids.append(vid)
+
+    def close(self):
+        self.flush()
+        self._chunks.close()
+        self._vectors.close()
+        with open(_tmp(OUT_VECTOR_IDS), "wb") as f:
+            np.save(f, np.array(self.ids, dtype="int64"))
+
+    def commit(self):
+        for path in (OUT_VECTORS, OUT_VECTOR_IDS, OUT_CHUNKS):
+            os.replace(_tmp(path), path)
 
 def main():
-    docs = read_documents()
-    all_chunks = []
-    for doc in docs:
-        chunks = chunk_text(doc["text"])
-        for ch in chunks:
-            all_chunks.append({
-                "text": ch,
-                "metadata": {
-                    "source": doc["source"]
-                }
-            })
-
-    print(f"Total chunks: {len(all_chunks)}")
-
-    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    texts = [c["text"] for c in all_chunks]
-    embs = model.encode(texts, batch_size=32, show_progress_bar=True)
-    embs = np.array(embs).astype("float32")
-
-    dim = embs.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(embs)
+    args = parse_args()
+    t0 = time.perf_counter()
+    index_request = rag_index.make_config(
+        args.index_type, args.metric,
+        hnsw_m=args.hnsw_m, ef_construction=args.ef_construction, ef_search=args.ef_search,
+        ivf_nlist=args.ivf_nlist, pq_m=args.pq_m, pq_nbits=args.pq_nbits, nprobe=args.nprobe,
+    )
+
+    docs = list(iter_documents())
+    prev = None if args.full else load_state()
+    if prev and prev.manifest.get("embedding") != embedding_signature():
+        print("[INFO] Cambió el modelo o el troceado; se re-embebe todo.")
+        prev = None
+    prev_docs = prev.manifest["docs"] if prev else {}
+    next_vid = prev.manifest["next_vid"] if prev else 0
+
+    # índice: actualización in situ si la config no cambió y el tipo lo permite;
+    # si no, se reconstruye al final con los vectores escritos (sin re-embeber)
+    index, cfg = None, None
+    if prev and prev.manifest.get("index") == index_request and os.path.exists(OUT_INDEX):
+        cfg = rag_index.load_config(OUT_INDEX)
+        if rag_index.supports_remove(cfg):
+            index = faiss.read_index(OUT_INDEX)
+            if index.ntotal != len(prev.ids):
+                print("[WARN] El índice no coincide con el manifest; se reconstruye.")
+                index = None
+
+    model = None
+    def encode(texts):
+        nonlocal model
+        if model is None:
+            model = SentenceTransformer(MODEL_NAME)
+        return model.encode(texts, batch_size=32, show_progress_bar=False)
+
+    added_ids = []
+    def add_to_index(embs, vids):
+        added_ids.extend(vids)
+        if index is not None:
+            index.add_with_ids(rag_index.prepare_queries(embs, cfg), np.asarray(vids, dtype="int64"))
+
+    writer = CorpusWriter(args.embed_batch, encode, on_new_vectors=add_to_index)
+    docs_manifest = {}
+    stats = {"unchanged": 0, "changed": 0, "added": 0, "removed": 0, "chunks_reused": 0}
+
+    to_chunk = [d for d in docs if prev_docs.get(d["source"], {}).get("sha256") != d["sha256"]]
+    workers = max(1, min(args.workers, len(to_chunk)))
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        chunked = ordered_map(pool, chunk_document, [d["path"] for d in to_chunk], window=workers * 4)
+        for doc in docs:
+            prev_doc = prev_docs.get(doc["source"])
+            if prev_doc and prev_doc["sha256"] == doc["sha256"]:
+                for v in prev_doc["chunk_ids"]:
+                    writer.add_reused(v, prev.raw_line(v), prev.vector(v))
+                docs_manifest[doc["source"]] = prev_doc
+                stats["unchanged"] += 1
+                stats["chunks_reused"] += len(prev_doc["chunk_ids"])
+                continue
+
+            stats["changed" if prev_doc else "added"] += 1
+            # en un documento modificado se reutilizan los chunks de texto idéntico
+            reusable = {}
+            for v in (prev_doc["chunk_ids"] if prev_doc else []):
+                reusable.setdefault(prev.chunk(v)["text"], []).append(v)
+
+            vids = []
+            for text in next(chunked):
+                if reusable.get(text):
+                    v = reusable[text].pop(0)
+                    writer.add_reused(v, prev.raw_line(v), prev.vector(v))
+                    stats["chunks_reused"] += 1
+                else:
+                    v, next_vid = next_vid, next_vid + 1
+                    writer.add_new({"vid": v, "text": text, "metadata": {"source": doc["source"]}})
+                vids.append(v)
+            docs_manifest[doc["source"]] = {"sha256": doc["sha256"], "chunk_ids": vids}
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    writer.close()
+
+    stats["removed"] = sum(1 for src in prev_docs if src not in docs_manifest)
+    kept = set(writer.ids)
+    removed_vids = [int(v) for v in prev.ids if int(v) not in kept] if prev else []
+    if prev:
+        prev.close()
+    print(f"[INFO] Documentos: {stats['unchanged']} sin cambios, {stats['changed']} modificados, "
+          f"{stats['added']} nuevos, {stats['removed']} eliminados")
+    print(f"Total chunks: {len(writer.ids)} ({stats['chunks_reused']} reutilizados, {len(added_ids)} embebidos, "
+          f"{len(removed_vids)} obsoletos)")
+
+    dim = writer.dim or (prev.dim if prev else 0)
+    if index is not None:
+        cfg = rag_index.update_index(index, cfg, removed_vids, np.zeros((0, dim), "float32"), [])
+        rag_index.apply_search_params(index, cfg)
+        mode = "actualizado"
+    else:
+        mat = np.memmap(_tmp(OUT_VECTORS), dtype="float32", mode="r", shape=(len(writer.ids), dim))
+        index, cfg = rag_index.build_index(mat, index_request, ids=writer.ids, batch_size=args.embed_batch)
+        del mat
+        mode = "reconstruido"
+    cfg["model"] = MODEL_NAME
 
     os.makedirs(os.path.dirname(OUT_INDEX), exist_ok=True)
-    faiss.write_index(index, OUT_INDEX)
-    with open(OUT_CHUNKS, "w", encoding="utf-8") as f:
-        for c in all_chunks:
-            f.write(json.dumps(c, ensure_ascii=False) + "\n")
+    faiss.write_index(index, _tmp(OUT_INDEX))
+    os.replace(_tmp(OUT_INDEX), OUT_INDEX)
+    rag_index.save_config(OUT_INDEX, cfg)
+    writer.commit()
+    # metadatos precalculados para que RAGClient no tenga que reparsear el JSONL,
+    # e índice BM25 para la recuperación híbrida (ambos se firman con el
+    # chunks.jsonl ya renombrado)
+    write_chunk_sidecar(OUT_CHUNKS, writer.meta.meta())
+    write_bm25_index(OUT_CHUNKS, writer.bm25.build())
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "embedding": embedding_signature(),
+        "index": index_request,
+        "dim": dim,
+        "next_vid": next_vid,
+        "docs": docs_manifest,
+    }
+    with open(_tmp(OUT_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(_tmp(OUT_MANIFEST), OUT_MANIFEST)
 
-    print("Índice RAG construido y guardado en:")
-    print(f"  {OUT_INDEX}")
+    print(f"Índice RAG {mode} en {time.perf_counter() - t0:.1f}s y guardado en:")
+    print(f"  {OUT_INDEX} ({cfg['index_type']}, métrica {cfg['metric']}, {cfg['ntotal']} vectores)")
+    print(f"  {rag_index.config_path(OUT_INDEX)}")
     print(f"  {OUT_CHUNKS}")
+    print(f"  {bm25_path(OUT_CHUNKS)}")
+    print(f"  {OUT_MANIFEST}")
 
 if __name__ == "__main__":
     main()
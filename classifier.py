@@ -1,14 +1,28 @@
 # classifier.py
 import json
-from llm_client import call_ollama
+import os
+from llm_client import OllamaClient
 from rag_client import RAGClient
 from prompts import build_prompt_without_context, build_prompt_with_context
 
 rag_client = RAGClient()
 
+ollama = OllamaClient(
+    os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate"),
+    model=os.getenv("OLLAMA_MODEL", "llama3.2:3b-instruct-q4_K_M"),
+)
+
+# métricas de cada llamada (latencia, tokens de prompt / salida), en orden
+llm_stats = []
+
+def _generate(prompt):
+    res = ollama.generate(prompt)
+    llm_stats.append(res.stats())
+    return res.text
+
 def classify_columns_without_rag(columns):
     prompt = build_prompt_without_context(columns)
-    raw = call_ollama(prompt)
+    raw = _generate(prompt)
     return json.loads(raw)  # aquí puedes envolver en try/except y validar
 
 def build_retrieval_query(columns):
@@ -26,7 +40,7 @@ def classify_columns_with_rag(columns, k=5):
     query = build_retrieval_query(columns)
     ctx = rag_client.retrieve_context(query, k=k)
     prompt = build_prompt_with_context(columns, ctx)
-    raw = call_ollama(prompt)
+    raw = _generate(prompt)
     return json.loads(raw), ctx
 
 
@@ -0,0 +1,75 @@
+# column_groups.py
+"""
+Clasificación por bloques de columnas para tablas anchas.
+
+Con todas las columnas en un solo prompt, en tablas anchas el modelo corta la
+respuesta antes de llegar a num_cols items y las últimas columnas acaban como
+sin_prediccion_por_falta_de_items. Aquí se reparten las columnas de una tabla
+en bloques consecutivos:
+
+  - por nº máximo de columnas (--chunk_columns), en bloques equilibrados
+  - por presupuesto de tokens: se cierra un bloque cuando el coste de sus
+    columnas (línea de esquema + evidencia) supera el presupuesto
+
+Cada bloque lleva una nota con su posición y las claves (PK / FK) de la tabla
+que quedan fuera de él, para que el modelo no pierda el contexto relacional.
+Los bloques se clasifican como peticiones independientes y los items se
+cosen en el orden de las columnas.
+"""
+import math
+
+
+def split_columns(columns, max_cols: int = 0, col_cost=None, budget: int = 0):
+    """
+    Rangos [(inicio, fin)] de columnas consecutivas. Sin max_cols ni budget
+    hay un único bloque con toda la tabla (ninguno si no hay columnas).
+    col_cost(columna) → tokens.
+    """
+    n = len(columns)
+    if n == 0:
+        return []  # tabla sin columnas pendientes (p.ej. todas preclasificadas): sin petición
+    cuts = set()
+    if max_cols and n > max_cols:
+        # k bloques del mismo tamaño (n // k o n // k + 1) en vez de uno pequeño al final
+        k = math.ceil(n / max_cols)
+        cuts = {round(i * n / k) for i in range(1, k)}
+    groups, start, used = [], 0, 0
+    for i, c in enumerate(columns):
+        cost = col_cost(c) if (budget and col_cost) else 0
+        full = (i in cuts and i > start) or (budget and i > start and used + cost > budget)
+        if full:
+            groups.append((start, i))
+            start, used = i, 0
+        used += cost
+    groups.append((start, n))
+    return groups
+
+
+def key_marks(c) -> str:
+    marks = []
+    if c.get("is_pk"):
+        marks.append("PK")
+    if c.get("is_fk"):
+        marks.append(f"FK → {c['fk_ref']}" if c.get("fk_ref") else "FK")
+    return ", ".join(marks)
+
+
+def group_note(columns, start: int, stop: int, n_groups: int, gi: int):
+    """
+    Líneas de contexto de un bloque: qué columnas de la tabla son y qué claves
+    (PK / FK) hay fuera de él. Con un único bloque no hay nota.
+    """
+    if n_groups <= 1:
+        return []
+    lines = [f"Bloque {gi + 1}/{n_groups}: columnas {start + 1}-{stop} de {len(columns)} de la tabla "
+             f"(el Esquema solo lista las de este bloque)."]
+    keys = [f"{c['name']} [{key_marks(c)}]" for i, c in enumerate(columns)
+            if (c.get("is_pk") or c.get("is_fk")) and not start <= i < stop]
+    if keys:
+        lines.append(f"Claves de la tabla fuera de este bloque (solo contexto, no se clasifican aquí): {'; '.join(keys)}")
+    return lines
+
+
+def group_label(t: str, n_groups: int, gi: int) -> str:
+    """Nombre de la tabla (o del bloque) en los logs e informes."""
+    return t if n_groups <= 1 else f"{t}#{gi + 1}/{n_groups}"
@@ -0,0 +1,244 @@
+# constrained_output.py
+"""
+Salida JSON restringida para las respuestas de clasificación.
+
+El parseo de auto_request_*.py (json.loads y, si falla, rescate de objetos
+{...} con regex) deja filas sin_prediccion_* cada vez que el modelo se sale
+del formato. Aquí se define el formato de respuesta como un JSON schema
+(items_schema) que se usa en los dos caminos:
+
+  - Ollama: se pasa tal cual en "format" (salidas estructuradas; Ollama lo
+    compila a una gramática y solo muestrea tokens que la respetan)
+  - MLX:    ItemsGrammar es un autómata por caracteres para ese mismo schema
+            y GrammarLogitsProcessor enmascara en cada paso los logits de los
+            tokens que lo romperían (logits_processors de mlx_lm)
+
+El schema fija el enum de categorías, el nº exacto de items (uno por columna)
+y una longitud máxima de rationale, que además recorta los tokens generados.
+Solo se admite el subconjunto de JSON schema que genera items_schema.
+"""
+import re
+
+CATEGORIES = ("identificador_directo", "cuasi_identificador", "atributo_sensible", "no_sensible")
+RATIONALE_MAX_CHARS = 160
+
+# candidatos (por logit) que se comprueban contra la gramática antes de recorrer el vocabulario
+TOP_K_CANDIDATES = 64
+
+
+def items_schema(n_items: int, rationale_max: int = RATIONALE_MAX_CHARS, names=None) -> dict:
+    """
+    Schema de {"items": [...]} con exactamente n_items elementos. Con `names`
+    cada item lleva además "name" restringido a esos nombres de columna.
+    """
+    props = {}
+    if names:
+        props["name"] = {"type": "string", "enum": list(dict.fromkeys(names))}
+    props["category"] = {"type": "string", "enum": list(CATEGORIES)}
+    props["rationale"] = {"type": "string", "maxLength": rationale_max}
+    props["confidence"] = {"type": "number", "minimum": 0, "maximum": 1}
+    item = {"type": "object", "properties": props, "required": list(props)}
+    return {
+        "type": "object",
+        "properties": {
+            "items": {"type": "array", "items": item, "minItems": n_items, "maxItems": n_items},
+        },
+        "required": ["items"],
+    }
+
+
+# ---------- gramática por caracteres (MLX) ----------
+
+# confianza en [0, 1] con hasta 3 decimales
+_NUM_PREFIX = re.compile(r"(0(\.\d{0,3})?|1(\.0{0,3})?)?")
+_NUM_FULL = re.compile(r"0|1|0\.\d{1,3}|1\.0{1,3}")
+
+
+class ItemsGrammar:
+    """
+    Autómata del JSON compacto (sin espacios fuera de las cadenas) que describe
+    items_schema:  {"items":[{"category":"...","rationale":"...","confidence":0.9},...]}
+    Los estados son tuplas inmutables: comprobar un token es avanzar una copia
+    carácter a carácter (advance_text) y quedarse con el resultado si no es None.
+    """
+
+    def __init__(self, schema: dict):
+        arr = schema["properties"]["items"]
+        self.min_items = arr.get("minItems", 1)
+        self.max_items = arr.get("maxItems", self.min_items)
+        # partes de un item: literales entre propiedades + valores
+        parts = []
+        for i, (name, spec) in enumerate(arr["items"]["properties"].items()):
+            parts.append(("lit", ("{" if i == 0 else ",") + f'"{name}":'))
+            if "enum" in spec:
+                parts.append(("enum", tuple(spec["enum"])))
+            elif spec.get("type") == "string":
+                parts.append(("str", spec.get("maxLength", RATIONALE_MAX_CHARS)))
+            else:
+                parts.append(("num", None))
+        parts.append(("lit", "}"))
+        self.parts = parts
+        self.head = '{"items":['
+        self.tail = "]}"
+
+    # estado: (fase, nº de items cerrados, parte, sub)
+    #   fase "head"/"tail": sub = caracteres del literal ya vistos
+    #   fase "item": parte actual del item; sub según el tipo de parte
+    #   fase "sep": tras un item, "," o "]"
+    #   fase "done": JSON completo
+    def initial(self):
+        return ("head", 0, 0, 0)
+
+    def is_done(self, state) -> bool:
+        return state[0] == "done"
+
+    def _enter(self, n, p):
+        if p == len(self.parts):
+            return ("sep", n + 1, 0, None)
+        kind = self.parts[p][0]
+        sub = {"lit": 0, "enum": "", "str": -1, "num": ""}[kind]
+        return ("item", n, p, sub)
+
+    def advance(self, state, ch):
+        phase, n, p, sub = state
+        if phase == "head":
+            if ch != self.head[sub]:
+                return None
+            return ("head", 0, 0, sub + 1) if sub + 1 < len(self.head) else self._enter(0, 0)
+        if phase == "sep":
+            if ch == "," and n < self.max_items:
+                return self._enter(n, 0)
+            if ch == "]" and n >= self.min_items:
+                return ("tail", n, 0, 1)
+            return None
+        if phase == "tail":
+            if ch != self.tail[sub]:
+                return None
+            return ("tail", n, 0, sub + 1) if sub + 1 < len(self.tail) else ("done", n, 0, None)
+        if phase == "done":
+            return None
+
+        kind, arg = self.parts[p]
+        if kind == "lit":
+            if ch != arg[sub]:
+                return None
+            return ("item", n, p, sub + 1) if sub + 1 < len(arg) else self._enter(n, p + 1)
+        if kind == "enum":
+            # sub: '"' + lo escrito del valor ("" antes de la comilla de apertura)
+            text = sub + ch
+            if text == '"':
+                return ("item", n, p, text)
+            if not text.startswith('"'):
+                return None
+            value = text[1:]
+            if value.endswith('"') and value[:-1] in arg:
+                return self._enter(n, p + 1)
+            if any(v.startswith(value) for v in arg):
+                return ("item", n, p, text)
+            return None
+        if kind == "str":
+            # sub: nº de caracteres del valor (-1 antes de la comilla de apertura)
+            if sub < 0:
+                return ("item", n, p, 0) if ch == '"' else None
+            if ch == '"':
+                return self._enter(n, p + 1)
+            if ch == "\\" or ord(ch) < 0x20 or sub >= arg:
+                return None
+            return ("item", n, p, sub + 1)
+        # num
+        text = sub + ch
+        if _NUM_PREFIX.fullmatch(text):
+            return ("item", n, p, text)
+        if _NUM_FULL.fullmatch(sub):
+            return self.advance(self._enter(n, p + 1), ch)
+        return None
+
+    def advance_text(self, state, text: str):
+        for ch in text:
+            state = self.advance(state, ch)
+            if state is None:
+                return None
+        return state
+
+    def valid_text(self, text: str) -> bool:
+        """True si `text` es un JSON completo que cumple la gramática."""
+        state = self.advance_text(self.initial(), text)
+        return state is not None and self.is_done(state)
+
+
+# ---------- logits processor (mlx_lm) ----------
+
+_token_texts_cache = {}
+
+
+def token_texts(tokenizer):
+    """
+    Texto de cada id del vocabulario (decodificado suelto) y un índice por
+    primer carácter. Se calcula una vez por tokenizer.
+    """
+    key = id(tokenizer)
+    if key not in _token_texts_cache:
+        size = getattr(tokenizer, "vocab_size", None) or len(tokenizer.get_vocab())
+        texts = [tokenizer.decode([i]) for i in range(size)]
+        by_first = {}
+        for i, t in enumerate(texts):
+            if t:
+                by_first.setdefault(t[0], []).append(i)
+        _token_texts_cache[key] = (texts, by_first)
+    return _token_texts_cache[key]
+
+
+class GrammarLogitsProcessor:
+    """
+    logits_processor de mlx_lm.generate: (tokens, logits) → logits con -inf en
+    los tokens que romperían la gramática. Primero se prueban los TOP_K_CANDIDATES
+    de mayor logit (casi siempre hay alguno válido); si ninguno vale, se
+    recorren los tokens del vocabulario que empiezan por un carácter posible.
+    Con el JSON completo solo se permite EOS.
+    """
+
+    def __init__(self, grammar: ItemsGrammar, tokenizer, eos_ids):
+        self.grammar = grammar
+        self.texts, self.by_first = token_texts(tokenizer)
+        self.eos_ids = list(eos_ids)
+        self.state = grammar.initial()
+        self.n_prompt = None
+
+    def _consume(self, token_id: int):
+        nxt = self.grammar.advance_text(self.state, self.texts[token_id]) if token_id < len(self.texts) else None
+        if nxt is not None:
+            self.state = nxt
+
+    def _allowed(self, scores):
+        if self.grammar.is_done(self.state):
+            return self.eos_ids
+        import numpy as np
+
+        k = min(TOP_K_CANDIDATES, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        ok = [int(i) for i in top
+              if i < len(self.texts) and self.texts[i]
+              and self.grammar.advance_text(self.state, self.texts[i]) is not None]
+        if ok:
+            return ok
+        ok = [i for ch, ids in self.by_first.items() if self.grammar.advance(self.state, ch) is not None
+              for i in ids if self.grammar.advance_text(self.state, self.texts[i]) is not None]
+        # sin ningún token posible (vocabulario raro): se deja terminar antes que devolver todo a -inf
+        return ok or self.eos_ids
+
+    def __call__(self, tokens, logits):
+        import mlx.core as mx
+        import numpy as np
+
+        n = int(tokens.size) if hasattr(tokens, "size") else len(tokens)
+        if self.n_prompt is None:
+            self.n_prompt = n
+        elif n > self.n_prompt:
+            # el token muestreado en el paso anterior
+            self._consume(int(tokens[-1].item() if hasattr(tokens[-1], "item") else tokens[-1]))
+            self.n_prompt = n
+
+        scores = np.array(logits[0], dtype="float32")
+        mask = np.full(scores.shape, -np.inf, dtype="float32")
+        mask[self._allowed(scores)] = 0.0
+        return logits + mx.array(mask)[None, :]
@@ -66,7 +66,13 @@ def build_alias_map(canon_map, aliases_dict):
     return alias_to_canon
 
 # ----------- Evaluación SOLO categoría ----------
-def evaluate_categories_only(predictions_path, canon_map, alias_map, exclude_unmapped=True):
+def evaluate_categories_only(predictions_path, canon_map, alias_map, exclude_unmapped=True,
+                             include_preclassified=False):
+    """
+    Los items con "preclassified" (resueltos por reglas de preclassifier.py, no
+    por el modelo) se puntúan aparte en report["preclassified"] y no entran en
+    las métricas principales, salvo con include_preclassified=True.
+    """
     with open(predictions_path, encoding="utf-8") as f:
         data = json.load(f)
     items = data.get("items", [])
@@ -75,12 +81,14 @@ def evaluate_categories_only(predictions_path, canon_map, alias_map, exclude_unm
     rows = []
     unmapped, badcat = [], []
     unmapped_rows = []
+    pre_correct, pre_by_rule = 0, Counter()
 
     for it in items:
         raw_name = it.get("name","")
         raw_cat  = it.get("category","")
         raw_risk = it.get("risk","")
         raw_treat= it.get("recommended_treatment","")
+        rule     = it.get("preclassified") or ""
 
         norm = normalize_text(raw_name)
         canon = alias_map.get(norm)
@@ -100,7 +108,8 @@ def evaluate_categories_only(predictions_path, canon_map, alias_map, exclude_unm
                 "risk_info": raw_risk,
                 "recommended_treatment_info": raw_treat,
                 "correct": "",
-                "in_eval": False
+                "in_eval": False,
+                "preclassified": rule
             }
             rows.append(row)
             unmapped_rows.append(row)
@@ -113,7 +122,8 @@ def evaluate_categories_only(predictions_path, canon_map, alias_map, exclude_unm
             badcat.append((raw_name, raw_cat))
             pred = "no_sensible"  # fallback
 
-        # fila normal (mapeada)
+        # fila normal (mapeada); las preclasificadas van aparte salvo que se pidan
+        in_eval = include_preclassified or not rule
         row = {
             "name_input": raw_name,
             "name_canonical": canon,
@@ -122,9 +132,15 @@ def evaluate_categories_only(predictions_path, canon_map, alias_map, exclude_unm
             "risk_info": raw_risk,
             "recommended_treatment_info": raw_treat,
             "correct": pred == gold,
-            "in_eval": True
+            "in_eval": in_eval,
+            "preclassified": rule
         }
         rows.append(row)
+        if rule:
+            pre_by_rule[rule] += 1
+            pre_correct += pred == gold
+        if not in_eval:
+            continue
 
         # solo añadimos a métricas si está mapeado
         if not exclude_unmapped or canon is not None:
@@ -162,6 +178,13 @@ def evaluate_categories_only(predictions_path, canon_map, alias_map, exclude_unm
         "per_class": per_class,
         "confusion_matrix": conf,
         "unmapped_columns": sorted(set(unmapped)),
+        "preclassified": {
+            "n_evaluated": sum(pre_by_rule.values()),
+            "n_correct": pre_correct,
+            "accuracy": round(pre_correct/sum(pre_by_rule.values()),4) if pre_by_rule else 0.0,
+            "by_rule": dict(pre_by_rule),
+            "in_main_metrics": include_preclassified,
+        },
         "invalid_categories": badcat,
         "rows": rows,                        # todos (mapeados + unmapped)
         "unmapped_rows": unmapped_rows       # solo unmapped
@@ -175,7 +198,13 @@ def print_stdout(report):
     excl = len(report["unmapped_rows"])
     total_items = len(report["rows"])
     pct = (excl/total_items*100) if total_items else 0
-    print(f"Excluidas (sin GT): {excl} de {total_items}  ({pct:.1f}%)\n")
+    print(f"Excluidas (sin GT): {excl} de {total_items}  ({pct:.1f}%)")
+    pre = report["preclassified"]
+    if pre["n_evaluated"]:
+        where = "incluidas arriba" if pre["in_main_metrics"] else "excluidas de las métricas del modelo"
+        print(f"Preclasificadas por reglas (con GT, {where}): {pre['n_evaluated']}  |  "
+              f"Aciertos: {pre['n_correct']}  |  Accuracy: {pre['accuracy']:.4f}  |  {pre['by_rule']}")
+    print()
 
     print("F1/Prec/Rec por clase:")
     for lab, m in report["per_class"].items():
@@ -222,7 +251,7 @@ def print_stdout(report):
 def export_rows_csv(rows, path):
     with open(path, "w", newline="", encoding="utf-8") as f:
         fieldnames = ["name_input","name_canonical","pred_category","gold_category",
-                      "risk_info","recommended_treatment_info","correct","in_eval"]
+                      "risk_info","recommended_treatment_info","correct","in_eval","preclassified"]
         wr = csv.DictWriter(f, fieldnames=fieldnames)
         wr.writeheader()
         wr.writerows(rows)
@@ -236,6 +265,9 @@ def export_metrics_csv(report, path):
         wr.writerow(["n_evaluated","all",report["n_evaluated"]])
         wr.writerow(["n_correct","all",report["n_correct"]])
         wr.writerow(["accuracy","all",report["accuracy"]])
+        pre = report["preclassified"]
+        wr.writerow(["n_preclassified","all",pre["n_evaluated"]])
+        wr.writerow(["accuracy_preclassified","all",pre["accuracy"]])
         for lab, m in report["per_class"].items():
             wr.writerow(["precision",lab,m["precision"]])
             wr.writerow(["recall",lab,m["recall"]])
@@ -252,12 +284,16 @@ def main():
     ap.add_argument("--out_rows_csv", default=None, help="CSV con resultados fila a fila (si no se pasa, usa <db_name>-resultados_fila_a_fila.csv si db_name)")
     ap.add_argument("--out_metrics_csv", default=None, help="CSV con métricas (si no se pasa, usa <db_name>-metricas.csv si db_name)")
     ap.add_argument("--out_unmapped_csv", default=None, help="CSV con filas sin GT (excluidas de métricas)")
+    ap.add_argument("--include_preclassified", action="store_true",
+                    help="puntuar junto al modelo los items resueltos por reglas (--preclassify); "
+                         "por defecto se informan aparte")
     args = ap.parse_args()
 
     canon = load_canonical(args.canonical_csv)
     aliases = load_aliases(args.aliases_json)
     alias_map = build_alias_map(canon, aliases)
-    report = evaluate_categories_only(args.predictions, canon, alias_map, exclude_unmapped=True)
+    report = evaluate_categories_only(args.predictions, canon, alias_map, exclude_unmapped=True,
+                                      include_preclassified=args.include_preclassified)
 
     # nombres auto si no se pasan y hay db_name
     if args.db_name:
@@ -0,0 +1,134 @@
+# llm_cache.py
+"""
+Caché en disco (SQLite) de respuestas del LLM por tabla.
+
+Dos tipos de clave:
+  - prompt: hash del prompt final + modelo + adapter (exacta: cualquier cambio en
+            muestras, estadísticas o contexto RAG invalida la entrada)
+  - schema: huella del esquema de la tabla (nombres, tipos y marcas PK/FK de
+            info["columns"]) + modelo + adapter; se comprueba ANTES de construir
+            el prompt, así que una tabla sin cambios se salta RAG y LLM
+
+Expulsión por TTL (created + ttl_s) y por tamaño (se borran las menos usadas
+recientemente por encima de max_entries). Contadores de aciertos / fallos.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+CACHE_KEY_MODES = ("prompt", "schema")
+
+
+def _sha256(obj) -> str:
+    raw = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def prompt_key(prompt: str, model: str, adapter_path: str | None = None) -> str:
+    return "p:" + _sha256({"prompt": prompt, "model": model, "adapter": adapter_path})
+
+
+def schema_fingerprint(columns) -> list:
+    """Lo que define el esquema de una tabla a efectos de clasificación."""
+    return [
+        [c["name"], c.get("mysql_column_type"), bool(c.get("is_pk")), bool(c.get("is_fk"))]
+        for c in columns
+    ]
+
+
+def schema_key(table: str, columns, model: str, adapter_path: str | None = None) -> str:
+    return "s:" + _sha256({
+        "table": table,
+        "schema": schema_fingerprint(columns),
+        "model": model,
+        "adapter": adapter_path,
+    })
+
+
+class LLMCache:
+    def __init__(self, path: str, ttl_s: float | None = 30 * 86400, max_entries: int | None = 10000):
+        self.path = path
+        self.ttl_s = ttl_s if ttl_s and ttl_s > 0 else None
+        self.max_entries = max_entries if max_entries and max_entries > 0 else None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key       TEXT PRIMARY KEY,
+                value     TEXT NOT NULL,
+                created   REAL NOT NULL,
+                last_used REAL NOT NULL,
+                n_hits    INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache(last_used)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM llm_cache WHERE key=?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl_s and now - row[1] > self.ttl_s):
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET last_used=?, n_hits=n_hits+1 WHERE key=?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, value, created, last_used, n_hits) VALUES (?,?,?,?,0)",
+                (key, value, now, now),
+            )
+            self._conn.commit()
+            self.writes += 1
+
+    def evict(self):
+        """Aplica TTL y tamaño máximo. Devuelve el nº de entradas borradas."""
+        removed = 0
+        with self._lock:
+            if self.ttl_s:
+                cur = self._conn.execute(
+                    "DELETE FROM llm_cache WHERE created < ?", (time.time() - self.ttl_s,)
+                )
+                removed += cur.rowcount
+            if self.max_entries:
+                n = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+                if n > self.max_entries:
+                    cur = self._conn.execute(
+                        "DELETE FROM llm_cache WHERE key IN "
+                        "(SELECT key FROM llm_cache ORDER BY last_used ASC LIMIT ?)",
+                        (n - self.max_entries,),
+                    )
+                    removed += cur.rowcount
+            self._conn.commit()
+        self.evicted += removed
+        return removed
+
+    def summary(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "writes": self.writes,
+            "evicted": self.evicted,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,18 +1,251 @@
 # llm_client.py
+import json
+import threading
+import time
+from dataclasses import dataclass, asdict
+
 import requests
+from requests.adapters import HTTPAdapter
+
+# errores transitorios que merece la pena reintentar
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# con el JSON ya cerrado, nº de trozos en blanco seguidos tras los que se corta el stream
+TRAILING_WS_LIMIT = 16
+
+
+@dataclass
+class LLMResult:
+    """
+    Texto generado + métricas de la llamada (las de Ollama vienen en ns y se pasan a s).
+    latency_s y ttft_s son del intento que respondió; el tiempo de los intentos
+    fallidos y las pausas de backoff van aparte (retry_s, backoff_s).
+    """
+    text: str
+    latency_s: float
+    ttft_s: float | None = None
+    prompt_eval_count: int | None = None
+    eval_count: int | None = None
+    prompt_eval_s: float | None = None
+    eval_s: float | None = None
+    load_s: float | None = None
+    attempts: int = 1
+    retry_s: float = 0.0
+    backoff_s: float = 0.0
+    cached: bool = False
+
+    def stats(self) -> dict:
+        d = asdict(self)
+        d.pop("text")
+        return d
+
+
+class _JSONAssembler:
+    """
+    Va acumulando los trozos de un stream y detecta cuándo se ha cerrado el
+    objeto JSON de primer nivel (profundidad 0 fuera de strings), para poder
+    cortar el stream sin esperar al espacio en blanco final que a veces emite
+    el modelo con format=json.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.depth = 0
+        self.started = False
+        self.in_str = False
+        self.escape = False
+        self.complete = False
+
+    def feed(self, piece: str):
+        self.parts.append(piece)
+        if self.complete:
+            return
+        for ch in piece:
+            if self.in_str:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_str = False
+                continue
+            if ch == '"':
+                self.in_str = True
+            elif ch in "{[":
+                self.depth += 1
+                self.started = True
+            elif ch in "}]":
+                self.depth -= 1
+                if self.started and self.depth == 0:
+                    self.complete = True
+                    return
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+class OllamaClient:
+    """
+    Cliente reutilizable de Ollama (/api/generate):
+    - sesión HTTP con pool de conexiones y keep-alive (no se paga TCP por llamada)
+    - streaming opcional con ensamblado incremental del JSON (permite medir TTFT)
+    - reintentos con backoff exponencial ante errores de conexión / 5xx / 429
+    - devuelve LLMResult con latencia y nº de tokens de prompt y de salida
+    Se puede compartir entre hilos.
+    """
+
+    def __init__(self, ollama_url: str, model: str | None = None, timeout: int = 180,
+                 stream: bool = False, retries: int = 2, backoff_s: float = 1.0,
+                 pool_size: int = 8, keep_alive: str | None = "10m", format="json"):
+        self.ollama_url = ollama_url
+        self.model = model
+        self.timeout = timeout
+        self.stream = stream
+        self.retries = max(0, retries)
+        self.backoff_s = backoff_s
+        self.keep_alive = keep_alive
+        self.format = format
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def _payload(self, prompt, model, stream, format, options):
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": stream,
+        }
+        fmt = self.format if format is None else format
+        if fmt:
+            payload["format"] = fmt
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive  # mantiene el modelo cargado entre llamadas
+        if options:
+            payload["options"] = options
+        return payload
+
+    def _post_once(self, payload, t0) -> LLMResult:
+        if not payload["stream"]:
+            resp = self.session.post(self.ollama_url, json=payload, timeout=self.timeout)
+            resp.raise_for_status()
+            data = resp.json()
+            return _result_from(data.get("response", ""), data, time.perf_counter() - t0, None)
+
+        ttft = None
+        asm = _JSONAssembler()
+        final = {}
+        trailing_ws = 0
+        with self.session.post(self.ollama_url, json=payload, timeout=self.timeout, stream=True) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                piece = data.get("response", "")
+                if piece and ttft is None:
+                    ttft = time.perf_counter() - t0
+                was_complete = asm.complete
+                asm.feed(piece)
+                if data.get("done"):
+                    final = data  # trae prompt_eval_count / eval_count
+                    break
+                if payload.get("format") and was_complete:
+                    # JSON ya cerrado: si el modelo solo sigue emitiendo relleno en
+                    # blanco, cortamos (a costa de no recibir las métricas finales)
+                    trailing_ws = trailing_ws + 1 if not piece.strip() else 0
+                    if trailing_ws >= TRAILING_WS_LIMIT:
+                        break
+        return _result_from(asm.text, final, time.perf_counter() - t0, ttft)
+
+    def generate(self, prompt: str, model: str | None = None, stream: bool | None = None,
+                 format=None, options: dict | None = None) -> LLMResult:
+        """
+        Llama a Ollama y devuelve un LLMResult. Lanza la última excepción HTTP si
+        se agotan los reintentos.
+        """
+        payload = self._payload(prompt, model, self.stream if stream is None else stream, format, options)
+        attempt = 0
+        retry_s = backoff_s = 0.0
+        while True:
+            attempt += 1
+            t0 = time.perf_counter()
+            try:
+                res = self._post_once(payload, t0)
+                res.attempts, res.retry_s, res.backoff_s = attempt, retry_s, backoff_s
+                return res
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status not in RETRY_STATUS or attempt > self.retries:
+                    raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt > self.retries:
+                    raise
+            retry_s += time.perf_counter() - t0
+            wait = self.backoff_s * (2 ** (attempt - 1))
+            time.sleep(wait)
+            backoff_s += wait
+
+
+def _ns_to_s(v):
+    return v / 1e9 if v is not None else None
+
+
+def _result_from(text, data, latency_s, ttft_s) -> LLMResult:
+    return LLMResult(
+        text=text,
+        latency_s=latency_s,
+        ttft_s=ttft_s,
+        prompt_eval_count=data.get("prompt_eval_count"),
+        eval_count=data.get("eval_count"),
+        prompt_eval_s=_ns_to_s(data.get("prompt_eval_duration")),
+        eval_s=_ns_to_s(data.get("eval_duration")),
+        load_s=_ns_to_s(data.get("load_duration")),
+    )
+
+
+# un cliente compartido por URL para la función de compatibilidad
+_clients: dict = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(ollama_url: str, timeout: int = 180) -> OllamaClient:
+    with _clients_lock:
+        key = (ollama_url, timeout)
+        if key not in _clients:
+            _clients[key] = OllamaClient(ollama_url, timeout=timeout)
+        return _clients[key]
+
 
 def call_ollama(prompt: str, model: str, ollama_url: str, timeout: int = 180) -> str:
     """
     Llama a Ollama y devuelve SOLO el campo 'response' como string.
     Lanza excepciones HTTP si algo va mal.
+    (Compatibilidad: usa un OllamaClient compartido con sesión persistente.)
     """
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": False,
-        "format": "json",
+    return get_client(ollama_url, timeout).generate(prompt, model=model).text
+
+
+def summarize_stats(results) -> dict:
+    """Agrega las métricas de una lista de LLMResult para el resumen de ejecución."""
+    results = [r for r in results if r is not None]
+    n_cached = sum(1 for r in results if r.cached)
+    results = [r for r in results if not r.cached]
+    ttfts = [r.ttft_s for r in results if r.ttft_s is not None]
+    return {
+        "calls": len(results),
+        "cached": n_cached,
+        "latency_s_total": round(sum(r.latency_s for r in results), 3),
+        "latency_s_max": round(max((r.latency_s for r in results), default=0.0), 3),
+        "ttft_s_avg": round(sum(ttfts) / len(ttfts), 3) if ttfts else None,
+        "prompt_eval_count": sum(r.prompt_eval_count or 0 for r in results),
+        "eval_count": sum(r.eval_count or 0 for r in results),
+        "retries": sum(r.attempts - 1 for r in results),
+        "retry_s_total": round(sum(r.retry_s for r in results), 3),
+        "backoff_s_total": round(sum(r.backoff_s for r in results), 3),
     }
-    resp = requests.post(ollama_url, json=payload, timeout=timeout)
-    resp.raise_for_status()
-    data = resp.json()
-    return data.get("response", "")
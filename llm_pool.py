@@ -0,0 +1,82 @@
+# llm_pool.py
+"""
+Ejecución concurrente de peticiones al LLM con un nº máximo de peticiones en
+vuelo y limitación de ritmo por token bucket (en lugar de un sleep fijo).
+Los resultados se devuelven SIEMPRE en el orden de entrada.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: `rate` tokens/segundo, hasta `capacity` acumulados.
+    rate=None o <= 0 desactiva la limitación.
+    """
+
+    def __init__(self, rate: float | None, capacity: float = 1.0):
+        self.rate = rate if rate and rate > 0 else None
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        if self.rate is None:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def rate_from_args(rate_limit: float | None, sleep_s: float | None) -> float | None:
+    """
+    Compatibilidad con --sleep_s: si no se da --rate_limit explícito, una pausa de
+    sleep_s segundos entre peticiones equivale a 1/sleep_s peticiones por segundo.
+    """
+    if rate_limit is not None:
+        return rate_limit if rate_limit > 0 else None
+    if sleep_s and sleep_s > 0:
+        return 1.0 / sleep_s
+    return None
+
+
+def run_ordered(fn, jobs, max_workers: int = 1, bucket: TokenBucket | None = None,
+                fatal: tuple = ()):
+    """
+    Ejecuta fn(job) para cada job con como mucho max_workers en vuelo.
+    Devuelve una lista [(resultado, excepción)] en el MISMO orden que `jobs`;
+    exactamente uno de los dos es None.
+    Si algún job lanza una excepción de tipo `fatal` (p.ej. ConnectionError), los
+    jobs que aún no hayan empezado no se lanzan y devuelven esa misma excepción.
+    """
+    jobs = list(jobs)
+    stop = threading.Event()
+    first_fatal = []
+
+    def _wrapped(job):
+        if stop.is_set():
+            return None, first_fatal[0]
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            return fn(job), None
+        except Exception as e:  # se re-evalúa en el hilo principal
+            if fatal and isinstance(e, fatal) and not stop.is_set():
+                first_fatal.append(e)
+                stop.set()
+            return None, e
+
+    if max_workers <= 1:
+        return [_wrapped(job) for job in jobs]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        return list(ex.map(_wrapped, jobs))
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backend de generación MLX residente.
+
+En lugar de lanzar `mlx_lm.generate` (y recargar modelo base + adapter LoRA)
+por cada tabla, el modelo se carga UNA vez y se reutiliza:
+
+  - MLXBackend        → en proceso (mlx_lm.load + generate / batch_generate)
+  - MLXClient         → cliente de un servidor local (este mismo script con --port)
+  - SubprocessBackend → comportamiento antiguo (un proceso por prompt), como fallback
+  - StubBackend       → respuestas JSON sintéticas, para probar el pipeline en Linux sin MLX
+
+BatchingBackend agrupa las peticiones concurrentes (p.ej. del pool de
+auto_request_mlx.py con --workers > 1) en un solo batch.
+
+Con `schema` (JSON schema de constrained_output.items_schema) la generación va
+restringida por gramática: MLXBackend enmascara los logits de los tokens que
+romperían el JSON y StubBackend respeta el nº de items del schema.
+
+Servidor:
+  python mlx_backend.py --model mlx-community/... --adapter-path adapters/oyama_50 --port 8765
+  python mlx_backend.py --stub --port 8765
+Protocolo: una línea JSON por petición {"prompts": [...], "max_tokens": N, "schemas": [...]}
+           → una línea JSON {"texts": [...]} o {"error": "..."} ("schemas" es opcional).
+"""
+import argparse
+import json
+import queue
+import re
+import socket
+import socketserver
+import subprocess
+import threading
+from concurrent.futures import Future
+
+from constrained_output import ItemsGrammar, GrammarLogitsProcessor
+
+
+class MLXBackend:
+    """Modelo MLX + adapter LoRA cargados una sola vez, en proceso."""
+
+    def __init__(self, model: str, adapter_path: str | None = None, use_chat_template: bool = True):
+        from mlx_lm import load  # import diferido: solo existe en macOS / Apple Silicon
+        self.model_name = model
+        self.adapter_path = adapter_path
+        self.model, self.tokenizer = load(model, adapter_path=adapter_path)
+        self.use_chat_template = use_chat_template
+        self._lock = threading.Lock()  # MLX no es thread-safe: serializamos la generación
+
+    def _encode(self, prompt: str):
+        # igual que el CLI de mlx_lm.generate: se aplica la plantilla de chat si existe
+        if self.use_chat_template and getattr(self.tokenizer, "chat_template", None):
+            messages = [{"role": "user", "content": prompt}]
+            return self.tokenizer.apply_chat_template(messages, add_generation_prompt=True)
+        return self.tokenizer.encode(prompt)
+
+    def generate(self, prompt: str, max_tokens: int = 1024, schema: dict | None = None) -> str:
+        return self.generate_batch([prompt], max_tokens=max_tokens, schemas=[schema])[0]
+
+    def _eos_ids(self):
+        ids = getattr(self.tokenizer, "eos_token_ids", None)
+        return sorted(ids) if ids else [self.tokenizer.eos_token_id]
+
+    def generate_batch(self, prompts, max_tokens: int = 1024, schemas=None):
+        from mlx_lm import generate
+        try:
+            from mlx_lm import batch_generate
+        except ImportError:  # versiones antiguas de mlx_lm
+            batch_generate = None
+
+        schemas = list(schemas) if schemas else [None] * len(prompts)
+        encoded = [self._encode(p) for p in prompts]
+        with self._lock:
+            # batch_generate no admite logits_processors: con gramática, uno a uno
+            if batch_generate is not None and len(encoded) > 1 and not any(schemas):
+                resp = batch_generate(self.model, self.tokenizer, encoded,
+                                      max_tokens=max_tokens, verbose=False)
+                return list(resp.texts)
+            out = []
+            for e, schema in zip(encoded, schemas):
+                kwargs = {}
+                if schema:
+                    kwargs["logits_processors"] = [
+                        GrammarLogitsProcessor(ItemsGrammar(schema), self.tokenizer, self._eos_ids())
+                    ]
+                out.append(generate(self.model, self.tokenizer, prompt=e, max_tokens=max_tokens,
+                                    verbose=False, **kwargs))
+            return out
+
+
+class SubprocessBackend:
+    """Comportamiento anterior: un `mlx_lm.generate` por prompt (recarga el modelo cada vez)."""
+
+    def __init__(self, model: str, adapter_path: str | None = None):
+        self.model_name = model
+        self.adapter_path = adapter_path
+        self._warned_schema = False
+
+    def generate(self, prompt: str, max_tokens: int = 1024, schema: dict | None = None) -> str:
+        if schema and not self._warned_schema:
+            # el CLI de mlx_lm no acepta logits processors
+            print("[WARN] El backend subprocess no admite salida restringida; se genera sin gramática.")
+            self._warned_schema = True
+        cmd = [
+            "mlx_lm.generate",
+            "--model", self.model_name,
+            "--adapter-path", self.adapter_path,
+            "--prompt", prompt,
+            "--max-tokens", str(max_tokens),
+        ]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(
+                f"mlx_lm.generate falló con código {proc.returncode}:\n{proc.stderr}"
+            )
+        return proc.stdout.strip()
+
+    def generate_batch(self, prompts, max_tokens: int = 1024, schemas=None):
+        schemas = list(schemas) if schemas else [None] * len(prompts)
+        return [self.generate(p, max_tokens=max_tokens, schema=sc) for p, sc in zip(prompts, schemas)]
+
+
+class StubBackend:
+    """
+    Backend falso para Linux / CI: devuelve un JSON válido con un item por
+    columna numerada del 'Esquema' del prompt ("1. col (...)"), o con los
+    items que pida el schema si la generación va restringida.
+    """
+
+    _COL_LINE = re.compile(r"^\d+\.\s", re.M)
+
+    def __init__(self, category: str = "no_sensible"):
+        self.category = category
+        self.calls = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str, max_tokens: int = 1024, schema: dict | None = None) -> str:
+        return self.generate_batch([prompt], max_tokens=max_tokens, schemas=[schema])[0]
+
+    def generate_batch(self, prompts, max_tokens: int = 1024, schemas=None):
+        with self._lock:
+            self.batches += 1
+            self.calls += len(prompts)
+        out = []
+        for p, schema in zip(prompts, schemas or [None] * len(prompts)):
+            if schema:
+                n = schema["properties"]["items"]["minItems"]
+            else:
+                n = len(self._COL_LINE.findall(p))
+            items = [{"category": self.category, "rationale": "stub", "confidence": 0.0}] * n
+            out.append(json.dumps({"items": items}, ensure_ascii=False))
+        return out
+
+
+class BatchingBackend:
+    """
+    Envuelve un backend y agrupa en un único generate_batch las peticiones que
+    llegan desde varios hilos (hasta max_batch). Las ya encoladas se agrupan sin
+    esperar; la ventana de max_wait_s para esperar más solo se abre si el batch
+    anterior tuvo varias peticiones (hay llamadas concurrentes): con un único
+    llamante en serie cada petición sale en cuanto llega.
+    """
+
+    def __init__(self, backend, max_batch: int = 4, max_wait_s: float = 0.05):
+        self.backend = backend
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max_wait_s
+        self._q = queue.Queue()
+        self._last_batch = 1
+        self._worker = threading.Thread(target=self._loop, daemon=True)
+        self._worker.start()
+
+    def generate(self, prompt: str, max_tokens: int = 1024, schema: dict | None = None) -> str:
+        fut = Future()
+        self._q.put((prompt, max_tokens, schema, fut))
+        return fut.result()
+
+    def generate_batch(self, prompts, max_tokens: int = 1024, schemas=None):
+        futs = []
+        for p, schema in zip(prompts, schemas or [None] * len(prompts)):
+            fut = Future()
+            self._q.put((p, max_tokens, schema, fut))
+            futs.append(fut)
+        return [f.result() for f in futs]
+
+    def _loop(self):
+        while True:
+            batch = [self._q.get()]
+            wait_s = self.max_wait_s if self._last_batch > 1 else 0
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._q.get(timeout=wait_s) if wait_s else self._q.get_nowait())
+                except queue.Empty:
+                    break
+            self._last_batch = len(batch)
+            prompts = [b[0] for b in batch]
+            max_tokens = max(b[1] for b in batch)
+            schemas = [b[2] for b in batch]
+            try:
+                texts = self.backend.generate_batch(prompts, max_tokens=max_tokens,
+                                                    schemas=schemas if any(schemas) else None)
+                for (_, _, _, fut), txt in zip(batch, texts):
+                    fut.set_result(txt)
+            except Exception as e:
+                for _, _, _, fut in batch:
+                    fut.set_exception(e)
+
+
+class MLXClient:
+    """Cliente del servidor local (una conexión TCP por petición, JSON por líneas)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, timeout: float = 600):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def generate(self, prompt: str, max_tokens: int = 1024, schema: dict | None = None) -> str:
+        return self.generate_batch([prompt], max_tokens=max_tokens, schemas=[schema])[0]
+
+    def generate_batch(self, prompts, max_tokens: int = 1024, schemas=None):
+        req = {"prompts": list(prompts), "max_tokens": max_tokens}
+        if schemas and any(schemas):
+            req["schemas"] = list(schemas)
+        req = json.dumps(req, ensure_ascii=False)
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as s:
+            f = s.makefile("rwb")
+            f.write(req.encode("utf-8") + b"\n")
+            f.flush()
+            line = f.readline()
+        if not line:
+            raise RuntimeError(f"el servidor MLX {self.host}:{self.port} cerró la conexión sin responder")
+        resp = json.loads(line)
+        if "error" in resp:
+            raise RuntimeError(f"servidor MLX: {resp['error']}")
+        return resp["texts"]
+
+
+def parse_server_addr(addr: str):
+    """'host:port' o 'port' → (host, port)."""
+    host, _, port = addr.rpartition(":")
+    return (host or "127.0.0.1"), int(port)
+
+
+_backends: dict = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(model: str, adapter_path: str | None, kind: str = "inprocess",
+                server: str | None = None, max_batch: int = 4):
+    """
+    Devuelve (y cachea) el backend para (kind, model, adapter, server).
+    kind: inprocess | subprocess | stub. Si se da `server`, se usa MLXClient.
+    """
+    key = (kind, model, adapter_path, server, max_batch)
+    with _backends_lock:
+        if key not in _backends:
+            if server:
+                backend = MLXClient(*parse_server_addr(server))
+            elif kind == "subprocess":
+                backend = SubprocessBackend(model, adapter_path)
+            else:
+                backend = StubBackend() if kind == "stub" else MLXBackend(model, adapter_path)
+                if max_batch > 1:
+                    # con max_batch 1 (p.ej. un solo worker) el wrapper solo añadiría espera
+                    backend = BatchingBackend(backend, max_batch=max_batch)
+            _backends[key] = backend
+        return _backends[key]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            req = json.loads(line)
+            texts = self.server.backend.generate_batch(req["prompts"], max_tokens=int(req.get("max_tokens", 1024)),
+                                                       schemas=req.get("schemas"))
+            resp = {"texts": texts}
+        except Exception as e:
+            resp = {"error": str(e)}
+        self.wfile.write(json.dumps(resp, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+class MLXServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, addr, backend):
+        super().__init__(addr, _Handler)
+        self.backend = backend
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Servidor local de generación MLX (modelo + LoRA cargados una vez).")
+    ap.add_argument("--model", help="modelo base MLX")
+    ap.add_argument("--adapter-path", default=None, help="ruta al adapter LoRA")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--max-batch", type=int, default=4, help="máximo de prompts por batch")
+    ap.add_argument("--stub", action="store_true", help="backend falso (sin MLX), para pruebas")
+    args = ap.parse_args()
+
+    if args.stub:
+        base = StubBackend()
+    else:
+        if not args.model:
+            ap.error("--model es obligatorio salvo con --stub")
+        base = MLXBackend(args.model, args.adapter_path)
+    backend = BatchingBackend(base, max_batch=args.max_batch)
+
+    with MLXServer((args.host, args.port), backend) as srv:
+        print(f"[MLX] Servidor escuchando en {args.host}:{args.port} (modelo={args.model or 'stub'})")
+        srv.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+# mysql_profiler.py
+"""
+Perfilado de columnas MySQL para los scripts auto_request_*.
+
+En lugar de lanzar 3 consultas por columna (COUNT + nulls, COUNT DISTINCT y
+muestra) más un COUNT(*) final por tabla, se hace:
+  - UNA consulta agregada por tabla con filas, nulls y distinct de TODAS las columnas
+  - UNA muestra compartida de filas de la que se sacan las muestras de cada columna
+La salida es la misma estructura tables[t] = {"row_count", "columns": [...]}.
+
+Modo aproximado (approx=True): no se usa COUNT(DISTINCT); se lee la tabla en
+streaming por bloques y los distinct se estiman en cliente con HyperLogLog (ver
+sketches.py). Sin approx_max_rows se lee y se hashea en Python CADA celda de la
+tabla: ahorra memoria y tablas temporales en el servidor, pero es más lento que
+el COUNT(DISTINCT) al que sustituye. Con approx_max_rows, las tablas más grandes
+se muestrean en estratos por rango de la PK entera (una fila cada `paso` valores
+de PK; sin PK entera simple, las primeras filas) y el distinct de la muestra es
+solo una cota inferior del de la tabla: se informa así, sin error relativo.
+"""
+import math
+
+from sketches import HyperLogLog
+
+# filas que se piden en la muestra compartida = sample_rows * SAMPLE_POOL_FACTOR
+SAMPLE_POOL_FACTOR = 20
+
+# claves extra que solo aparecen en columnas con estadísticas estimadas
+APPROX_KEYS = ("n_distinct_approx", "n_distinct_method", "n_distinct_rse", "n_null_approx",
+               "n_distinct_lower_bound", "sample_strategy")
+
+# tipos de PK que admiten estratos por rango
+INT_TYPES = {"int", "bigint", "smallint", "mediumint", "tinyint"}
+
+# si en una muestra acotada casi todos los valores son distintos, se asume columna ~única
+# (solo si la muestra tiene suficientes valores no nulos para decidirlo)
+UNIQUE_RATIO_IN_SAMPLE = 0.95
+UNIQUE_MIN_NON_NULL = 50
+
+
+def quote_ident(name: str) -> str:
+    """Escapa un identificador MySQL con backticks."""
+    return "`" + str(name).replace("`", "``") + "`"
+
+
+def stratified_clause(cur, table, pk, n_rows):
+    """
+    Cláusula "WHERE (pk - min) % paso = 0 ORDER BY pk LIMIT n" que deja ~n_rows
+    filas repartidas por todo el rango de la PK entera `pk` (MySQL recorre el
+    índice de la PK y solo viajan esas filas); None si la tabla está vacía.
+    """
+    qpk = quote_ident(pk)
+    cur.execute(f"SELECT MIN({qpk}) AS lo, MAX({qpk}) AS hi FROM {quote_ident(table)}")
+    r = cur.fetchone() or {}
+    lo, hi = r.get("lo"), r.get("hi")
+    if lo is None or hi is None:
+        return None
+    lo, hi = int(lo), int(hi)
+    step = max(1, math.ceil((hi - lo + 1) / n_rows))
+    # lo y step son enteros calculados aquí (no vienen del usuario); % es el módulo de MySQL
+    return f"WHERE ({qpk} - {lo}) % {step} = 0 ORDER BY {qpk} LIMIT {int(n_rows)}"
+
+
+def int_pk(columns, pk_names):
+    """Nombre de la PK si es una única columna entera (la que admite estratos); si no, None."""
+    pks = [c for c in columns if c["name"] in pk_names]
+    if len(pks) == 1 and (pks[0].get("data_type") or "").lower() in INT_TYPES:
+        return pks[0]["name"]
+    return None
+
+
+def _col_field(c, key):
+    # information_schema puede devolver las claves en minúscula (alias) o mayúscula
+    return c.get(key, c.get(key.upper()))
+
+
+def group_columns_by_table(cols):
+    """
+    Agrupa las filas de information_schema.columns por tabla, conservando el orden.
+    Devuelve dict: tabla -> [ {name, data_type, column_type, is_nullable}, ... ]
+    """
+    by_table = {}
+    for c in cols:
+        t = _col_field(c, "table_name")
+        by_table.setdefault(t, []).append({
+            "name": _col_field(c, "column_name"),
+            "data_type": _col_field(c, "data_type"),
+            "column_type": _col_field(c, "column_type"),
+            "is_nullable": _col_field(c, "is_nullable"),
+        })
+    return by_table
+
+
+def _aggregate_stats(cur, table, col_names):
+    """
+    Filas, nulls y distinct de todas las columnas en un único SELECT.
+    Devuelve (n_all, [n_null_i], [n_dist_i]).
+    """
+    exprs = ["COUNT(*) AS n_all"]
+    for i, col in enumerate(col_names):
+        q = quote_ident(col)
+        exprs.append(f"SUM(CASE WHEN {q} IS NULL THEN 1 ELSE 0 END) AS n_null_{i}")
+        exprs.append(f"COUNT(DISTINCT {q}) AS n_dist_{i}")
+    cur.execute(f"SELECT {', '.join(exprs)} FROM {quote_ident(table)}")
+    r = cur.fetchone() or {}
+    n_all = r.get("n_all", 0) or 0
+    n_null = [int(r.get(f"n_null_{i}", 0) or 0) for i in range(len(col_names))]
+    n_dist = [int(r.get(f"n_dist_{i}", 0) or 0) for i in range(len(col_names))]
+    return int(n_all), n_null, n_dist
+
+
+def _per_column_stats(cur, table, col):
+    """Camino antiguo (una columna cada vez), solo como fallback."""
+    q, qt = quote_ident(col), quote_ident(table)
+    cur.execute(f"SELECT COUNT(*) AS n, SUM(CASE WHEN {q} IS NULL THEN 1 ELSE 0 END) AS n_null FROM {qt}")
+    r = cur.fetchone() or {}
+    n_all = r.get("n", 0) or 0
+    n_null = r.get("n_null", 0) or 0
+    try:
+        cur.execute(f"SELECT COUNT(DISTINCT {q}) AS n_dist FROM {qt}")
+        n_dist = (cur.fetchone() or {}).get("n_dist", 0) or 0
+    except Exception:
+        n_dist = None
+    return n_all, n_null, n_dist
+
+
+def _shared_samples(cur, table, col_names, sample_rows):
+    """
+    Lee una única muestra de filas y reparte los valores no nulos por columna
+    (los primeros sample_rows de cada una, en orden de lectura).
+    """
+    samples = [[] for _ in col_names]
+    if sample_rows <= 0 or not col_names:
+        return samples
+    select = ", ".join(f"{quote_ident(c)} AS c{i}" for i, c in enumerate(col_names))
+    cur.execute(f"SELECT {select} FROM {quote_ident(table)} LIMIT %s",
+                (sample_rows * SAMPLE_POOL_FACTOR,))
+    for row in cur.fetchall():
+        for i in range(len(col_names)):
+            v = row.get(f"c{i}")
+            if v is not None and len(samples[i]) < sample_rows:
+                samples[i].append(v)
+    return samples
+
+
+def _column_samples(cur, table, col, sample_rows):
+    """Muestra dirigida para una columna (cuando la muestra compartida no basta)."""
+    cur.execute(
+        f"SELECT {quote_ident(col)} AS v FROM {quote_ident(table)} "
+        f"WHERE {quote_ident(col)} IS NOT NULL LIMIT %s",
+        (sample_rows,)
+    )
+    return [rr["v"] for rr in cur.fetchall()]
+
+
+def _approx_scan(cur, table, col_names, sample_rows, max_rows=0, chunk_rows=5000, hll_p=14, clause=None):
+    """
+    Recorre la tabla en streaming (fetchmany) una sola vez: cuenta nulls, alimenta
+    un HyperLogLog por columna y recoge las muestras. Memoria acotada por chunk_rows.
+    `clause` (de stratified_clause) restringe las filas leídas; si no, max_rows > 0
+    lee solo las primeras.
+    Devuelve (n_scanned, [n_null_i], [hll_i], [samples_i]).
+    """
+    select = ", ".join(f"{quote_ident(c)} AS c{i}" for i, c in enumerate(col_names))
+    sql = f"SELECT {select} FROM {quote_ident(table)}"
+    params = ()
+    if clause:
+        sql += " " + clause
+    elif max_rows and max_rows > 0:
+        sql += " LIMIT %s"
+        params = (int(max_rows),)
+
+    n_scanned = 0
+    nulls = [0] * len(col_names)
+    hlls = [HyperLogLog(hll_p) for _ in col_names]
+    samples = [[] for _ in col_names]
+    keys = [f"c{i}" for i in range(len(col_names))]
+
+    cur.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        n_scanned += len(rows)
+        for i, key in enumerate(keys):
+            h, smp = hlls[i], samples[i]
+            for row in rows:
+                v = row.get(key)
+                if v is None:
+                    nulls[i] += 1
+                    continue
+                h.add(v)
+                if len(smp) < sample_rows:
+                    smp.append(v)
+    return n_scanned, nulls, hlls, samples
+
+
+def _approx_stats(cur, table, col_names, sample_rows, max_rows, chunk_rows, pk=None):
+    """
+    Estadísticas estimadas (HLL) + muestras, a partir de _approx_scan. Con
+    max_rows, si la tabla tiene más filas se lee una muestra (estratos de la
+    PK entera `pk` o, sin ella, las primeras filas).
+    """
+    n_all, clause, strategy = None, None, None
+    if max_rows and max_rows > 0:
+        # el total sí lo pedimos (COUNT(*) no usa tablas temporales)
+        try:
+            cur.execute(f"SELECT COUNT(*) AS n FROM {quote_ident(table)}")
+            n_all = int((cur.fetchone() or {}).get("n", 0) or 0)
+        except Exception:
+            n_all = None
+        if n_all is None or n_all > max_rows:
+            strategy = "first"
+            if pk:
+                try:
+                    clause = stratified_clause(cur, table, pk, max_rows)
+                except Exception as e:
+                    print(f"[WARN] Tabla {table}: muestreo por rango de la PK fallido ({e}), se leen las primeras filas.")
+                if clause:
+                    strategy = "stratified"
+
+    n_scanned, nulls, hlls, raw_samples = _approx_scan(
+        cur, table, col_names, sample_rows, max_rows=max_rows, chunk_rows=chunk_rows, clause=clause
+    )
+    if n_all is None or strategy is None:
+        n_all = max(n_all or 0, n_scanned)
+    sampled = strategy is not None and n_all > n_scanned
+
+    stats = []
+    for i in range(len(col_names)):
+        non_null_seen = n_scanned - nulls[i]
+        d = min(hlls[i].estimate(), non_null_seen)
+        st = {
+            "n_all": n_all,
+            "n_null": nulls[i],
+            "n_distinct": d,
+            "n_distinct_approx": True,
+            "n_distinct_method": "hll",
+            "n_distinct_rse": round(hlls[i].relative_error, 4),
+            "n_null_approx": False,
+        }
+        if sampled:
+            st["n_null"] = int(round(nulls[i] / n_scanned * n_all)) if n_scanned else 0
+            st["n_null_approx"] = True
+            st["n_distinct_method"] = "hll_sample"
+            st["sample_strategy"] = strategy
+            # el distinct de una muestra solo acota por abajo el de la tabla: sin error relativo
+            st["n_distinct_rse"] = None
+            st["n_distinct_lower_bound"] = True
+            if non_null_seen >= UNIQUE_MIN_NON_NULL and d >= UNIQUE_RATIO_IN_SAMPLE * non_null_seen:
+                # columna ~única en la muestra: extrapolamos a la población no nula
+                st["n_distinct"] = n_all - st["n_null"]
+                st["n_distinct_lower_bound"] = False
+        stats.append(st)
+    return n_all, stats, raw_samples
+
+
+def profile_table(cur, table, columns, sample_rows, mask_fn=str,
+                  approx=False, approx_max_rows=0, chunk_rows=5000, pk=None):
+    """
+    Perfila una tabla. `columns` es la lista de group_columns_by_table()[table];
+    `pk`, su PK entera simple (int_pk), para muestrear por estratos con approx_max_rows.
+    Devuelve (row_count, stats) con stats[i] = {n_all, n_null, n_distinct, samples}
+    (más las claves de APPROX_KEYS si approx=True).
+    """
+    col_names = [c["name"] for c in columns]
+
+    if approx:
+        row_count, stats, raw_samples = _approx_stats(
+            cur, table, col_names, sample_rows, approx_max_rows, chunk_rows, pk=pk
+        )
+        _fill_samples(cur, table, col_names, stats, raw_samples, sample_rows, mask_fn)
+        return row_count, stats
+
+    try:
+        n_all, n_nulls, n_dists = _aggregate_stats(cur, table, col_names)
+        stats = [
+            {"n_all": n_all, "n_null": n_nulls[i], "n_distinct": n_dists[i]}
+            for i in range(len(col_names))
+        ]
+        row_count = n_all
+    except Exception as e:
+        print(f"[WARN] Tabla {table}: fallo en la consulta agregada ({e}), se perfila columna a columna.")
+        stats = []
+        for col in col_names:
+            a, nn, nd = _per_column_stats(cur, table, col)
+            stats.append({"n_all": a, "n_null": nn, "n_distinct": nd})
+        row_count = stats[0]["n_all"] if stats else None
+
+    try:
+        raw_samples = _shared_samples(cur, table, col_names, sample_rows)
+    except Exception:
+        raw_samples = [[] for _ in col_names]
+
+    _fill_samples(cur, table, col_names, stats, raw_samples, sample_rows, mask_fn)
+    return row_count, stats
+
+
+def _fill_samples(cur, table, col_names, stats, raw_samples, sample_rows, mask_fn):
+    """Completa stats[i]["samples"] (enmascaradas) a partir de la muestra compartida."""
+    for i, col in enumerate(col_names):
+        st = stats[i]
+        non_null = (st["n_all"] or 0) - (st["n_null"] or 0)
+        # columnas muy dispersas: la muestra compartida no trae suficientes valores
+        if len(raw_samples[i]) < min(sample_rows, non_null):
+            try:
+                raw_samples[i] = _column_samples(cur, table, col, sample_rows)
+            except Exception:
+                pass
+        st["samples"] = [mask_fn(v) for v in raw_samples[i]]
+
+
+def profile_tables(cur, cols, pk_map, fk_map, sample_rows, mask_fn=str, type_fn=None,
+                   approx=False, approx_max_rows=0, chunk_rows=5000):
+    """
+    Perfila todas las tablas de `cols` (filas de information_schema.columns) y
+    devuelve la estructura que usa el constructor de prompts:
+      tables[t] = {"row_count": int|None, "columns": [ {...}, ... ]}
+    """
+    tables = {}
+    for t, columns in group_columns_by_table(cols).items():
+        row_count, stats = profile_table(
+            cur, t, columns, sample_rows, mask_fn=mask_fn,
+            approx=approx, approx_max_rows=approx_max_rows, chunk_rows=chunk_rows,
+            pk=int_pk(columns, pk_map.get(t, set())),
+        )
+
+        fk_refs = {fk["column"]: f"{fk['ref_table']}.{fk['ref_column']}" for fk in fk_map.get(t, [])}
+        tables[t] = {"row_count": row_count, "columns": []}
+        for c, st in zip(columns, stats):
+            tables[t]["columns"].append({
+                "name": c["name"],
+                "mysql_data_type": c["data_type"],
+                "mysql_column_type": c["column_type"],
+                "llm_type": type_fn(c["data_type"], c["column_type"]) if type_fn else c["data_type"],
+                "is_nullable": c["is_nullable"],
+                "n_all": st["n_all"],
+                "n_null": st["n_null"],
+                "n_distinct": st["n_distinct"],
+                "samples": st["samples"],
+                "is_pk": (c["name"] in pk_map.get(t, set())),
+                "is_fk": (c["name"] in fk_refs),
+                "fk_ref": fk_refs.get(c["name"]),
+                **{k: st[k] for k in APPROX_KEYS if k in st},
+            })
+    return tables
+
+
+def format_distinct(c) -> str:
+    """Valor para la línea 'distinct=' de la evidencia (marca ≈ si es estimado)."""
+    if not c.get("n_distinct_approx"):
+        return str(c["n_distinct"])
+    if c.get("n_distinct_method") == "hll_sample":
+        # distinct de la muestra: cota inferior (salvo columna ~única, extrapolada)
+        if c.get("n_distinct_lower_bound"):
+            return f"≥{c['n_distinct']}(muestra)"
+        return f"≈{c['n_distinct']}(muestra, ~única)"
+    return f"≈{c['n_distinct']}(±{c['n_distinct_rse'] * 100:.1f}%)"
+
+
+def approx_columns_report(tables):
+    """Lista de columnas cuyas estadísticas son estimadas, para el informe de salida."""
+    out = []
+    for t, info in tables.items():
+        for c in info["columns"]:
+            if c.get("n_distinct_approx"):
+                out.append({
+                    "table": t,
+                    "name": c["name"],
+                    "method": c["n_distinct_method"],
+                    "rse": c["n_distinct_rse"],
+                    "lower_bound": bool(c.get("n_distinct_lower_bound")),
+                    "sample": c.get("sample_strategy"),
+                    "null_approx": c["n_null_approx"],
+                })
+    return out
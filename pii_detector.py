@@ -0,0 +1,165 @@
+# pii_detector.py
+"""
+Detector de PII en valores de muestra, para enmascararlos antes de mandarlos
+al LLM (mask_value de los scripts auto_request_*).
+
+Antes se lanzaban hasta seis re.search seguidos por valor, con patrones que
+retroceden mucho (TARJETA, TEL) y muchos falsos positivos (las fechas
+2020-01-01 salían como TEL). Aquí:
+
+  - UNA expresión compilada con una alternativa con nombre por tipo; una sola
+    pasada por el valor (si un candidato no valida, se sigue buscando desde
+    el carácter siguiente)
+  - cuantificadores acotados y clases de caracteres concretas (sin .*? ni
+    [^@\\s]+ que retrocedan)
+  - validación de cada candidato: letra de control del DNI / NIE, mod-97 del
+    IBAN, Luhn de la tarjeta, nº de dígitos para TEL (y que no sea una fecha)
+  - entradas vectorizadas (mask_many / detect_many) para listas de muestras o
+    pandas.Series: cada valor distinto se analiza una sola vez
+
+Si un valor contiene varios tipos, gana el primero de LABELS (mismo orden de
+prioridad que la lista _PATTERNS original).
+"""
+import re
+
+LABELS = ("IBAN", "DNI", "NIE", "EMAIL", "TEL", "TARJETA")
+
+MAX_SAMPLE_CHARS = 64
+
+DNI_LETTERS = "TRWAGMYFPDXBNJZSQVHLCKE"
+
+# orden de las alternativas: a igual posición de inicio gana la primera, así
+# que los patrones más específicos van antes (TARJETA antes que TEL). Los
+# numéricos no pueden empezar ni acabar pegados a un decimal (3.1415926535…)
+_DETECTOR = re.compile(
+    r"(?P<IBAN>\b[A-Z]{2}\d{2}(?:[ ]?[A-Z0-9]{4}){2,7}(?:[ ]?[A-Z0-9]{1,4})?\b)"
+    r"|(?P<NIE>\b[XYZ]\d{7}[A-Z]\b)"
+    r"|(?P<DNI>\b\d{7,8}[A-Z]\b)"
+    r"|(?P<EMAIL>[A-Z0-9._%+\-]{1,64}@[A-Z0-9\-]{1,63}(?:\.[A-Z0-9\-]{1,63})*\.[A-Z]{2,24}\b)"
+    r"|(?P<TARJETA>(?<![\d.,])\d(?:[ \-]?\d){12,18}(?![.,]?\d))"
+    r"|(?P<TEL>(?:\+|(?<![\w.,]))\d(?:[ \-.()]{0,2}\d){7,14}(?![.,]?\d))",
+    re.I,
+)
+
+# fechas (con hora opcional) y decimales que el patrón de TEL admitiría por forma;
+# se comparan con el candidato ENTERO: 612-34-56-78 contiene "12-34-56" y es un teléfono
+_DATE_LIKE = re.compile(r"(?:\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.](?:\d{4}|\d{2}))"
+                        r"(?:[ T]\d{1,2}(?::\d{2}){0,2})?")
+_DECIMAL = re.compile(r"\d+[.,]\d+")
+_NON_DIGIT = re.compile(r"\D")
+
+
+def dni_letter_ok(number: str, letter: str) -> bool:
+    return DNI_LETTERS[int(number) % 23] == letter.upper()
+
+
+def iban_ok(text: str) -> bool:
+    """Comprobación mod-97 (ISO 13616) de un IBAN con o sin espacios."""
+    s = text.replace(" ", "").upper()
+    if not 15 <= len(s) <= 34:
+        return False
+    rearranged = s[4:] + s[:4]
+    digits = "".join(str(int(ch, 36)) for ch in rearranged)
+    return int(digits) % 97 == 1
+
+
+def luhn_ok(digits: str) -> bool:
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        d = int(ch)
+        if i % 2 == 1:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return total % 10 == 0
+
+
+def _tel_ok(text: str) -> bool:
+    if _DATE_LIKE.fullmatch(text) or _DECIMAL.fullmatch(text):
+        return False
+    digits = _NON_DIGIT.sub("", text)
+    if text.startswith("+"):
+        return 9 <= len(digits) <= 15
+    if text.startswith("00"):
+        return 11 <= len(digits) <= 15
+    # sin prefijo internacional: número español (9 dígitos, fijo o móvil) o con 34 delante
+    if len(digits) == 11 and digits.startswith("34"):
+        digits = digits[2:]
+    return len(digits) == 9 and digits[0] in "6789"
+
+
+def _valid(label: str, text: str) -> bool:
+    if label == "IBAN":
+        return iban_ok(text)
+    if label == "DNI":
+        return dni_letter_ok(text[:-1], text[-1])
+    if label == "NIE":
+        return dni_letter_ok(str("XYZ".index(text[0].upper())) + text[1:-1], text[-1])
+    if label == "TARJETA":
+        digits = _NON_DIGIT.sub("", text)
+        return 13 <= len(digits) <= 19 and luhn_ok(digits)
+    if label == "TEL":
+        return _tel_ok(text)
+    return True  # EMAIL: la forma basta
+
+
+def detect(value) -> str | None:
+    """Tipo de PII de mayor prioridad que aparece en el valor (o None)."""
+    s = str(value)
+    found = set()
+    pos = 0
+    while True:
+        m = _DETECTOR.search(s, pos)
+        if m is None:
+            break
+        label = m.lastgroup
+        if _valid(label, m.group()):
+            if label == LABELS[0]:
+                return label
+            found.add(label)
+            pos = m.end()
+        else:
+            # el candidato no valida: puede empezar otro tipo en la posición siguiente
+            pos = m.start() + 1
+    for label in LABELS:
+        if label in found:
+            return label
+    return None
+
+
+def mask_value(v, max_chars: int = MAX_SAMPLE_CHARS):
+    """<MASK:TIPO> si el valor contiene PII; si no, el valor recortado a max_chars."""
+    s = str(v)
+    label = detect(s)
+    if label is not None:
+        return f"<MASK:{label}>"
+    if len(s) > max_chars:
+        return s[:max_chars - 3] + "..."
+    return s
+
+
+def _map_unique(values, fn):
+    """Aplica fn una vez por valor distinto; Series → Series, resto → lista."""
+    if hasattr(values, "map") and hasattr(values, "unique"):  # pandas.Series
+        uniq = values.dropna().unique()
+        mapping = {v: fn(v) for v in uniq}
+        return values.map(mapping)
+    memo = {}
+    out = []
+    for v in values:
+        key = str(v)
+        if key not in memo:
+            memo[key] = fn(v)
+        out.append(memo[key])
+    return out
+
+
+def mask_many(values, max_chars: int = MAX_SAMPLE_CHARS):
+    """mask_value sobre una lista de muestras o una pandas.Series (los nulos de la Series se quedan nulos)."""
+    return _map_unique(values, lambda v: mask_value(v, max_chars))
+
+
+def detect_many(values):
+    """detect sobre una lista o pandas.Series: tipo de PII (o None) por valor."""
+    return _map_unique(values, detect)
@@ -0,0 +1,170 @@
+# pii_scan.py
+"""
+Escaneo de PII sobre una muestra de filas de cada tabla.
+
+Las muestras del perfilado salen de un SELECT ... LIMIT: son las primeras
+filas físicas, casi siempre de la misma carga, y solo 5 por columna. Con
+--scan_rows N se lee una muestra de N filas por tabla en UNA consulta
+(leída por bloques con fetchmany), se pasa pii_detector por todas las
+columnas y se añade a la evidencia la proporción de valores no nulos de
+cada tipo (p.ej. email_like=0.97).
+
+Estrategias (--scan_strategy):
+  - stratified: (por defecto) estratos por rango de la PK entera: una fila cada
+                (max - min + 1) / N valores de PK. Solo viajan ~N filas y MySQL
+                recorre el índice de la PK. Sin PK entera simple → reservoir.
+  - reservoir:  recorre la tabla en streaming y se queda con N filas al azar
+                (muestreo de reservorio, algoritmo R). Semilla fija por tabla,
+                así que el mismo contenido da el mismo prompt (y la caché sirve).
+                Trae a Python hasta --scan_max_rows filas (LIMIT en el servidor);
+                en tablas más grandes la muestra sale de las primeras
+                scan_max_rows y el informe lo marca con "capped".
+  - first:      las N primeras filas (LIMIT N), como las muestras de siempre.
+
+Las muestras de la evidencia pasan a salir de esta muestra escaneada.
+"""
+import random
+
+from mysql_profiler import INT_TYPES, quote_ident, stratified_clause
+from pii_detector import LABELS, detect_many
+
+SCAN_STRATEGIES = ("stratified", "reservoir", "first")
+SCAN_MAX_ROWS = 200000  # filas que el reservorio lee como máximo (0 = tabla completa)
+
+def rate_key(label: str) -> str:
+    return f"{label.lower()}_like"
+
+
+def _select(col_names):
+    return ", ".join(f"{quote_ident(c)} AS c{i}" for i, c in enumerate(col_names))
+
+
+def _reservoir_rows(cur, table, col_names, n_rows, chunk_rows, max_rows=SCAN_MAX_ROWS):
+    """(muestra de n_rows filas al azar, filas leídas) de como mucho max_rows filas."""
+    rng = random.Random(table)
+    sample, seen = [], 0
+    limit = f" LIMIT {int(max_rows)}" if max_rows else ""
+    cur.execute(f"SELECT {_select(col_names)} FROM {quote_ident(table)}{limit}")
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        for row in rows:
+            seen += 1
+            if len(sample) < n_rows:
+                sample.append(row)
+            else:
+                j = rng.randrange(seen)
+                if j < n_rows:
+                    sample[j] = row
+    return sample, seen
+
+
+def _stratified_rows(cur, table, col_names, pk, n_rows, chunk_rows):
+    """Filas con (pk - min) múltiplo del paso; None si no se puede estratificar."""
+    clause = stratified_clause(cur, table, pk, n_rows)
+    if clause is None:
+        return None
+    cur.execute(f"SELECT {_select(col_names)} FROM {quote_ident(table)} {clause}")
+    sample = []
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        sample.extend(rows)
+    return sample
+
+
+def _first_rows(cur, table, col_names, n_rows, chunk_rows):
+    cur.execute(f"SELECT {_select(col_names)} FROM {quote_ident(table)} LIMIT %s", (int(n_rows),))
+    sample = []
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        sample.extend(rows)
+    return sample
+
+
+def scan_table(cur, table, columns, n_rows, strategy="stratified", chunk_rows=5000, max_rows=SCAN_MAX_ROWS):
+    """
+    Muestra de n_rows filas de la tabla y detección de PII por columna.
+    `columns` son las columnas perfiladas (tables[t]["columns"] de profile_tables).
+    Devuelve (estrategia usada, nº de filas, [valores no nulos_i], [tasas_i], capped)
+    con tasas_i = {"email_like": 0.97, ...} (solo los tipos detectados) y capped
+    = True si el reservorio se quedó en max_rows filas leídas.
+    """
+    col_names = [c["name"] for c in columns]
+    rows = None
+    used = strategy
+    capped = False
+    if strategy == "stratified":
+        pks = [c for c in columns if c.get("is_pk")]
+        if len(pks) == 1 and (pks[0].get("mysql_data_type") or "").lower() in INT_TYPES:
+            try:
+                rows = _stratified_rows(cur, table, col_names, pks[0]["name"], n_rows, chunk_rows)
+            except Exception as e:
+                print(f"[WARN] Tabla {table}: muestreo estratificado fallido ({e}), se usa reservoir.")
+        if rows is None:
+            used = "reservoir"
+    if rows is None:
+        if used == "first":
+            rows = _first_rows(cur, table, col_names, n_rows, chunk_rows)
+        else:
+            rows, seen = _reservoir_rows(cur, table, col_names, n_rows, chunk_rows, max_rows)
+            capped = bool(max_rows) and seen >= max_rows
+
+    values, rates = [], []
+    for i in range(len(col_names)):
+        vals = [v for v in (row.get(f"c{i}") for row in rows) if v is not None]
+        counts = {}
+        for label in detect_many(vals):
+            if label is not None:
+                counts[label] = counts.get(label, 0) + 1
+        values.append(vals)
+        rates.append({rate_key(lb): round(counts[lb] / len(vals), 2) for lb in LABELS if lb in counts})
+    return used, len(rows), values, rates, capped
+
+
+def scan_tables(cur, tables, n_rows, strategy="stratified", sample_rows=5, mask_fn=str, chunk_rows=5000,
+                max_rows=SCAN_MAX_ROWS):
+    """
+    Escanea todas las tablas perfiladas y completa, en sitio, cada columna con
+    "pii_rates" y sus "samples" (enmascaradas) sacadas de la muestra escaneada,
+    y cada tabla con "pii_scan" = {"strategy", "rows"} (+ "capped" si el
+    reservorio no llegó a leer toda la tabla).
+    """
+    for t, info in tables.items():
+        try:
+            used, n, values, rates, capped = scan_table(cur, t, info["columns"], n_rows, strategy, chunk_rows,
+                                                        max_rows)
+        except Exception as e:
+            print(f"[WARN] Tabla {t}: escaneo de PII fallido ({e}); se mantiene la evidencia del perfilado.")
+            continue
+        info["pii_scan"] = {"strategy": used, "rows": n}
+        if capped:
+            info["pii_scan"]["capped"] = max_rows
+        for c, vals, r in zip(info["columns"], values, rates):
+            c["pii_rates"] = r
+            if vals:
+                c["samples"] = [mask_fn(v) for v in vals[:sample_rows]]
+
+
+def format_rates(rates: dict) -> str:
+    """Valor de 'pii=' en la evidencia: email_like=0.97 tel_like=0.02"""
+    return " ".join(f"{k}={v}" for k, v in rates.items())
+
+
+def scan_report(tables):
+    """Resumen por tabla del escaneo (estrategia, filas) y columnas con PII detectada, para el informe de salida."""
+    out = []
+    for t, info in tables.items():
+        scan = info.get("pii_scan")
+        if not scan:
+            continue
+        out.append({
+            "table": t,
+            **scan,
+            "columns": {c["name"]: c["pii_rates"] for c in info["columns"] if c.get("pii_rates")},
+        })
+    return out
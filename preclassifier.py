@@ -0,0 +1,208 @@
+# preclassifier.py
+"""
+Preclasificación determinista de columnas, antes del LLM.
+
+Columnas como dni, email, telefono, iban, created_at o las claves técnicas se
+clasifican siempre igual, pero ocupan tokens en todos los prompts. Con
+--preclassify se les asigna la categoría por reglas y solo las columnas
+ambiguas van al LLM (si una tabla queda resuelta entera, no hay llamada).
+
+Reglas, por orden de prioridad:
+  1. nombre: el nombre normalizado de la columna aparece en las listas de
+     "Ejemplos típicos de columnas <categoría>" del corpus RAG o en el fichero
+     de reglas opcional (--preclassify_rules: JSON {categoría: [nombres]}).
+     Si las fuentes no coinciden en la categoría, el nombre es ambiguo y la
+     columna va al LLM.
+  2. valores: columna de texto cuyas muestras son TODAS del mismo tipo de PII
+     (DNI, NIE, IBAN, EMAIL, TEL, TARJETA según pii_detector) → identificador_directo.
+  3. clave foránea entera sin regla de nombre → no_sensible (clave técnica).
+
+Los items resueltos por reglas llevan "preclassified": <regla> en la salida;
+eval/eval_categories.py los puntúa aparte para que las métricas del modelo no
+incluyan aciertos de las reglas. El ground truth de eval/ no se usa aquí.
+"""
+import json
+import os
+import re
+import unicodedata
+
+CATEGORIES = ("identificador_directo", "cuasi_identificador", "atributo_sensible", "no_sensible")
+
+DEFAULT_CHUNKS = os.path.join("rag_corpus", "chunks.jsonl")
+
+# etiquetas de mask_value (pii_detector) que por sí solas identifican a una persona
+VALUE_LABELS = ("DNI", "NIE", "IBAN", "EMAIL", "TEL", "TARJETA")
+MIN_VALUE_SAMPLES = 3
+
+CONFIDENCE = {"reglas": 0.95, "rag_ejemplos": 0.9, "valores": 0.9, "fk": 0.85}
+
+_MASK_RE = re.compile(r"^<MASK:(\w+)>$")
+_EXAMPLES_RE = re.compile(r"Ejemplos típicos de columnas (\w+):\s*(.*?)\.(?:\s|$)", re.S)
+_COLUMN_NAME_RE = re.compile(r"^[a-z0-9_]+$")
+_SEPARATORS_RE = re.compile(r"[_\-\.,;/\\|()\[\]{}]+")
+
+
+def normalize_name(s) -> str:
+    """Nombre sin acentos, en minúsculas y con los separadores (_ - . / ...) como espacios."""
+    if s is None:
+        return ""
+    s = unicodedata.normalize("NFKD", str(s))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return re.sub(r"\s+", " ", _SEPARATORS_RE.sub(" ", s.lower().strip())).strip()
+
+
+def load_name_rules(path: str):
+    """(nombre de columna, categoría) de un JSON {categoría: [nombres]}."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    out = []
+    for cat, names in data.items():
+        if cat not in CATEGORIES:
+            print(f"[WARN] Preclasificador: categoría desconocida '{cat}' en {path}; se ignora.")
+            continue
+        out.extend((name, cat) for name in names)
+    return out
+
+
+def example_names(chunks_path: str):
+    """(nombre de columna, categoría) de los chunks de tipo 'ejemplos' del corpus RAG."""
+    out = []
+    try:
+        f = open(chunks_path, encoding="utf-8")
+    except FileNotFoundError:
+        print(f"[WARN] Preclasificador: no existe {chunks_path}; sin ejemplos del corpus RAG.")
+        return out
+    with f:
+        for line in f:
+            ch = json.loads(line)
+            if ch.get("metadata", {}).get("chunk_type") != "ejemplos":
+                continue
+            m = _EXAMPLES_RE.search(ch["text"])
+            if not m or m.group(1) not in CATEGORIES:
+                continue
+            for name in m.group(2).split(","):
+                name = name.strip()
+                # "primer_apellido cuando se usa para identificar" → condicional, no es regla
+                if _COLUMN_NAME_RE.match(name):
+                    out.append((name, m.group(1)))
+    return out
+
+
+class PreClassifier:
+    def __init__(self, name_rules: dict, ambiguous=()):
+        self.name_rules = name_rules      # nombre normalizado → (categoría, fuente, detalle)
+        self.ambiguous = set(ambiguous)   # nombres con categorías distintas según la fuente
+        self.hits = {k: 0 for k in CONFIDENCE}
+        self.n_columns = 0
+
+    @classmethod
+    def from_sources(cls, rules_path: str | None = None, chunks_path: str = DEFAULT_CHUNKS) -> "PreClassifier":
+        candidates = {}
+        if rules_path:
+            for name, cat in load_name_rules(rules_path):
+                candidates.setdefault(normalize_name(name), []).append((cat, "reglas", name))
+        for name, cat in example_names(chunks_path):
+            candidates.setdefault(normalize_name(name), []).append((cat, "rag_ejemplos", name))
+
+        rules, ambiguous = {}, []
+        for name, cands in candidates.items():
+            if len({c[0] for c in cands}) > 1:
+                ambiguous.append(name)
+            else:
+                rules[name] = cands[0]
+        return cls(rules, ambiguous)
+
+    def classify(self, c):
+        """(categoría, fuente, rationale) para la columna `c` del perfilado, o None si es ambigua."""
+        key = normalize_name(c["name"])
+        if key in self.name_rules:
+            cat, source, detail = self.name_rules[key]
+            where = f"fichero de reglas: '{detail}'" if source == "reglas" else "ejemplo del corpus RAG"
+            return cat, source, f"regla por nombre ({where})"
+        if key in self.ambiguous:
+            return None
+
+        if c.get("llm_type") == "string":
+            labels = [m.group(1) for m in (_MASK_RE.match(str(s)) for s in c.get("samples") or [])
+                      if m is not None]
+            n = len(c.get("samples") or [])
+            if (n >= MIN_VALUE_SAMPLES and len(labels) == n and len(set(labels)) == 1
+                    and labels[0] in VALUE_LABELS):
+                return "identificador_directo", "valores", f"regla por valores (todas las muestras son {labels[0]})"
+
+        if c.get("is_fk") and c.get("llm_type") == "int":
+            return "no_sensible", "fk", "regla de clave técnica (FK entera)"
+        return None
+
+    def split(self, t, columns):
+        """
+        Reparte las columnas de una tabla: ({nombre: item preclasificado}, columnas pendientes
+        para el LLM), conservando el orden de las pendientes.
+        """
+        decided, pending = {}, []
+        for c in columns:
+            self.n_columns += 1
+            res = self.classify(c)
+            if res is None:
+                pending.append(c)
+                continue
+            cat, source, rationale = res
+            self.hits[source] += 1
+            decided[c["name"]] = {
+                "table": t,
+                "name": c["name"],
+                "category": cat,
+                "rationale": rationale,
+                "confidence": CONFIDENCE[source],
+                "preclassified": source,
+            }
+        return decided, pending
+
+    def summary(self, llm_calls: int, llm_calls_without: int, cache_hits: int = 0) -> dict:
+        """
+        llm_calls: peticiones que van al LLM; cache_hits: bloques respondidos
+        desde la caché (no cuentan como llamadas ni como evitadas por reglas).
+        """
+        return {
+            "columns": self.n_columns,
+            "preclassified": sum(self.hits.values()),
+            "by_rule": dict(self.hits),
+            "llm_calls": llm_calls,
+            "cache_hits": cache_hits,
+            "llm_calls_avoided": llm_calls_without - llm_calls - cache_hits,
+        }
+
+
+def decided_note(decided: dict):
+    """Línea de contexto para el prompt con las columnas ya resueltas por reglas."""
+    if not decided:
+        return []
+    cols = "; ".join(f"{name} [{it['category']}]" for name, it in decided.items())
+    return [f"Columnas ya clasificadas por reglas (solo contexto, no se clasifican aquí): {cols}"]
+
+
+def merge_table_items(columns, decided: dict, llm_items):
+    """
+    Items de una tabla: los preclasificados y los del LLM (emparejados por
+    nombre) en el orden de las columnas. Si el LLM devuelve una columna ya
+    resuelta por reglas, manda la regla; los items del LLM que no casan con
+    ninguna columna se conservan al final, como hasta ahora.
+    """
+    if not decided:
+        return list(llm_items)
+    by_name, extra = {}, []
+    for it in llm_items:
+        name = it.get("name")
+        if name in decided:
+            continue
+        if name in by_name:
+            extra.append(it)
+        else:
+            by_name[name] = it
+    out = []
+    for c in columns:
+        if c["name"] in decided:
+            out.append(decided[c["name"]])
+        elif c["name"] in by_name:
+            out.append(by_name.pop(c["name"]))
+    return out + list(by_name.values()) + extra
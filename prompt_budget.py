@@ -0,0 +1,183 @@
+# prompt_budget.py
+"""
+Montaje de prompts con presupuesto de tokens.
+
+El tamaño del prompt se controlaba solo recortando caracteres (contexto RAG a
+max_chars_per_chunk, muestras a 64 caracteres); en tablas anchas el prompt
+superaba igualmente el contexto del modelo. Aquí se cuentan tokens con el
+tokenizer del modelo destino y se reparte un presupuesto entre secciones:
+
+  - fijas (nunca se recortan): system prompt, cabecera de la tabla, esquema
+    numerado e instrucción de nº de items
+  - contexto RAG: hasta context_share del presupuesto libre (más si la
+    evidencia no lo necesita); se quitan primero los últimos chunks
+    (los de menor prioridad) y el último que entra se recorta por tokens
+  - evidencia por columna: se comprime por niveles (menos muestras por
+    columna, muestras más cortas, sin muestras) hasta que cabe
+
+Tokenizer: el de HuggingFace (transformers.AutoTokenizer) del modelo MLX o el
+indicado con --tokenizer; si no está disponible (p.ej. modelos de Ollama) se
+usa una estimación por palabras y signos.
+"""
+import json
+import re
+from functools import lru_cache
+
+# niveles de compresión de la evidencia: (muestras por columna, caracteres por muestra)
+EVIDENCE_LEVELS = [(None, None), (3, 48), (2, 32), (1, 24), (0, 0)]
+
+_EST_RE = re.compile(r"\w+|[^\w\s]", re.U)
+
+
+class TokenCounter:
+    """Cuenta tokens con el tokenizer de HF si se puede cargar; si no, estima."""
+
+    def __init__(self, tokenizer_name: str | None = None):
+        self.name = tokenizer_name
+        self.tokenizer = None
+        if tokenizer_name:
+            try:
+                from transformers import AutoTokenizer
+                self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+            except Exception as e:  # sin transformers, sin red o nombre que no es de HF (Ollama)
+                print(f"[WARN] No se pudo cargar el tokenizer '{tokenizer_name}' ({e}); se estiman los tokens.")
+        self.exact = self.tokenizer is not None
+        self.count = lru_cache(maxsize=65536)(self._count)
+
+    def _count(self, text: str) -> int:
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        # estimación: las palabras largas cuentan como varias piezas BPE (~4 caracteres)
+        return sum(max(1, (len(tok) + 3) // 4) if tok[0].isalnum() else 1 for tok in _EST_RE.findall(text))
+
+    def count_lines(self, lines) -> int:
+        # +1 por cada salto de línea del "\n".join
+        return sum(self.count(l) for l in lines) + max(0, len(lines) - 1)
+
+    def truncate(self, text: str, max_tokens: int, suffix: str = "...") -> str:
+        """Recorta `text` para que quepa en max_tokens (con sufijo si se recorta)."""
+        if self.count(text) <= max_tokens:
+            return text
+        if max_tokens <= self.count(suffix):
+            return ""
+        if self.tokenizer is not None:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)[: max_tokens - self.count(suffix)]
+            return self.tokenizer.decode(ids).rstrip() + suffix
+        lo, hi = 0, len(text)
+        while lo < hi:  # búsqueda binaria del corte por caracteres
+            mid = (lo + hi + 1) // 2
+            if self.count(text[:mid] + suffix) <= max_tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        return text[:lo].rstrip() + suffix
+
+
+def fit_context(counter: TokenCounter, intro_lines, blocks, budget: int):
+    """
+    Mete bloques de contexto (en orden de prioridad) hasta `budget` tokens.
+    Cada bloque es (cabecera, texto). Devuelve (líneas, tokens, nº de bloques descartados).
+    Si no cabe ni la introducción más un trozo útil del primer bloque, no hay contexto.
+    """
+    if not blocks or budget <= 0:
+        return [], 0, len(blocks)
+    lines = list(intro_lines)
+    used = counter.count_lines(lines)
+    kept = 0
+    for header, text in blocks:
+        room = budget - used - counter.count(header) - 3  # 3 saltos de línea
+        if room <= 0:
+            break
+        piece = counter.truncate(text, room)
+        if not piece:
+            break
+        lines += [header, piece, ""]
+        used = counter.count_lines(lines)
+        kept += 1
+        if piece is not text:
+            break
+    if kept == 0:
+        return [], 0, len(blocks)
+    return lines, used, len(blocks) - kept
+
+
+def format_samples(samples, n: int | None, max_chars: int | None) -> str:
+    samples = list(samples) if n is None else list(samples)[:n]
+    if max_chars:
+        samples = [s if len(str(s)) <= max_chars else str(s)[: max_chars - 3] + "..." for s in samples]
+    return json.dumps(samples, ensure_ascii=False)
+
+
+def fit_evidence(counter: TokenCounter, build_lines, budget: int | None):
+    """
+    build_lines(n_samples, max_chars) → líneas de evidencia. Prueba los niveles de
+    EVIDENCE_LEVELS de menos a más compresión y devuelve el primero que cabe:
+    (líneas, tokens, nivel). Si ni el último cabe, se devuelve ese igualmente.
+    """
+    for level, (n, max_chars) in enumerate(EVIDENCE_LEVELS):
+        lines = build_lines(n, max_chars)
+        used = counter.count_lines(lines)
+        if budget is None or used <= budget:
+            return lines, used, level
+    return lines, used, level
+
+
+def assemble(counter: TokenCounter, max_tokens: int | None, fixed_head, context_intro, context_blocks,
+             fixed_tail, build_evidence, context_share: float = 0.35):
+    """
+    Compone el prompt: fixed_head + contexto + fixed_tail + evidencia, en ese
+    orden. Sin max_tokens no se recorta nada y el prompt es byte a byte el de
+    antes del presupuesto (la introducción del contexto se mantiene aunque no
+    haya chunks); con presupuesto, sin chunks que quepan no hay introducción.
+    Devuelve (prompt, informe) con los tokens por sección.
+    """
+    fixed = counter.count_lines(list(fixed_head) + list(fixed_tail))
+    report = {"budget": max_tokens, "fixed": fixed, "exact": counter.exact}
+
+    if not max_tokens:
+        # como el prompt de siempre: introducción + el bloque de contexto unido en
+        # una línea, que queda vacía si el RAG no devolvió chunks
+        ctx_lines = []
+        if context_intro:
+            ctx_lines = list(context_intro) + ["\n".join(l for h, t in context_blocks for l in (h, t, ""))]
+        ev_lines, ev_tokens, level = fit_evidence(counter, build_evidence, None)
+        ctx_tokens, dropped = counter.count_lines(ctx_lines) if ctx_lines else 0, 0
+    else:
+        free = max(0, max_tokens - fixed)
+        ev_full = counter.count_lines(build_evidence(None, None))
+        # el contexto se queda con lo que no necesite la evidencia completa, y como mínimo su cuota
+        ctx_budget = max(free - ev_full, int(free * context_share))
+        ctx_lines, ctx_tokens, dropped = fit_context(counter, context_intro, context_blocks, ctx_budget)
+        ev_lines, ev_tokens, level = fit_evidence(counter, build_evidence, free - ctx_tokens)
+        if ev_tokens > free - ctx_tokens and ctx_lines:
+            # la evidencia mínima no cabe ni así: fuera el contexto
+            dropped, ctx_lines, ctx_tokens = len(context_blocks), [], 0
+            ev_lines, ev_tokens, level = fit_evidence(counter, build_evidence, free)
+
+    lines = list(fixed_head) + ctx_lines + list(fixed_tail) + ev_lines
+    prompt = "\n".join(lines)
+    total = counter.count(prompt)
+    report.update({
+        "context": ctx_tokens,
+        "context_dropped": dropped,
+        "evidence": ev_tokens,
+        "evidence_level": level,
+        "total": total,
+        "over_budget": bool(max_tokens) and total > max_tokens,
+    })
+    return prompt, report
+
+
+def format_report(r: dict) -> str:
+    kind = "tokens" if r["exact"] else "tokens~"
+    s = (f"{kind}={r['total']} (fijo={r['fixed']} contexto={r['context']} evidencia={r['evidence']})")
+    if r["budget"]:
+        s += f" presupuesto={r['budget']}"
+        if r["context_dropped"]:
+            s += f" chunks_descartados={r['context_dropped']}"
+        if r["evidence_level"]:
+            n, chars = EVIDENCE_LEVELS[r["evidence_level"]]
+            s += f" evidencia_comprimida=({n} muestras, {chars} car.)"
+        if r["over_budget"]:
+            s += " [EXCEDE]"
+    return s
@@ -0,0 +1,208 @@
+# rag_bm25.py
+"""
+Índice léxico BM25 del corpus RAG, para la recuperación híbrida de RAGClient.
+
+Los nombres de columna son tokens cortos (dni, num_ss, iban) que los embeddings
+de MiniLM no siempre acercan al chunk que los menciona literalmente; BM25 sí.
+El índice es una matriz de postings en formato CSR con el peso BM25 ya
+calculado por (término, chunk), así que puntuar una query es sumar unos pocos
+slices de numpy. Se guarda junto a chunks.jsonl (bm25.pkl) con la firma
+(tamaño + mtime) del fichero del que salió.
+"""
+import math
+import os
+import pickle
+import re
+import unicodedata
+
+import numpy as np
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_VERSION = 1
+BM25_NAME = "bm25.pkl"
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
+def bm25_path(chunks_path: str) -> str:
+    return os.path.join(os.path.dirname(chunks_path) or ".", BM25_NAME)
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+
+
+def tokenize(text: str):
+    """
+    Minúsculas sin tildes, tokens alfanuméricos. Los tokens con guion bajo se
+    indexan enteros y por partes (num_ss → num_ss, num, ss) para que casen
+    tanto el nombre literal de la columna como sus trozos.
+    """
+    out = []
+    for tok in _TOKEN_RE.findall(_strip_accents(text.lower())):
+        tok = tok.strip("_")
+        if len(tok) < 2:
+            continue
+        out.append(tok)
+        if "_" in tok:
+            out.extend(p for p in tok.split("_") if len(p) >= 2)
+    return out
+
+
+class BM25Builder:
+    """
+    Construcción incremental de BM25Index: add() recibe los textos de uno en
+    uno y solo guarda sus postings (término → [(chunk, frecuencia)]) y su
+    longitud; los pesos se calculan en build(), cuando ya se conoce avgdl.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1, self.b = k1, b
+        self.postings = {}
+        self.lengths = []
+
+    def add(self, text: str):
+        doc = len(self.lengths)
+        toks = tokenize(text)
+        self.lengths.append(len(toks))
+        tf = {}
+        for t in toks:
+            tf[t] = tf.get(t, 0) + 1
+        for t, f in tf.items():
+            self.postings.setdefault(t, []).append((doc, f))
+
+    def build(self) -> "BM25Index":
+        k1, b = self.k1, self.b
+        n = len(self.lengths)
+        avgdl = (sum(self.lengths) / n) if n else 0.0
+        norms = np.asarray(self.lengths, dtype="float64")
+        norms = k1 * (1 - b + b * norms / avgdl) if avgdl else np.full(n, k1)
+        vocab = {t: i for i, t in enumerate(sorted(self.postings))}
+
+        indptr = np.zeros(len(vocab) + 1, dtype="int64")
+        doc_ids, weights = [], []
+        for t, row in vocab.items():
+            plist = self.postings[t]
+            df = len(plist)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            indptr[row + 1] = indptr[row] + df
+            doc_ids.extend(d for d, _ in plist)
+            weights.extend(idf * f * (k1 + 1) / (f + norms[d]) for d, f in plist)
+        return BM25Index(vocab, indptr, np.asarray(doc_ids, dtype="int32"),
+                         np.asarray(weights, dtype="float32"), n)
+
+
+class BM25Index:
+    def __init__(self, vocab: dict, indptr, doc_ids, weights, n_docs: int):
+        self.vocab = vocab          # término → fila
+        self.indptr = indptr        # CSR: postings de la fila i en [indptr[i], indptr[i+1])
+        self.doc_ids = doc_ids      # posición del chunk
+        self.weights = weights      # peso BM25 precalculado
+        self.n_docs = n_docs
+
+    @classmethod
+    def build(cls, texts, k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        builder = BM25Builder(k1, b)
+        for text in texts:
+            builder.add(text)
+        return builder.build()
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.n_docs, dtype="float32")
+        for t in tokenize(query):
+            row = self.vocab.get(t)
+            if row is None:
+                continue
+            lo, hi = self.indptr[row], self.indptr[row + 1]
+            # en una fila cada chunk aparece una sola vez: la suma con fancy index es segura
+            scores[self.doc_ids[lo:hi]] += self.weights[lo:hi]
+        return scores
+
+    def search(self, query: str, k: int):
+        """[(posición, score)] de los k mejores chunks con score > 0, de mayor a menor."""
+        scores = self.scores(query)
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(int(i), float(scores[i])) for i in hits]
+
+    def search_many(self, queries, k: int):
+        """
+        search() para varias queries a la vez, en disperso: las postings de todas
+        las queries se suman por pareja (query, chunk) con un único np.unique +
+        np.bincount, así que la memoria depende de las postings tocadas y no de
+        n_queries x n_docs.
+        """
+        q_idx, d_idx, w = [], [], []
+        for qi, query in enumerate(queries):
+            for t in tokenize(query):
+                row = self.vocab.get(t)
+                if row is None:
+                    continue
+                lo, hi = self.indptr[row], self.indptr[row + 1]
+                q_idx.append(np.full(hi - lo, qi, dtype="int64"))
+                d_idx.append(self.doc_ids[lo:hi])
+                w.append(self.weights[lo:hi])
+        if not q_idx:
+            return [[] for _ in queries]
+
+        keys = np.concatenate(q_idx) * self.n_docs + np.concatenate(d_idx)
+        pairs, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=np.concatenate(w)).astype("float32")
+        # pairs va ordenado por (query, chunk): cada query es un tramo contiguo
+        bounds = np.searchsorted(pairs // self.n_docs, np.arange(len(queries) + 1))
+
+        out = []
+        for qi in range(len(queries)):
+            lo, hi = bounds[qi], bounds[qi + 1]
+            docs, row = pairs[lo:hi] % self.n_docs, sums[lo:hi]
+            hits = np.flatnonzero(row > 0)
+            if len(hits) > k:
+                hits = hits[np.argpartition(-row[hits], k - 1)[:k]]
+            hits = hits[np.argsort(-row[hits], kind="stable")]
+            out.append([(int(docs[i]), float(row[i])) for i in hits])
+        return out
+
+    # ---------- persistencia ----------
+
+    def save(self, path: str, signature=None):
+        data = {
+            "version": BM25_VERSION,
+            "signature": signature,
+            "vocab": self.vocab,
+            "indptr": self.indptr,
+            "doc_ids": self.doc_ids,
+            "weights": self.weights,
+            "n_docs": self.n_docs,
+        }
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, signature=None):
+        """Carga el índice si existe y corresponde a `signature`; si no, None."""
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if data.get("version") != BM25_VERSION or data.get("signature") != signature:
+            return None
+        return cls(data["vocab"], data["indptr"], data["doc_ids"], data["weights"], data["n_docs"])
+
+
+def reciprocal_rank_fusion(rankings, rrf_k: int = 60):
+    """
+    Fusión RRF de varias listas de posiciones ordenadas (mejor primero):
+    score(d) = Σ 1 / (rrf_k + rango). Devuelve [(posición, score)] de mayor a menor;
+    los empates se resuelven por orden de primera aparición.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking, start=1):
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda x: -x[1])
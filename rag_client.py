@@ -1,63 +1,490 @@
 # rag_client.py
+"""
+Cliente RAG (FAISS + SentenceTransformer) con inicialización perezosa:
+crear un RAGClient no carga nada; el índice, los chunks y el modelo de
+embeddings se cargan la primera vez que se usan. Así `classifier.py` y los
+scripts auto_request_* no pagan el import de faiss / sentence_transformers
+(ni la carga del modelo) si no se usa el RAG.
+
+Los metadatos de los chunks se guardan además en un sidecar binario
+(<chunks>.meta.pkl) con listas de ids precalculadas por chunk_type, scope y
+dominio y el offset de cada línea; los textos no se cargan en memoria, cada
+chunk se lee de chunks.jsonl por su offset cuando hace falta (ChunkStore).
+Solo se vuelve a recorrer chunks.jsonl si el sidecar no corresponde al
+fichero actual (tamaño + mtime).
+
+Modos de recuperación (retrieval):
+  - dense  → solo FAISS (por defecto, comportamiento de siempre)
+  - hybrid → FAISS + BM25 (rag_bm25.py) fusionados con reciprocal rank fusion;
+             ayuda con nombres de columna literales (dni, num_ss, iban)
+
+Además del modo "una query por tabla", retrieve_columns_context_many busca con
+una query corta por columna (en bloques de tablas de hasta COLUMN_QUERY_BATCH
+queries) y ordena los chunks de cada tabla por cobertura de columnas, para que
+en tablas anchas no se queden fuera las columnas que no caben en la ventana de
+MiniLM.
+"""
 import json
-import faiss
+import os
+import pickle
+import threading
+from collections import OrderedDict
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+import rag_index
+from rag_bm25 import BM25Index, bm25_path, reciprocal_rank_fusion
 
 INDEX_PATH = "rag_corpus/index.faiss"
 CHUNKS_PATH = "rag_corpus/chunks.jsonl"
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_CACHE_SIZE = 2048  # nº de embeddings de queries memorizados (LRU por texto)
+SIDECAR_VERSION = 3
+CHUNK_CACHE_SIZE = 4096  # chunks parseados memorizados por ChunkStore (LRU por posición)
+RETRIEVAL_MODES = ("dense", "hybrid")
+RRF_K = 60
+K_PER_COLUMN = 10  # candidatos por columna en retrieve_columns_context_many
+COLUMN_QUERY_BATCH = 256  # queries de columna por batch de embeddings + búsqueda
+
+
+def sidecar_path(chunks_path: str) -> str:
+    return chunks_path + ".meta.pkl"
+
+
+def _file_signature(path: str):
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime_ns)
+
+
+class ChunkMetaBuilder:
+    """
+    Índices de posiciones de chunk por chunk_type, scope y dominio, y offset de
+    cada línea de chunks.jsonl, construidos chunk a chunk (sin guardar textos).
+    La clave None agrupa los chunks SIN scope / SIN dominios (valen para todos).
+    Si los chunks traen "vid" (builder incremental), pos_by_vid traduce los
+    ids que devuelve FAISS a posiciones.
+    """
+
+    def __init__(self):
+        self.by_type, self.by_scope, self.by_domain = {}, {}, {}
+        self.pos_by_vid = {}
+        self.offsets = [0]
+
+    def add(self, chunk: dict, n_bytes: int):
+        i = len(self.offsets) - 1
+        self.offsets.append(self.offsets[-1] + n_bytes)
+        if "vid" in chunk:
+            self.pos_by_vid[chunk["vid"]] = i
+        meta = chunk.get("metadata", {})
+        self.by_type.setdefault(meta.get("chunk_type"), set()).add(i)
+        self.by_scope.setdefault(meta.get("scope"), set()).add(i)
+        for d in meta.get("domains") or [None]:
+            self.by_domain.setdefault(d, set()).add(i)
+
+    def meta(self) -> dict:
+        return {
+            "by_type": self.by_type,
+            "by_scope": self.by_scope,
+            "by_domain": self.by_domain,
+            "pos_by_vid": self.pos_by_vid or None,
+            "offsets": np.asarray(self.offsets, dtype="int64"),
+        }
+
+
+def scan_chunks(chunks_path: str) -> dict:
+    """Metadatos de chunks.jsonl leyéndolo línea a línea."""
+    builder = ChunkMetaBuilder()
+    with open(chunks_path, "rb") as f:
+        for line in f:
+            builder.add(json.loads(line), len(line))
+    return builder.meta()
+
+
+class ChunkStore:
+    """
+    Chunks de chunks.jsonl leídos bajo demanda: store[i] lee la línea i por su
+    offset y la parsea. Los últimos `cache_size` chunks parseados se memorizan
+    (los mismos chunks de definiciones salen en casi todas las tablas).
+    """
+
+    def __init__(self, chunks_path: str, offsets, cache_size: int = CHUNK_CACHE_SIZE):
+        self.path = chunks_path
+        self.offsets = offsets  # la línea i ocupa [offsets[i], offsets[i + 1])
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._fh = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        with self._lock:
+            ch = self._cache.get(i)
+            if ch is not None:
+                self._cache.move_to_end(i)
+                return ch
+            if self._fh is None:
+                self._fh = open(self.path, "rb")
+            self._fh.seek(int(self.offsets[i]))
+            ch = json.loads(self._fh.read(int(self.offsets[i + 1] - self.offsets[i])))
+            self._cache[i] = ch
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return ch
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+def write_chunk_sidecar(chunks_path: str, meta: dict) -> str:
+    """Escribe el sidecar binario de chunks.jsonl (lo llama también el builder)."""
+    out = sidecar_path(chunks_path)
+    data = {
+        "version": SIDECAR_VERSION,
+        "signature": _file_signature(chunks_path),
+        **meta,
+    }
+    tmp = out + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, out)
+    return out
+
+
+def write_bm25_index(chunks_path: str, bm25: BM25Index) -> str:
+    """Guarda el índice BM25 de chunks.jsonl con su firma (lo llama también el builder)."""
+    out = bm25_path(chunks_path)
+    bm25.save(out, signature=_file_signature(chunks_path))
+    return out
+
+
+def load_chunks(chunks_path: str) -> dict:
+    """
+    Metadatos de los chunks + ChunkStore para leerlos, desde el sidecar si está
+    al día o recorriendo chunks.jsonl (y regenerando el sidecar) si no.
+    """
+    side = sidecar_path(chunks_path)
+    data = None
+    try:
+        with open(side, "rb") as f:
+            data = pickle.load(f)
+        if data.get("version") != SIDECAR_VERSION or data.get("signature") != _file_signature(chunks_path):
+            data = None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        data = None
+
+    if data is None:
+        data = scan_chunks(chunks_path)
+        try:
+            write_chunk_sidecar(chunks_path, data)
+        except OSError as e:
+            print(f"[RAG] No se pudo escribir el sidecar de {chunks_path}: {e}")
+    return {**data, "chunks": ChunkStore(chunks_path, data["offsets"])}
+
+
+def rank_by_coverage(candidate_lists, rrf_k: int = RRF_K):
+    """
+    Une los candidatos de varias queries (una por columna) en una sola lista
+    ordenada por cobertura: en cada paso se elige el chunk que más peso aporta
+    en columnas aún no cubiertas (peso de la columna c en el chunk j =
+    1 / (rrf_k + rango)); cuando ya no aporta ninguno, se sigue por peso total.
+    Cada candidato devuelto lleva "score" (peso total) y "coverage" (nº de columnas).
+    """
+    first = {}
+    for cands in candidate_lists:
+        for c in cands:
+            first.setdefault(c["idx"], c)
+    if not first:
+        return []
+    order = list(first)
+    col_of = {idx: j for j, idx in enumerate(order)}
+
+    w = np.zeros((len(candidate_lists), len(order)), dtype="float32")
+    for i, cands in enumerate(candidate_lists):
+        for rank, c in enumerate(cands, start=1):
+            w[i, col_of[c["idx"]]] = max(w[i, col_of[c["idx"]]], 1.0 / (rrf_k + rank))
+
+    total = w.sum(axis=0)
+    hits = (w > 0).sum(axis=0)
+    uncovered = np.ones(len(candidate_lists), dtype="float32")
+    remaining = np.ones(len(order), dtype=bool)
+    ranked = []
+    while remaining.any():
+        gain = uncovered @ w
+        gain[~remaining] = -1.0
+        j = int(np.argmax(gain))
+        if gain[j] <= 0:
+            break
+        ranked.append(j)
+        remaining[j] = False
+        uncovered[w[:, j] > 0] = 0.0
+    rest = np.flatnonzero(remaining)
+    ranked.extend(rest[np.argsort(-total[rest], kind="stable")].tolist())
+
+    return [
+        dict(first[order[j]], score=float(total[j]), coverage=int(hits[j]))
+        for j in ranked
+    ]
+
 
 class RAGClient:
     def __init__(self,
                  index_path: str = INDEX_PATH,
                  chunks_path: str = CHUNKS_PATH,
-                 model_name: str = MODEL_NAME):
-        # Cargamos índice FAISS
-        self.index = faiss.read_index(index_path)
-
-        # Cargamos los chunks (texto + metadata)
-        self.chunks = []
-        with open(chunks_path, "r", encoding="utf-8") as f:
-            for line in f:
-                self.chunks.append(json.loads(line))
-
-        print(f"[RAG] Cargados {len(self.chunks)} chunks de {chunks_path}")
-
-        # Modelo de embeddings
-        self.embed_model = SentenceTransformer(model_name)
+                 model_name: str = MODEL_NAME,
+                 embed_cache_size: int = EMBED_CACHE_SIZE,
+                 retrieval: str = "dense"):
+        if retrieval not in RETRIEVAL_MODES:
+            raise ValueError(f"retrieval debe ser uno de {RETRIEVAL_MODES}, no {retrieval!r}")
+        self.index_path = index_path
+        self.chunks_path = chunks_path
+        self.model_name = model_name
+        self.retrieval = retrieval
+
+        # se cargan bajo demanda (ver propiedades)
+        self._index = None
+        self._index_config = None
+        self._chunk_data = None
+        self._embed_model = None
+        self._bm25 = None
+        self._load_lock = threading.Lock()
+
+        # LRU de embeddings de queries (texto → vector)
+        self.embed_cache_size = embed_cache_size
+        self._emb_cache = OrderedDict()
+        self._emb_lock = threading.Lock()
+        self.embed_hits = 0
+        self.embed_misses = 0
+
+    # ---------- carga perezosa ----------
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._load_lock:
+                if self._index is None:
+                    import faiss
+                    index = faiss.read_index(self.index_path)
+                    rag_index.apply_search_params(index, self.index_config)
+                    self._index = index
+        return self._index
+
+    @property
+    def index_config(self) -> dict:
+        # tipo de índice / métrica / normalización con que se construyó (index_config.json)
+        if self._index_config is None:
+            self._index_config = rag_index.load_config(self.index_path)
+        return self._index_config
+
+    @property
+    def chunk_data(self) -> dict:
+        if self._chunk_data is None:
+            with self._load_lock:
+                if self._chunk_data is None:
+                    self._chunk_data = load_chunks(self.chunks_path)
+                    print(f"[RAG] Cargados {len(self._chunk_data['chunks'])} chunks de {self.chunks_path}")
+        return self._chunk_data
+
+    @property
+    def chunks(self):
+        return self.chunk_data["chunks"]
+
+    @property
+    def embed_model(self):
+        if self._embed_model is None:
+            with self._load_lock:
+                if self._embed_model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._embed_model = SentenceTransformer(self.model_name)
+        return self._embed_model
+
+    @property
+    def bm25(self) -> BM25Index:
+        # índice léxico precalculado por el builder; si no está al día se
+        # construye en memoria (y se intenta guardar para la próxima vez)
+        if self._bm25 is None:
+            chunks = self.chunks
+            with self._load_lock:
+                if self._bm25 is None:
+                    sig = _file_signature(self.chunks_path)
+                    bm25 = BM25Index.load(bm25_path(self.chunks_path), signature=sig)
+                    if bm25 is None or bm25.n_docs != len(chunks):
+                        bm25 = BM25Index.build(c["text"] for c in chunks)
+                        try:
+                            bm25.save(bm25_path(self.chunks_path), signature=sig)
+                        except OSError as e:
+                            print(f"[RAG] No se pudo guardar el índice BM25: {e}")
+                    self._bm25 = bm25
+        return self._bm25
 
     # ✅ Método original: top-k "a secas"
-    def retrieve_context(self, query: str, k: int = 5):
-        q_emb = self.embed_model.encode([query])
-        q_emb = np.array(q_emb).astype("float32")
-        distances, indices = self.index.search(q_emb, k)
+    def retrieve_context(self, query: str, k: int = 5, retrieval: str | None = None):
+        if (retrieval or self.retrieval) == "hybrid":
+            return [c["chunk"] for c in self._hybrid_candidates_many([query], k)[0][:k]]
+        _, indices = self._search(self._embed([query]), k)
         results = [self.chunks[i] for i in indices[0] if 0 <= i < len(self.chunks)]
         return results
 
     # ---------- helpers internos ----------
 
+    def _search(self, q_emb, k: int):
+        """
+        Búsqueda FAISS según index_config: las queries se normalizan si el índice
+        es de producto interno, y los scores se devuelven como distancias
+        (menor = más similar) sea cual sea la métrica. Los índices devueltos son
+        siempre posiciones en self.chunks (se traducen los vid si hace falta).
+        """
+        cfg = self.index_config
+        index = self.index
+        if cfg.get("index_type") == "hnsw":
+            rag_index.apply_search_params(index, cfg, k=k)
+        scores, indices = index.search(rag_index.prepare_queries(q_emb, cfg), k)
+        pos_by_vid = self.chunk_data.get("pos_by_vid")
+        if pos_by_vid is not None:
+            indices = np.array([[pos_by_vid.get(int(i), -1) for i in row] for row in indices], dtype="int64")
+        return rag_index.scores_to_distances(scores, cfg), indices
+
+    def _embed(self, queries):
+        """
+        Embeddings (n, dim) float32 de las queries. Las que ya están en el LRU no
+        se recalculan; el resto se codifica en UNA sola llamada batch al modelo.
+        """
+        vecs = {}
+        missing = []
+        with self._emb_lock:
+            for q in queries:
+                if q in vecs:
+                    continue
+                v = self._emb_cache.get(q)
+                if v is not None:
+                    self._emb_cache.move_to_end(q)
+                    vecs[q] = v
+                    self.embed_hits += 1
+                elif q not in missing:
+                    missing.append(q)
+                    self.embed_misses += 1
+
+        if missing:
+            embs = np.asarray(self.embed_model.encode(missing), dtype="float32")
+            with self._emb_lock:
+                for q, v in zip(missing, embs):
+                    vecs[q] = v
+                    self._emb_cache[q] = v
+                    self._emb_cache.move_to_end(q)
+                while len(self._emb_cache) > self.embed_cache_size:
+                    self._emb_cache.popitem(last=False)
+
+        return np.stack([vecs[q] for q in queries]).astype("float32")
+
+    def _search_candidates_many(self, queries, k: int = 50):
+        """
+        Igual que _search_candidates pero para varias queries: un único batch de
+        embeddings y una única búsqueda FAISS con la matriz de queries.
+        """
+        if not queries:
+            return []
+        distances, indices = self._search(self._embed(list(queries)), k)
+
+        out = []
+        for row_d, row_i in zip(distances, indices):
+            cands = []
+            for dist, idx in zip(row_d, row_i):
+                if idx < 0 or idx >= len(self.chunks):
+                    continue
+                cands.append({
+                    "chunk": self.chunks[idx],
+                    "dist": float(dist),
+                    "idx": int(idx),
+                })
+            # cuanto menor dist, más similar → ordenamos por dist asc
+            cands.sort(key=lambda x: x["dist"])
+            out.append(cands)
+        return out
+
+    def _hybrid_candidates_many(self, queries, k: int = 50):
+        """
+        Candidatos densos (FAISS) y léxicos (BM25), k de cada, fusionados con RRF.
+        Cada candidato lleva "score" (RRF, mayor = mejor) y "dist" (la de FAISS,
+        o None si solo lo encontró BM25); la lista va ordenada por score.
+        """
+        dense_all = self._search_candidates_many(queries, k=k)
+        lexical_all = self.bm25.search_many(queries, k)
+        out = []
+        for dense, lexical in zip(dense_all, lexical_all):
+            lexical = [idx for idx, _ in lexical]
+            dist_by_idx = {c["idx"]: c["dist"] for c in dense}
+            fused = reciprocal_rank_fusion([[c["idx"] for c in dense], lexical], rrf_k=RRF_K)
+            out.append([
+                {"chunk": self.chunks[idx], "dist": dist_by_idx.get(idx), "idx": idx, "score": score}
+                for idx, score in fused
+            ])
+        return out
+
+    def _candidates_many(self, queries, k: int, retrieval: str | None = None):
+        if (retrieval or self.retrieval) == "hybrid":
+            return self._hybrid_candidates_many(queries, k=k)
+        return self._search_candidates_many(queries, k=k)
+
+    def column_candidates_many(self, column_queries_per_table, k_per_column: int = K_PER_COLUMN,
+                               retrieval: str | None = None, query_batch: int = COLUMN_QUERY_BATCH):
+        """
+        Candidatos por tabla a partir de una query por columna. Las tablas se
+        agrupan en bloques de hasta `query_batch` queries distintas; cada bloque
+        se embebe y se busca junto (un batch + una búsqueda), se agrega y
+        deduplica por tabla con rank_by_coverage y sus candidatos se sueltan
+        antes del siguiente. Una tabla con más columnas que query_batch va sola
+        y se busca en varios tramos.
+        """
+        per_table = [list(qs) for qs in column_queries_per_table]
+        if not any(per_table) or not self.chunks:
+            return [[] for _ in per_table]
+        k = min(k_per_column, len(self.chunks))
+        query_batch = max(1, query_batch)
+
+        out, block, block_queries = [], [], {}
+
+        def flush():
+            queries = list(block_queries)
+            cands = {}
+            for i in range(0, len(queries), query_batch):
+                part = queries[i:i + query_batch]
+                cands.update(zip(part, self._candidates_many(part, k, retrieval)))
+            out.extend(rank_by_coverage([cands[q] for q in qs]) for qs in block)
+            block.clear()
+            block_queries.clear()
+
+        for qs in per_table:
+            new = len({q for q in qs if q not in block_queries})
+            if block and len(block_queries) + new > query_batch:
+                flush()
+            block.append(qs)
+            block_queries.update(dict.fromkeys(qs))
+        flush()
+        return out
+
+    def retrieve_columns_context(self, column_queries, k: int = 5, k_per_column: int = K_PER_COLUMN,
+                                 retrieval: str | None = None):
+        """Top-k "a secas" pero por cobertura de columnas (equivalente a retrieve_context)."""
+        cands = self.column_candidates_many([column_queries], k_per_column, retrieval)[0]
+        return [c["chunk"] for c in cands[:k]]
+
     def _search_candidates(self, query: str, k: int = 50):
         """
         Devuelve una lista de candidatos con su score:
         [ { "chunk": {...}, "dist": float }, ... ]
         """
-        q_emb = self.embed_model.encode([query])
-        q_emb = np.array(q_emb).astype("float32")
-        distances, indices = self.index.search(q_emb, k)
-
-        cands = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx < 0 or idx >= len(self.chunks):
-                continue
-            cands.append({
-                "chunk": self.chunks[idx],
-                "dist": float(dist),
-                "idx": int(idx),
-            })
-        # cuanto menor dist, más similar → ordenamos por dist asc
-        cands.sort(key=lambda x: x["dist"])
-        return cands
+        return self._search_candidates_many([query], k=k)[0]
 
     def _get_chunk_id(self, chunk_obj, fallback_idx):
         """
@@ -70,74 +497,59 @@ class RAGClient:
             cid = f"idx_{fallback_idx}"
         return cid
 
-    def _scope_ok(self, meta_scope, requested_scope):
+    def _scope_ids(self, requested_scope):
         """
-        Regla de scope:
-        - Si requested_scope es None o 'any' → siempre OK.
-        - Si meta_scope es None → lo aceptamos (chunks sin scope sirven para todos).
-        - Si meta_scope == requested_scope → OK.
+        Posiciones de chunk válidas para requested_scope (None = todas):
+        - Si requested_scope es None o 'any' → todas.
+        - Los chunks sin scope sirven para todos; el resto, solo si coincide.
         """
         if not requested_scope or requested_scope == "any":
-            return True
-        if meta_scope is None:
-            return True
-        return meta_scope == requested_scope
+            return None
+        by_scope = self.chunk_data["by_scope"]
+        return by_scope.get(requested_scope, set()) | by_scope.get(None, set())
 
     def _pick_by_type(self, candidates, used_ids, chunk_type, n_desired,
                       scope=None, domain_hint=None):
         """
         Selecciona hasta n_desired candidatos de un determinado chunk_type,
         respetando scope y domain_hint cuando se pueda.
+        Los filtros de tipo / scope / dominio son consultas a conjuntos de ids
+        precalculados; los candidatos se recorren una sola vez.
         """
-        selected = []
+        meta_ids = self.chunk_data
+        type_ids = meta_ids["by_type"].get(chunk_type, set())
+        scope_ids = self._scope_ids(scope)
 
-        # Primero intentamos con dominio que haga match (si se indica)
+        # candidatos del tipo y scope pedidos, en orden de similitud
+        typed = []
         for c in candidates:
-            ch = c["chunk"]
-            meta = ch.get("metadata", {})
-            cid = self._get_chunk_id(ch, c["idx"])
-
-            if cid in used_ids:
+            idx = c["idx"]
+            if idx not in type_ids:
                 continue
-
-            if not self._scope_ok(meta.get("scope"), scope):
+            if scope_ids is not None and idx not in scope_ids:
                 continue
+            typed.append(c)
 
-            if meta.get("chunk_type") != chunk_type:
-                continue
+        # Primero los que hacen match de dominio (o no declaran dominios)
+        if domain_hint:
+            by_domain = meta_ids["by_domain"]
+            domain_ids = by_domain.get(domain_hint, set()) | by_domain.get(None, set())
+            preferred = [c for c in typed if c["idx"] in domain_ids]
+        else:
+            preferred = typed
 
-            domains = meta.get("domains") or []
-            if domain_hint and domains:
-                # solo dejamos pasar los que contengan el dominio
-                if domain_hint not in domains:
-                    continue
-
-            selected.append(ch)
-            used_ids.add(cid)
-            if len(selected) >= n_desired:
-                return selected
-
-        # Si faltan, completamos sin filtrar por dominio
-        if len(selected) < n_desired:
-            for c in candidates:
+        selected = []
+        # ...y si faltan, completamos sin filtrar por dominio
+        for pool in (preferred, typed):
+            for c in pool:
+                if len(selected) >= n_desired:
+                    return selected
                 ch = c["chunk"]
-                meta = ch.get("metadata", {})
                 cid = self._get_chunk_id(ch, c["idx"])
-
                 if cid in used_ids:
                     continue
-
-                if not self._scope_ok(meta.get("scope"), scope):
-                    continue
-
-                if meta.get("chunk_type") != chunk_type:
-                    continue
-
                 selected.append(ch)
                 used_ids.add(cid)
-                if len(selected) >= n_desired:
-                    break
-
         return selected
 
     # ---------- retrieve_mixed_context ----------
@@ -152,6 +564,7 @@ class RAGClient:
         n_casos_borde: int = 1,
         n_dominios: int = 1,
         n_max_total: int = 8,
+        retrieval: str | None = None,
     ):
         """
         Recupera un contexto mezclado con una proporción aproximada de tipos:
@@ -160,15 +573,95 @@ class RAGClient:
         - casos_borde
         - dominio (si hay domain_hint)
         Usa scope sólo como filtro suave; los chunks sin scope también son válidos.
+        retrieval: dense | hybrid (por defecto, el del cliente).
         """
-
+        return self.retrieve_mixed_context_many(
+            [query],
+            scope=scope,
+            domain_hint=domain_hint,
+            n_defs=n_defs,
+            n_ejemplos=n_ejemplos,
+            n_casos_borde=n_casos_borde,
+            n_dominios=n_dominios,
+            n_max_total=n_max_total,
+            retrieval=retrieval,
+        )[0]
+
+    def retrieve_mixed_context_many(
+        self,
+        queries,
+        scope: str = "core",
+        domain_hint: str | None = None,
+        n_defs: int = 1,
+        n_ejemplos: int = 3,
+        n_casos_borde: int = 1,
+        n_dominios: int = 1,
+        n_max_total: int = 8,
+        retrieval: str | None = None,
+    ):
+        """
+        Versión batch de retrieve_mixed_context: una lista de contextos, uno por
+        query y en el mismo orden. Los embeddings se calculan en un solo batch
+        (con LRU por texto de query) y FAISS se consulta una sola vez.
+        """
+        queries = list(queries)
         if not self.chunks:
-            return []
+            return [[] for _ in queries]
 
         # Pedimos bastantes candidatos al índice para poder filtrar.
         k_search = min(80, len(self.chunks))
-        candidates = self._search_candidates(query, k=k_search)
+        all_candidates = self._candidates_many(queries, k_search, retrieval)
+
+        return [
+            self._select_mixed(
+                candidates,
+                scope=scope,
+                domain_hint=domain_hint,
+                n_defs=n_defs,
+                n_ejemplos=n_ejemplos,
+                n_casos_borde=n_casos_borde,
+                n_dominios=n_dominios,
+                n_max_total=n_max_total,
+            )
+            for candidates in all_candidates
+        ]
+
+    def retrieve_columns_context_many(
+        self,
+        column_queries_per_table,
+        scope: str = "core",
+        domain_hint: str | None = None,
+        n_defs: int = 1,
+        n_ejemplos: int = 3,
+        n_casos_borde: int = 1,
+        n_dominios: int = 1,
+        n_max_total: int = 8,
+        k_per_column: int = K_PER_COLUMN,
+        retrieval: str | None = None,
+    ):
+        """
+        Como retrieve_mixed_context_many, pero cada tabla se describe con una
+        lista de queries (una por columna) y los candidatos llegan ordenados por
+        cobertura de columnas antes de aplicar las cuotas por tipo.
+        """
+        all_candidates = self.column_candidates_many(column_queries_per_table, k_per_column, retrieval)
+        return [
+            self._select_mixed(
+                candidates,
+                scope=scope,
+                domain_hint=domain_hint,
+                n_defs=n_defs,
+                n_ejemplos=n_ejemplos,
+                n_casos_borde=n_casos_borde,
+                n_dominios=n_dominios,
+                n_max_total=n_max_total,
+            )
+            for candidates in all_candidates
+        ]
 
+    def _select_mixed(self, candidates, scope, domain_hint, n_defs, n_ejemplos,
+                      n_casos_borde, n_dominios, n_max_total):
+        """Selección por tipos sobre la lista de candidatos de UNA query."""
         used_ids = set()
         final_chunks = []
 
@@ -214,15 +707,15 @@ class RAGClient:
 
         # 5) Si aún faltan hasta n_max_total, rellenamos con lo mejor que quede (sin mirar chunk_type)
         if len(final_chunks) < n_max_total:
+            scope_ids = self._scope_ids(scope)
             for c in candidates:
                 ch = c["chunk"]
-                meta = ch.get("metadata", {})
                 cid = self._get_chunk_id(ch, c["idx"])
 
                 if cid in used_ids:
                     continue
 
-                if not self._scope_ok(meta.get("scope"), scope):
+                if scope_ids is not None and c["idx"] not in scope_ids:
                     continue
 
                 final_chunks.append(ch)
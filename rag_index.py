@@ -0,0 +1,210 @@
+# rag_index.py
+"""
+Tipos de índice FAISS para el corpus RAG y su configuración persistida.
+
+  - flat  → IndexFlatL2 exacto (el de siempre)
+  - ip    → IndexFlatIP sobre vectores normalizados (similitud coseno, exacto)
+  - hnsw  → IndexHNSWFlat (grafo, sin entrenamiento; efSearch en búsqueda)
+  - ivfpq → IndexIVFPQ (entrenado; nlist listas, PQ de pq_m subvectores; nprobe en búsqueda)
+
+El builder guarda junto al índice un index_config.json con el tipo, la métrica,
+si los vectores van normalizados y los parámetros de búsqueda; RAGClient lo lee
+para preparar las queries igual que se indexaron y para interpretar los scores.
+
+Con ids (builder incremental) el índice va envuelto en un IndexIDMap2: FAISS
+devuelve el id estable del chunk ("vid") en vez de su posición, y se pueden
+borrar / añadir vectores sueltos sin reconstruir (salvo HNSW, que no admite
+remove_ids y se reconstruye desde los vectores guardados).
+"""
+import json
+import os
+
+import numpy as np
+
+INDEX_TYPES = ("flat", "ip", "hnsw", "ivfpq")
+METRICS = ("l2", "ip")
+CONFIG_NAME = "index_config.json"
+
+DEFAULT_PARAMS = {
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 128,
+    "ivf_nlist": 1024,
+    "pq_m": 48,
+    "pq_nbits": 8,
+    "nprobe": 16,
+}
+
+# FAISS recomienda ~39 puntos de entrenamiento por centroide
+MIN_POINTS_PER_CENTROID = 39
+# tope de vectores de entrenamiento para IVF-PQ (muestra equiespaciada)
+MAX_TRAIN_POINTS = 256 * 1024
+
+
+def config_path(index_path: str) -> str:
+    return os.path.join(os.path.dirname(index_path) or ".", CONFIG_NAME)
+
+
+def default_metric(index_type: str) -> str:
+    return "ip" if index_type == "ip" else "l2"
+
+
+def normalize(embs) -> np.ndarray:
+    embs = np.ascontiguousarray(embs, dtype="float32")
+    norms = np.linalg.norm(embs, axis=1, keepdims=True)
+    return embs / np.maximum(norms, 1e-12)
+
+
+def make_config(index_type: str = "flat", metric: str | None = None, **params) -> dict:
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"index_type desconocido: {index_type} (opciones: {', '.join(INDEX_TYPES)})")
+    metric = metric or default_metric(index_type)
+    if metric not in METRICS:
+        raise ValueError(f"métrica desconocida: {metric} (opciones: {', '.join(METRICS)})")
+    if index_type == "ip" and metric != "ip":
+        raise ValueError("index_type=ip implica métrica ip")
+    if index_type == "flat" and metric != "l2":
+        raise ValueError("index_type=flat es L2; para producto interno usa index_type=ip")
+    cfg = {"index_type": index_type, "metric": metric, "normalize": metric == "ip"}
+    for k, v in DEFAULT_PARAMS.items():
+        cfg[k] = params.get(k) if params.get(k) is not None else v
+    return cfg
+
+
+def _faiss_metric(faiss, metric):
+    return faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+
+
+def _fit_ivfpq_params(cfg: dict, n: int, dim: int) -> dict:
+    """
+    Ajusta nlist / pq_nbits al tamaño del corpus (con pocos vectores no se
+    pueden entrenar 1024 centroides ni un codebook de 256 entradas).
+    """
+    cfg = dict(cfg)
+    nlist = max(1, min(cfg["ivf_nlist"], n // MIN_POINTS_PER_CENTROID))
+    nbits = cfg["pq_nbits"]
+    while nbits > 1 and (1 << nbits) > n:
+        nbits -= 1
+    if dim % cfg["pq_m"] != 0:
+        raise ValueError(f"pq_m={cfg['pq_m']} debe dividir la dimensión del embedding ({dim})")
+    changes = [f"{name} {cfg[name]}→{v}" for name, v in (("ivf_nlist", nlist), ("pq_nbits", nbits)) if cfg[name] != v]
+    if changes:
+        print(f"[WARN] Corpus pequeño ({n} vectores): {', '.join(changes)}")
+    cfg["ivf_nlist"] = nlist
+    cfg["pq_nbits"] = nbits
+    cfg["nprobe"] = min(cfg["nprobe"], nlist)
+    return cfg
+
+
+def _rows(embs, cfg, start, stop):
+    rows = np.ascontiguousarray(embs[start:stop], dtype="float32")
+    return normalize(rows) if cfg["normalize"] else rows
+
+
+def build_index(embs, cfg: dict, ids=None, batch_size: int | None = None):
+    """
+    Construye (y entrena si hace falta) el índice para `embs` según `cfg`.
+    Con `ids`, el índice es un IndexIDMap2 que devuelve esos ids.
+    `embs` puede ser un np.memmap: con batch_size los vectores se normalizan y
+    añaden por bloques, sin materializar la matriz entera.
+    Devuelve (index, cfg) — cfg puede ajustarse al tamaño del corpus.
+    """
+    import faiss
+
+    n, dim = embs.shape
+    batch_size = batch_size or max(n, 1)
+    cfg = dict(cfg, dim=dim, ntotal=n)
+    metric = _faiss_metric(faiss, cfg["metric"])
+
+    if cfg["index_type"] == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif cfg["index_type"] == "ip":
+        index = faiss.IndexFlatIP(dim)
+    elif cfg["index_type"] == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, cfg["hnsw_m"], metric)
+        index.hnsw.efConstruction = cfg["ef_construction"]
+    else:
+        cfg = _fit_ivfpq_params(cfg, n, dim)
+        quantizer = faiss.IndexFlatIP(dim) if cfg["metric"] == "ip" else faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, cfg["ivf_nlist"], cfg["pq_m"], cfg["pq_nbits"], metric)
+        if n > MAX_TRAIN_POINTS:
+            sample = np.linspace(0, n - 1, MAX_TRAIN_POINTS).astype("int64")
+            train = np.ascontiguousarray(embs[sample], dtype="float32")
+            index.train(normalize(train) if cfg["normalize"] else train)
+        else:
+            index.train(_rows(embs, cfg, 0, n))
+
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        ids = np.asarray(ids, dtype="int64")
+        cfg["id_map"] = True
+    for start in range(0, n, batch_size):
+        stop = min(start + batch_size, n)
+        if ids is not None:
+            index.add_with_ids(_rows(embs, cfg, start, stop), ids[start:stop])
+        else:
+            index.add(_rows(embs, cfg, start, stop))
+    apply_search_params(index, cfg)
+    return index, cfg
+
+
+def supports_remove(cfg: dict) -> bool:
+    return cfg.get("index_type") != "hnsw" and bool(cfg.get("id_map"))
+
+
+def update_index(index, cfg: dict, remove_ids, embs, ids) -> dict:
+    """
+    Actualización in situ de un índice con ids: borra `remove_ids` y añade
+    `embs` con `ids`. Devuelve la cfg con ntotal actualizado.
+    """
+    if len(remove_ids):
+        index.remove_ids(np.asarray(sorted(remove_ids), dtype="int64"))
+    if len(ids):
+        index.add_with_ids(prepare_queries(embs, cfg), np.asarray(ids, dtype="int64"))
+    return dict(cfg, ntotal=int(index.ntotal))
+
+
+def apply_search_params(index, cfg: dict, k: int | None = None):
+    """efSearch (HNSW) / nprobe (IVF) según la config; efSearch nunca por debajo de k."""
+    import faiss
+
+    if cfg.get("index_type") == "hnsw":
+        ef = max(cfg.get("ef_search", DEFAULT_PARAMS["ef_search"]), k or 0)
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", ef)
+    elif cfg.get("index_type") == "ivfpq":
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", cfg.get("nprobe", DEFAULT_PARAMS["nprobe"]))
+
+
+def prepare_queries(q_emb, cfg: dict) -> np.ndarray:
+    """Las queries se transforman igual que los vectores indexados."""
+    if cfg.get("normalize"):
+        return normalize(q_emb)
+    return np.ascontiguousarray(q_emb, dtype="float32")
+
+
+def scores_to_distances(scores, cfg: dict) -> np.ndarray:
+    """
+    Pasa los scores de FAISS a "distancia" (menor = más similar) para que el
+    resto del cliente ordene siempre igual: con métrica ip, 1 - similitud.
+    """
+    if cfg.get("metric") == "ip":
+        return 1.0 - scores
+    return scores
+
+
+def save_config(index_path: str, cfg: dict) -> str:
+    path = config_path(index_path)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cfg, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def load_config(index_path: str) -> dict:
+    """Config guardada junto al índice; sin fichero se asume el flat L2 de siempre."""
+    try:
+        with open(config_path(index_path), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return make_config("flat")
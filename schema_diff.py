@@ -0,0 +1,86 @@
+# schema_diff.py
+"""
+Modo incremental (--since previous_predictions.json) de auto_request_mlx.py:
+compara information_schema.columns con el esquema guardado en la ejecución
+anterior y decide qué tablas hay que volver a perfilar y clasificar.
+"""
+import json
+
+from mysql_profiler import group_columns_by_table
+
+
+def schema_from_columns(cols) -> dict:
+    """
+    Esquema compacto a partir de las filas de information_schema.columns:
+      {tabla: [[columna, data_type, column_type], ...]} en orden de columna.
+    Es lo que se guarda en predictions.json["schema"].
+    """
+    return {
+        t: [[c["name"], c["data_type"], c["column_type"]] for c in columns]
+        for t, columns in group_columns_by_table(cols).items()
+    }
+
+
+def load_previous(path: str):
+    """
+    Carga un predictions.json anterior. Devuelve (schema, items_por_tabla).
+    Si el fichero es antiguo y no trae "schema", se reconstruye SOLO con los
+    nombres de columna de los items (tipos desconocidos → None).
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    items_by_table = {}
+    for it in data.get("items", []):
+        items_by_table.setdefault(it.get("table"), []).append(it)
+
+    schema = data.get("schema")
+    if schema is None:
+        print(f"[WARN] {path} no incluye 'schema': solo se detectarán columnas añadidas/eliminadas, no cambios de tipo.")
+        schema = {t: [[it.get("name"), None, None] for it in its] for t, its in items_by_table.items()}
+    return schema, items_by_table
+
+
+def _same_columns(prev_cols, cur_cols) -> bool:
+    if len(prev_cols) != len(cur_cols):
+        return False
+    for p, c in zip(prev_cols, cur_cols):
+        if p[0] != c[0]:
+            return False
+        # tipos desconocidos (predictions antiguo) no cuentan como cambio
+        if p[1] is not None and (p[1], p[2]) != (c[1], c[2]):
+            return False
+    return True
+
+
+def diff_schemas(prev_schema: dict, cur_schema: dict, prev_items: dict) -> dict:
+    """
+    Clasifica las tablas actuales en added / changed / unchanged (y las que
+    ya no existen en removed). Una tabla sin items previos cuenta como cambiada.
+    """
+    diff = {"added": [], "changed": [], "unchanged": [], "removed": []}
+    for t, cols in cur_schema.items():
+        if t not in prev_schema:
+            diff["added"].append(t)
+        elif not _same_columns(prev_schema[t], cols) or not prev_items.get(t):
+            diff["changed"].append(t)
+        else:
+            diff["unchanged"].append(t)
+    diff["removed"] = [t for t in prev_schema if t not in cur_schema]
+    return diff
+
+
+def merge_items(table_order, new_items, prev_items: dict, reused_tables) -> list:
+    """
+    Items finales en el orden de `table_order`: las tablas reutilizadas toman
+    los items de la ejecución anterior; el resto, los recién generados.
+    """
+    reused = set(reused_tables)
+    new_by_table = {}
+    for it in new_items:
+        new_by_table.setdefault(it["table"], []).append(it)
+
+    merged = []
+    for t in table_order:
+        merged.extend(prev_items.get(t, []) if t in reused else new_by_table.get(t, []))
+    return merged
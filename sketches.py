@@ -0,0 +1,78 @@
+# sketches.py
+"""
+Sketches probabilísticos para estimar cardinalidades en cliente, sin
+COUNT(DISTINCT ...) en MySQL (que crea tablas temporales en columnas de texto).
+"""
+import hashlib
+import math
+
+
+def _hash64(v) -> int:
+    if isinstance(v, (bytes, bytearray)):
+        b = bytes(v)
+    else:
+        b = str(v).encode("utf-8", "surrogatepass")
+    return int.from_bytes(hashlib.blake2b(b, digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    HyperLogLog clásico (Flajolet et al.) con corrección de rango pequeño
+    (linear counting). Error estándar relativo ≈ 1.04 / sqrt(2^p):
+      p=12 → 1.6%, p=14 → 0.8%, p=16 → 0.4%
+    """
+
+    def __init__(self, p: int = 14):
+        if not 4 <= p <= 18:
+            raise ValueError("p debe estar entre 4 y 18")
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self._rest_bits = 64 - p
+
+    @property
+    def alpha(self) -> float:
+        if self.m == 16:
+            return 0.673
+        if self.m == 32:
+            return 0.697
+        if self.m == 64:
+            return 0.709
+        return 0.7213 / (1 + 1.079 / self.m)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, v):
+        x = _hash64(v)
+        j = x >> self._rest_bits
+        w = x & ((1 << self._rest_bits) - 1)
+        rank = self._rest_bits - w.bit_length() + 1
+        if rank > self.registers[j]:
+            self.registers[j] = rank
+
+    def update(self, values):
+        for v in values:
+            self.add(v)
+
+    def merge(self, other: "HyperLogLog"):
+        if other.p != self.p:
+            raise ValueError("no se pueden fusionar HLL con distinto p")
+        regs = self.registers
+        for j, r in enumerate(other.registers):
+            if r > regs[j]:
+                regs[j] = r
+
+    def estimate(self) -> int:
+        m = self.m
+        z = sum(2.0 ** -r for r in self.registers)
+        e = self.alpha * m * m / z
+        if e <= 2.5 * m:
+            zeros = self.registers.count(0)
+            if zeros:
+                e = m * math.log(m / zeros)
+        return int(round(e))
+
+    def __len__(self):
+        return self.estimate()
@@ -0,0 +1,32 @@
+# los módulos del repo están en la raíz (y los de anon-bd en anon-bd/scripts), no en un paquete
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "anon-bd", "scripts")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+class SqliteCursor:
+    """Cursor DictCursor de pymysql sobre sqlite3, para los módulos que lanzan SQL (perfilado, escaneo)."""
+
+    def __init__(self, conn):
+        self._cur = conn.cursor()
+        self.log = []
+
+    def execute(self, sql, params=()):
+        self.log.append(sql)
+        self._cur.execute(sql.replace("%s", "?"), params)
+
+    def _row(self, r):
+        return None if r is None else {d[0]: v for d, v in zip(self._cur.description, r)}
+
+    def fetchone(self):
+        return self._row(self._cur.fetchone())
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    def fetchmany(self, n):
+        return [self._row(r) for r in self._cur.fetchmany(n)]
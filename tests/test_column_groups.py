@@ -0,0 +1,72 @@
+import pytest
+
+from column_groups import group_label, group_note, split_columns
+
+
+def cols(n, **marks):
+    return [{"name": f"c{i}", **marks.get(f"c{i}", {})} for i in range(n)]
+
+
+def covers(groups, n):
+    # bloques consecutivos, no vacíos, que cubren [0, n) sin huecos
+    return groups[0][0] == 0 and groups[-1][1] == n and all(
+        a < b for a, b in groups) and all(g[1] == h[0] for g, h in zip(groups, groups[1:]))
+
+
+def test_no_limits_single_group():
+    assert split_columns(cols(7)) == [(0, 7)]
+    assert split_columns(cols(7), max_cols=7) == [(0, 7)]
+    assert split_columns([]) == []
+    assert split_columns([], max_cols=3, col_cost=len, budget=5) == []
+
+
+@pytest.mark.parametrize("n, max_cols, expected", [
+    (10, 4, [(0, 3), (3, 7), (7, 10)]),
+    (9, 4, [(0, 3), (3, 6), (6, 9)]),
+    (41, 20, [(0, 14), (14, 27), (27, 41)]),
+    (8, 4, [(0, 4), (4, 8)]),
+])
+def test_max_cols_balanced(n, max_cols, expected):
+    assert split_columns(cols(n), max_cols=max_cols) == expected
+
+
+@pytest.mark.parametrize("n", range(1, 60))
+@pytest.mark.parametrize("max_cols", [1, 2, 3, 7, 20])
+def test_max_cols_invariants(n, max_cols):
+    groups = split_columns(cols(n), max_cols=max_cols)
+    sizes = [b - a for a, b in groups]
+    assert covers(groups, n)
+    assert max(sizes) <= max_cols
+    assert len(groups) == -(-n // max_cols)  # ceil: no más bloques de los necesarios
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_budget_closes_group_when_exceeded():
+    cost = {"c0": 5, "c1": 5, "c2": 5, "c3": 20, "c4": 1}
+    columns = cols(5)
+    groups = split_columns(columns, col_cost=lambda c: cost[c["name"]], budget=10)
+    assert groups == [(0, 2), (2, 3), (3, 4), (4, 5)]  # una columna que no cabe sola va sola
+    assert split_columns(columns, col_cost=lambda c: cost[c["name"]], budget=100) == [(0, 5)]
+
+
+def test_budget_and_max_cols_combined():
+    groups = split_columns(cols(10), max_cols=5, col_cost=lambda c: 3, budget=9)
+    assert covers(groups, 10)
+    assert all(b - a <= 3 for a, b in groups)
+    assert (5 in [a for a, _ in groups])  # el corte equilibrado de max_cols se respeta
+
+
+def test_group_note_lists_keys_outside_block():
+    columns = cols(6, c0={"is_pk": True}, c4={"is_fk": True, "fk_ref": "clientes.id"}, c5={"is_fk": True})
+    assert group_note(columns, 0, 6, 1, 0) == []
+    note = group_note(columns, 2, 5, 3, 1)
+    assert note[0] == ("Bloque 2/3: columnas 3-5 de 6 de la tabla "
+                       "(el Esquema solo lista las de este bloque).")
+    assert note[1].endswith("c0 [PK]; c5 [FK]")
+    assert "c4" not in note[1]
+    assert len(group_note(cols(6), 2, 5, 3, 1)) == 1  # sin claves fuera, solo la posición
+
+
+def test_group_label():
+    assert group_label("t", 1, 0) == "t"
+    assert group_label("t", 3, 2) == "t#3/3"
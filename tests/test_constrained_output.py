@@ -0,0 +1,113 @@
+import json
+
+import numpy as np
+import pytest
+
+from constrained_output import GrammarLogitsProcessor, ItemsGrammar, items_schema
+
+
+def dump(items):
+    return json.dumps({"items": items}, ensure_ascii=False, separators=(",", ":"))
+
+
+def item(cat="no_sensible", rationale="ok", confidence=0.9, **extra):
+    return {**extra, "category": cat, "rationale": rationale, "confidence": confidence}
+
+
+VALID = dump([item("identificador_directo", "DNI con letra válida", 1), item(confidence=0.25)])
+
+
+@pytest.mark.parametrize("text", [
+    VALID,
+    dump([item(confidence=0), item(rationale="", confidence=1.0)]),
+    dump([item("cuasi_identificador", "código postal, ñ y “comillas”", 0.123), item("atributo_sensible")]),
+])
+def test_accepts_valid_json(text):
+    assert ItemsGrammar(items_schema(2)).valid_text(text)
+    json.loads(text)
+
+
+def test_every_prefix_of_valid_json_is_live():
+    g = ItemsGrammar(items_schema(2))
+    state = g.initial()
+    for i, ch in enumerate(VALID):
+        assert not g.is_done(state), VALID[:i]
+        state = g.advance(state, ch)
+        assert state is not None, VALID[:i + 1]
+    assert g.is_done(state)
+    assert g.advance(state, " ") is None  # nada después del JSON
+
+
+@pytest.mark.parametrize("text", [
+    dump([item()]),                                   # falta un item
+    dump([item(), item(), item()]),                   # sobra uno
+    dump([item("personal"), item()]),                 # categoría fuera del enum
+    dump([item(confidence=1.5), item()]),
+    dump([item(confidence=0.1234), item()]),          # más de 3 decimales
+    dump([item(rationale="x" * 161), item()]),        # rationale demasiado largo
+    dump([item(rationale='a "b"'), item()]),          # escapes no admitidos
+    dump([{"rationale": "ok", "category": "no_sensible", "confidence": 0.5}, item()]),  # orden de claves
+    json.dumps({"items": [item(), item()]}),          # espacios fuera de cadenas
+    VALID[:-1],                                       # incompleto
+])
+def test_rejects_invalid(text):
+    assert not ItemsGrammar(items_schema(2)).valid_text(text)
+
+
+@pytest.mark.parametrize("prefix", [
+    '{"itemz',
+    '{"items":{',
+    '{"items":[{"category":"p',
+    '{"items":[{"category":"no_sensible","rationale":"ok","confidence":2',
+    '{"items":[{"category":"no_sensible","rationale":"ok","confidence":0.9}]',
+    ' {',
+])
+def test_rejects_invalid_prefixes(prefix):
+    assert ItemsGrammar(items_schema(2)).advance_text(ItemsGrammar(items_schema(2)).initial(), prefix) is None
+
+
+def test_names_enum():
+    g = ItemsGrammar(items_schema(2, names=["id", "dni"]))
+    assert g.valid_text(dump([item(name="dni"), item(name="id")]))
+    assert not g.valid_text(dump([item(name="email"), item(name="id")]))
+    assert not g.valid_text(dump([item(), item()]))
+
+
+def test_rationale_max_length():
+    g = ItemsGrammar(items_schema(1, rationale_max=5))
+    assert g.valid_text(dump([item(rationale="cinco")]))
+    assert not g.valid_text(dump([item(rationale="seis!!")]))
+
+
+class Tokenizer:
+    """Vocabulario mínimo: caracteres sueltos y unas cuantas piezas largas."""
+
+    def __init__(self):
+        pieces = ['{"items":[', '{"category":"', 'no_sensible', '","rationale":"', '","confidence":',
+                  '}]}', '}', ']', '"', ',', 'ok', 'x' * 200, '0.9', '1', '2']
+        self.vocab = pieces + sorted(set("".join(pieces)) | set("abcdefghijklmnopqrstuvwxyz_.{}[]\":,0123456789 "))
+        self.vocab_size = len(self.vocab) + 1  # el último id es EOS (decodifica a "")
+
+    def decode(self, ids):
+        return "".join(self.vocab[i] if i < len(self.vocab) else "" for i in ids)
+
+
+def test_logits_processor_decoding_with_random_logits_yields_valid_json():
+    tok = Tokenizer()
+    eos = tok.vocab_size - 1
+    grammar = ItemsGrammar(items_schema(2))
+    proc = GrammarLogitsProcessor(grammar, tok, [eos])
+    rng = np.random.default_rng(0)
+    out = ""
+    for _ in range(400):
+        allowed = proc._allowed(rng.normal(size=tok.vocab_size).astype("float32"))
+        pick = int(allowed[0])
+        if pick == eos:
+            break
+        text = tok.decode([pick])
+        assert grammar.advance_text(proc.state, text) is not None
+        out += text
+        proc._consume(pick)
+    assert grammar.valid_text(out)
+    assert len(json.loads(out)["items"]) == 2
+    assert proc._allowed(np.zeros(tok.vocab_size, dtype="float32")) == [eos]
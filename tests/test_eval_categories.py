@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from eval.eval_categories import build_alias_map, evaluate_categories_only
+
+CANON = {"DNI": "identificador_directo", "Edad": "cuasi_identificador", "Diagnóstico": "atributo_sensible"}
+ALIASES = {"DNI": ["dni_nif"], "Diagnóstico": ["diagnostico_principal"]}
+
+
+@pytest.fixture
+def predictions(tmp_path):
+    items = [
+        {"name": "dni_nif", "category": "identificador_directo", "preclassified": "rag_ejemplos"},
+        {"name": "edad", "category": "no_sensible", "preclassified": "reglas"},
+        {"name": "diagnostico_principal", "category": "atributo_sensible"},
+        {"name": "edad", "category": "no_sensible"},
+        {"name": "observaciones", "category": "no_sensible", "preclassified": "fk"},
+    ]
+    path = tmp_path / "predictions.json"
+    path.write_text(json.dumps({"items": items}), encoding="utf-8")
+    return str(path)
+
+
+def test_preclassified_items_are_scored_apart(predictions):
+    report = evaluate_categories_only(predictions, CANON, build_alias_map(CANON, ALIASES))
+    assert (report["n_evaluated"], report["n_correct"]) == (2, 1)  # solo los del modelo
+    assert report["preclassified"] == {"n_evaluated": 2, "n_correct": 1, "accuracy": 0.5,
+                                       "by_rule": {"rag_ejemplos": 1, "reglas": 1}, "in_main_metrics": False}
+    assert [r["in_eval"] for r in report["rows"]] == [False, False, True, True, False]
+    assert [r["preclassified"] for r in report["rows"]] == ["rag_ejemplos", "reglas", "", "", "fk"]
+    assert report["unmapped_columns"] == ["observaciones"]
+
+
+def test_include_preclassified(predictions):
+    report = evaluate_categories_only(predictions, CANON, build_alias_map(CANON, ALIASES),
+                                      include_preclassified=True)
+    assert (report["n_evaluated"], report["n_correct"]) == (4, 2)
+    assert report["preclassified"]["in_main_metrics"] is True
@@ -0,0 +1,93 @@
+import llm_cache
+from llm_cache import LLMCache, prompt_key, schema_key
+
+COLUMNS = [
+    {"name": "id", "mysql_column_type": "int", "is_pk": True, "is_fk": False},
+    {"name": "email", "mysql_column_type": "varchar(255)", "is_pk": False, "is_fk": False},
+]
+
+
+class Clock:
+    def __init__(self, t=1000.0):
+        self.t = t
+
+    def time(self):
+        return self.t
+
+
+def make_cache(tmp_path, monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock.time)
+    return LLMCache(str(tmp_path / "cache.sqlite"), **kwargs), clock
+
+
+def test_schema_key_is_stable():
+    k = schema_key("clientes", COLUMNS, "llama3", None)
+    # otras claves en los dicts de columna (muestras, estadísticas) no cambian la huella
+    noisy = [dict(c, samples=["a", "b"], n_distinct=7) for c in COLUMNS]
+    assert schema_key("clientes", noisy, "llama3", None) == k
+    assert schema_key("clientes", [dict(c) for c in COLUMNS], "llama3", None) == k
+    assert k.startswith("s:")
+
+
+def test_schema_key_changes_with_schema_model_and_adapter():
+    k = schema_key("clientes", COLUMNS, "llama3", None)
+    retyped = [COLUMNS[0], dict(COLUMNS[1], mysql_column_type="text")]
+    assert schema_key("clientes", retyped, "llama3", None) != k
+    assert schema_key("clientes", COLUMNS[::-1], "llama3", None) != k
+    assert schema_key("clientes", [COLUMNS[0], dict(COLUMNS[1], is_fk=True)], "llama3", None) != k
+    assert schema_key("pedidos", COLUMNS, "llama3", None) != k
+    assert schema_key("clientes", COLUMNS, "qwen", None) != k
+    assert schema_key("clientes", COLUMNS, "llama3", "adapters/v2") != k
+
+
+def test_prompt_key():
+    assert prompt_key("hola", "m") == prompt_key("hola", "m", None)
+    assert prompt_key("hola", "m") != prompt_key("hola ", "m")
+    assert prompt_key("hola", "m").startswith("p:")
+
+
+def test_get_put_and_counters(tmp_path, monkeypatch):
+    cache, _ = make_cache(tmp_path, monkeypatch)
+    assert cache.get("k") is None
+    cache.put("k", "v")
+    assert cache.get("k") == "v"
+    assert cache.summary() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "writes": 1, "evicted": 0}
+    cache.close()
+
+
+def test_ttl_expires_on_get_and_evict(tmp_path, monkeypatch):
+    cache, clock = make_cache(tmp_path, monkeypatch, ttl_s=60, max_entries=None)
+    cache.put("viejo", "1")
+    clock.t += 50
+    cache.put("nuevo", "2")
+    clock.t += 20  # viejo: 70 s > ttl; nuevo: 20 s
+    assert cache.get("viejo") is None
+    assert cache.get("nuevo") == "2"
+    assert cache.evict() == 1
+    assert cache.evicted == 1
+    clock.t -= 20
+    assert cache.get("viejo") is None  # ya no está en disco
+    cache.close()
+
+
+def test_lru_evicts_least_recently_used(tmp_path, monkeypatch):
+    cache, clock = make_cache(tmp_path, monkeypatch, ttl_s=None, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key.upper())
+        clock.t += 1
+    assert cache.get("a") == "A"  # a pasa a ser la más reciente
+    assert cache.evict() == 1
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    assert cache.evict() == 0
+    cache.close()
+
+
+def test_entries_survive_reopen(tmp_path, monkeypatch):
+    cache, _ = make_cache(tmp_path, monkeypatch)
+    cache.put("k", "v")
+    cache.close()
+    again = LLMCache(str(tmp_path / "cache.sqlite"))
+    assert again.get("k") == "v"
+    again.close()
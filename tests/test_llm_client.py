@@ -0,0 +1,75 @@
+import requests
+
+from llm_client import LLMResult, OllamaClient, summarize_stats
+
+
+class FakeResponse:
+    def __init__(self, status, data=None):
+        self.status_code = status
+        self._data = data or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(response=self)
+
+    def json(self):
+        return self._data
+
+
+class FakeSession:
+    """Responde 503 las `failures` primeras veces y luego bien."""
+
+    def __init__(self, failures, delay_s=0.0):
+        self.failures = failures
+        self.delay_s = delay_s
+        self.calls = 0
+
+    def post(self, url, json=None, timeout=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            return FakeResponse(503)
+        return FakeResponse(200, {"response": "{}", "eval_count": 10})
+
+
+def client(failures, retries=3, backoff_s=0.05):
+    c = OllamaClient("http://ollama", model="m", retries=retries, backoff_s=backoff_s)
+    c.session = FakeSession(failures)
+    return c
+
+
+def test_latency_excludes_retries_and_backoff():
+    res = client(failures=2).generate("hola")
+    assert res.text == "{}" and res.attempts == 3
+    assert res.backoff_s == 0.05 + 0.1
+    assert res.latency_s < 0.05  # solo el intento que respondió
+    assert res.retry_s >= 0
+
+
+def test_no_retry_fields_without_failures():
+    res = client(failures=0).generate("hola")
+    assert (res.attempts, res.retry_s, res.backoff_s) == (1, 0.0, 0.0)
+
+
+def test_gives_up_after_retries():
+    c = client(failures=10, retries=1, backoff_s=0.0)
+    try:
+        c.generate("hola")
+    except requests.exceptions.HTTPError:
+        pass
+    else:
+        raise AssertionError("debería propagar el 503")
+    assert c.session.calls == 2
+
+
+def test_summarize_stats_separates_backoff():
+    results = [
+        LLMResult(text="", latency_s=1.0, attempts=3, retry_s=0.2, backoff_s=3.0),
+        LLMResult(text="", latency_s=2.0),
+        LLMResult(text="", latency_s=0.0, cached=True),
+        None,
+    ]
+    s = summarize_stats(results)
+    assert s["calls"] == 2 and s["cached"] == 1
+    assert s["latency_s_total"] == 3.0
+    assert s["retries"] == 2
+    assert s["retry_s_total"] == 0.2 and s["backoff_s_total"] == 3.0
@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from llm_pool import TokenBucket, rate_from_args, run_ordered
+
+
+def test_results_keep_input_order():
+    def fn(i):
+        time.sleep(0.001 * ((7 * i) % 5))  # terminan desordenados
+        return i * i
+
+    assert run_ordered(fn, range(20), max_workers=6) == [(i * i, None) for i in range(20)]
+
+
+def test_max_workers_in_flight():
+    lock, state = threading.Lock(), {"now": 0, "max": 0}
+
+    def fn(i):
+        with lock:
+            state["now"] += 1
+            state["max"] = max(state["max"], state["now"])
+        time.sleep(0.01)
+        with lock:
+            state["now"] -= 1
+
+    run_ordered(fn, range(12), max_workers=3)
+    assert state["max"] <= 3
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_exceptions_are_returned_per_job(workers):
+    def fn(i):
+        if i % 3 == 0:
+            raise ValueError(i)
+        return i
+
+    out = run_ordered(fn, range(7), max_workers=workers)
+    for i, (res, err) in enumerate(out):
+        if i % 3 == 0:
+            assert res is None and isinstance(err, ValueError) and err.args == (i,)
+        else:
+            assert (res, err) == (i, None)
+
+
+def test_fatal_error_cancels_pending_jobs_serial():
+    started = []
+
+    def fn(i):
+        started.append(i)
+        if i == 2:
+            raise ConnectionError("caído")
+        return i
+
+    out = run_ordered(fn, range(6), max_workers=1, fatal=(ConnectionError,))
+    assert started == [0, 1, 2]
+    assert [r for r, _ in out[:2]] == [0, 1]
+    fatal = out[2][1]
+    assert isinstance(fatal, ConnectionError)
+    assert all(res is None and err is fatal for res, err in out[3:])
+
+
+def test_fatal_error_cancels_pending_jobs_parallel():
+    def fn(i):
+        if i == 0:
+            raise ConnectionError("caído")
+        time.sleep(0.01)
+        return i
+
+    out = run_ordered(fn, range(40), max_workers=2, fatal=(ConnectionError,))
+    errors = [err for _, err in out if err is not None]
+    assert isinstance(out[0][1], ConnectionError)
+    # los que ya estaban en vuelo terminan; el resto no se lanza
+    assert len(errors) > 30 and all(isinstance(e, ConnectionError) for e in errors)
+
+
+def test_non_fatal_errors_do_not_cancel():
+    def fn(i):
+        if i == 0:
+            raise ValueError("mala respuesta")
+        return i
+
+    out = run_ordered(fn, range(5), max_workers=1, fatal=(ConnectionError,))
+    assert [r for r, _ in out[1:]] == [1, 2, 3, 4]
+
+
+def test_token_bucket_paces_calls():
+    bucket = TokenBucket(rate=50, capacity=1)
+    t0 = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # el primero es inmediato; los 5 siguientes esperan 1/50 s cada uno
+    assert time.monotonic() - t0 >= 5 / 50 * 0.9
+
+
+def test_token_bucket_disabled():
+    bucket = TokenBucket(rate=None)
+    t0 = time.monotonic()
+    for _ in range(1000):
+        bucket.acquire()
+    assert time.monotonic() - t0 < 0.1
+
+
+@pytest.mark.parametrize("rate_limit, sleep_s, expected", [
+    (None, 0.5, 2.0),   # compat: 1/SLEEP_S
+    (None, 0, None),
+    (0, 0.5, None),     # RATE_LIMIT=0 explícito: sin límite
+    (3.0, 0.5, 3.0),
+])
+def test_rate_from_args(rate_limit, sleep_s, expected):
+    assert rate_from_args(rate_limit, sleep_s) == expected
@@ -0,0 +1,62 @@
+import os
+import shutil
+
+import pytest
+
+from conftest import ROOT
+from hierarchies import LocalityIndex, load_index, localities_hierarchy
+from hierarchies.localities import read_rows
+
+DICTIONARY = os.path.join(ROOT, "anon-bd", "dictionaries", "localidades_referencia.csv")
+
+
+@pytest.fixture(scope="module")
+def index():
+    return LocalityIndex.from_rows(read_rows(DICTIONARY))
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("La Coruña", ("A Coruña", "A Coruña", "Galicia")),
+    ("l'Alfàs del Pi", ("Alfàs del Pi (l')", "Alicante/Alacant", "Valencia")),
+    ("A Baña", ("Baña (A)", "A Coruña", "Galicia")),
+    ("Alcoi", ("Alcoy/Alcoi", "Alicante/Alacant", "Valencia")),
+    ("Gandía", ("Gandia", "Valencia/València", "Valencia")),
+])
+def test_variants(index, name, expected):
+    assert index.lookup(name) == (expected, "variant")
+
+
+def test_fuzzy_is_off_by_default(index):
+    assert index.lookup("Barcelna") == (None, "missing")
+    assert index.lookup("Barcelna", fuzzy_ratio=0.2) == (("Barcelona", "Barcelona", "Catalunya"), "fuzzy")
+    assert index.lookup("Valladolit", fuzzy_ratio=0.2) == (("Valladolid", "Valladolid", "Castilla León"), "fuzzy")
+
+
+@pytest.mark.parametrize("name", ["Lérida", "Sevila"])
+@pytest.mark.parametrize("ratio", [0.0, 0.2, 0.34])
+def test_fuzzy_needs_clear_margin(index, name, ratio):
+    # Lérida: Mérida a 1 edición, Cerdà a 2; Sevila: Sevilla a 1, Ávila a 2 → sin margen, no se casa
+    assert index.lookup(name, fuzzy_ratio=ratio) == (None, "missing")
+
+
+def test_key_in_two_provinces_is_ambiguous(index):
+    assert index.lookup("El Campillo", fuzzy_ratio=0.2) == (None, "missing")
+
+
+def test_hierarchy_reports_missing(index):
+    resolved = {}
+    table, missing = localities_hierarchy(["Barcelona", "La Coruña", "Lérida"], index, resolved=resolved)
+    assert table["level0"] == ["Barcelona", "La Coruña"]
+    assert table["level1"] == ["Barcelona", "A Coruña"]
+    assert missing == ["Lérida"]
+    assert resolved == {"La Coruña": ("A Coruña", "variant")}
+
+
+def test_cache_is_rebuilt_when_csv_changes(tmp_path):
+    csv_path = str(tmp_path / "dic.csv")
+    shutil.copy(DICTIONARY, csv_path)
+    assert load_index(csv_path).lookup("Sevila")[0] is None
+    assert os.path.exists(csv_path + ".idx.pkl")
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write("Sevila;Sevilla;Andalucía;España\n")
+    assert load_index(csv_path).lookup("Sevila") == (("Sevila", "Sevilla", "Andalucía"), "exact")
@@ -0,0 +1,72 @@
+import json
+import threading
+import time
+
+import pytest
+
+from constrained_output import items_schema
+from mlx_backend import BatchingBackend, StubBackend, get_backend
+
+PROMPT = "Esquema:\n1. id (int)\n2. email (string)\n"
+
+
+class SlowStub(StubBackend):
+    """Stub que tarda un poco por batch, como un modelo de verdad."""
+
+    def generate_batch(self, prompts, max_tokens=1024, schemas=None):
+        time.sleep(0.02)
+        return super().generate_batch(prompts, max_tokens=max_tokens, schemas=schemas)
+
+
+class FailingStub(StubBackend):
+    def generate_batch(self, prompts, max_tokens=1024, schemas=None):
+        raise RuntimeError("sin memoria")
+
+
+def test_stub_answers_one_item_per_column():
+    items = json.loads(StubBackend().generate(PROMPT))["items"]
+    assert len(items) == 2 and items[0]["category"] == "no_sensible"
+
+
+def test_stub_follows_schema():
+    items = json.loads(StubBackend().generate("sin columnas", schema=items_schema(3)))["items"]
+    assert len(items) == 3
+
+
+def test_serial_calls_do_not_wait_for_partners():
+    stub = StubBackend()
+    backend = BatchingBackend(stub, max_batch=4, max_wait_s=0.2)
+    t0 = time.perf_counter()
+    for _ in range(5):
+        backend.generate(PROMPT)
+    # con la ventana de 0.2 s por llamada serían ≥ 1 s
+    assert time.perf_counter() - t0 < 0.2
+    assert stub.batches == 5
+
+
+def test_concurrent_calls_are_batched():
+    stub = SlowStub()
+    backend = BatchingBackend(stub, max_batch=4, max_wait_s=0.05)
+    out = [None] * 12
+
+    def call(i):
+        out[i] = backend.generate(PROMPT)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(len(json.loads(o)["items"]) == 2 for o in out)
+    assert stub.calls == 12 and stub.batches < 12
+
+
+def test_batch_errors_reach_every_caller():
+    backend = BatchingBackend(FailingStub(), max_batch=2)
+    with pytest.raises(RuntimeError, match="sin memoria"):
+        backend.generate(PROMPT)
+
+
+def test_get_backend_skips_wrapper_for_single_worker():
+    assert isinstance(get_backend("m", None, kind="stub", max_batch=1), StubBackend)
+    assert isinstance(get_backend("m", None, kind="stub", max_batch=4), BatchingBackend)
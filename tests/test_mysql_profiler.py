@@ -0,0 +1,67 @@
+import sqlite3
+
+import pytest
+
+from conftest import SqliteCursor
+from mysql_profiler import approx_columns_report, format_distinct, profile_tables
+
+COLUMNS = [("id", "int"), ("grupo", "varchar"), ("codigo", "varchar"), ("nota", "varchar")]
+
+
+@pytest.fixture
+def conn():
+    # 20 grupos en bloques consecutivos de 1000 filas: las primeras filas solo ven uno
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id INT, grupo TEXT, codigo TEXT, nota TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?, ?, ?)",
+                     [(i, f"g{i // 1000}", f"c{i}", None if i % 3 else "x") for i in range(20000)])
+    return conn
+
+
+def profile(conn, pk_map, **kw):
+    cols = [{"table_name": "t", "column_name": c, "data_type": d, "column_type": d, "is_nullable": "YES"}
+            for c, d in COLUMNS]
+    cur = SqliteCursor(conn)
+    tables = profile_tables(cur, cols, pk_map, {}, sample_rows=3, **kw)
+    return {c["name"]: c for c in tables["t"]["columns"]}, cur
+
+
+def test_exact_stats(conn):
+    cols, _ = profile(conn, {"t": {"id"}})
+    assert cols["grupo"]["n_distinct"] == 20
+    assert cols["nota"]["n_null"] == 13333
+    assert format_distinct(cols["grupo"]) == "20"
+
+
+def test_approx_full_scan_reports_rse(conn):
+    cols, _ = profile(conn, {"t": {"id"}}, approx=True)
+    assert cols["grupo"]["n_distinct_method"] == "hll"
+    assert cols["grupo"]["n_distinct"] == 20
+    assert format_distinct(cols["grupo"]).startswith("≈20(±")
+
+
+def test_bounded_sample_is_stratified_lower_bound(conn):
+    cols, cur = profile(conn, {"t": {"id"}}, approx=True, approx_max_rows=1000)
+    assert any("% 20 = 0" in sql for sql in cur.log)
+    grupo = cols["grupo"]
+    assert grupo["sample_strategy"] == "stratified"
+    assert grupo["n_distinct"] == 20  # los estratos recorren todos los grupos
+    assert grupo["n_distinct_rse"] is None and grupo["n_distinct_lower_bound"]
+    assert format_distinct(grupo) == "≥20(muestra)"
+    # columna ~única en la muestra: se extrapola y no se marca como cota
+    assert cols["codigo"]["n_distinct"] == 20000
+    assert format_distinct(cols["codigo"]) == "≈20000(muestra, ~única)"
+    report = {r["name"]: r for r in approx_columns_report({"t": {"columns": list(cols.values())}})}
+    assert report["grupo"]["lower_bound"] and report["grupo"]["rse"] is None
+
+
+def test_bounded_sample_without_int_pk_reads_first_rows(conn):
+    cols, _ = profile(conn, {}, approx=True, approx_max_rows=1000)
+    assert cols["grupo"]["sample_strategy"] == "first"
+    assert format_distinct(cols["grupo"]) == "≥1(muestra)"
+
+
+def test_small_table_is_not_sampled(conn):
+    cols, _ = profile(conn, {"t": {"id"}}, approx=True, approx_max_rows=50000)
+    assert cols["grupo"]["n_distinct_method"] == "hll"
+    assert "sample_strategy" not in cols["grupo"]
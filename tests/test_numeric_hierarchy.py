@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from hierarchies import numeric_hierarchy, write_table
+from hierarchies.io import ValueCounts, count_values
+from hierarchies.numeric import format_range
+
+
+def old_numeric_hierarchy(values, bins=12, k=10, dp=0):
+    # jerarquias-num-v2.py de antes de la vectorización (bins con índices de filas, bucle por valor)
+    values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy()
+    values = values[~np.isnan(values)]
+    unique_vals = np.unique(np.round(values).astype(int)) if dp <= 0 else np.unique(values)
+
+    edges = np.unique(np.quantile(values, np.linspace(0.0, 1.0, max(1, bins) + 1), method="linear"))
+    if edges.size < 2:
+        edges = np.array([float(values.min()), float(values.min()) + 1e-9])
+    idx = np.digitize(values, edges[1:-1], right=True)
+    rows_in = [np.where(idx == i)[0] for i in range(len(edges) - 1)]
+    rows_in[-1] = np.unique(np.concatenate([rows_in[-1], np.where(values == edges[-1])[0]]))
+    bs = [(edges[i], edges[i + 1], rows_in[i]) for i in range(len(edges) - 1)]
+
+    k = max(1, k)
+    changed = True
+    while changed:
+        changed = False
+        i, new = 0, []
+        while i < len(bs):
+            lo, hi, ix = bs[i]
+            if ix.size >= k or i == len(bs) - 1:
+                new.append(bs[i])
+                i += 1
+            else:
+                j = i + 1
+                while j < len(bs) and ix.size < k:
+                    ix, hi = np.concatenate([ix, bs[j][2]]), bs[j][1]
+                    j += 1
+                new.append((lo, hi, np.unique(ix)))
+                i = j
+                changed = True
+        bs = new
+        if len(bs) > 1 and bs[-1][2].size < k:
+            bs = bs[:-2] + [(bs[-2][0], bs[-1][1], np.unique(np.concatenate([bs[-2][2], bs[-1][2]])))]
+            changed = True
+
+    levels, current = [], [(lo, hi) for lo, hi, _ in bs]
+    while True:
+        levels.append(current)
+        if len(current) == 1:
+            break
+        current = [(current[i][0], current[min(i + 1, len(current) - 1)][1]) for i in range(0, len(current), 2)]
+
+    def locate_bin(v):
+        for bi, (lo, hi, _) in enumerate(bs):
+            if (lo <= v < hi) or (bi == len(bs) - 1 and v == hi):
+                return bi
+        return int(np.argmin([abs((lo + hi) / 2.0 - v) for lo, hi, _ in bs]))
+
+    rows = []
+    for v in unique_vals:
+        bi = locate_bin(float(v))
+        path = [str(int(round(v))) if dp <= 0 else str(v)]
+        for lvl, rngs in enumerate(levels, start=1):
+            lo, hi = rngs[bi // (2 ** (lvl - 1))]
+            path.append(format_range(lo, hi, dp))
+        rows.append(path + ["*"])
+    cols = ["level0"] + [f"level{i}" for i in range(1, len(levels) + 1)] + ["root"]
+    df = pd.DataFrame(rows, columns=cols)
+    df["__leafnum"] = pd.to_numeric(df["level0"], errors="coerce")
+    return df.sort_values(["__leafnum", "level0"]).drop(columns="__leafnum")
+
+
+def as_frame(table):
+    return pd.DataFrame({c: list(v) for c, v in table.items()})
+
+
+RNG = np.random.default_rng(21)
+DATASETS = {
+    "edades": RNG.integers(18, 95, 5_000),
+    "sesgada": np.round(RNG.lognormal(3, 1, 3_000), 2),
+    "normal_negativa": RNG.normal(-40, 25, 2_000),
+    "pocos_distintos": RNG.choice([1, 2, 3, 50, 51, 1000], 700),
+    "constante": np.full(40, 7.0),
+    "pocas_filas": np.array([3.0, 1.0, 2.0]),
+    "con_nan": np.where(RNG.random(1_000) < 0.2, np.nan, RNG.integers(0, 300, 1_000)),
+    "medios_redondeo": np.array([0.5, 1.5, 2.5, 3.5, 2.5, 0.5] * 5),
+}
+
+
+@pytest.mark.parametrize("name", list(DATASETS))
+@pytest.mark.parametrize("bins, k, dp", [(12, 10, 0), (5, 1, 0), (30, 50, 0), (1, 10, 0), (12, 10, 2), (7, 3, 1)])
+def test_matches_previous_implementation(name, bins, k, dp):
+    values = DATASETS[name]
+    old = old_numeric_hierarchy(values, bins, k, dp)
+    new = numeric_hierarchy(values, bins=bins, k=k, decimal_places=dp)
+    pd.testing.assert_frame_equal(as_frame(new), old.reset_index(drop=True))
+
+
+def test_csv_identical_to_previous_script(tmp_path):
+    values = DATASETS["edades"]
+    src = tmp_path / "data.csv"
+    pd.DataFrame({"age": values, "otra": "x"}).to_csv(src, index=False)
+    old_csv, new_csv = tmp_path / "old.csv", tmp_path / "new.csv"
+    old_numeric_hierarchy(values).to_csv(old_csv, index=False)
+    # como el CLI: lectura en streaming por bloques pequeños
+    write_table(numeric_hierarchy(count_values(str(src), "age", chunk_rows=333)), str(new_csv), lineterminator="\n")
+    assert new_csv.read_bytes() == old_csv.read_bytes()
+
+
+def test_value_counts_quantile_matches_numpy():
+    values = DATASETS["sesgada"]
+    acc = ValueCounts()
+    for part in np.array_split(values, 7):
+        acc.add(part)
+    qs = np.linspace(0.0, 1.0, 13)
+    assert acc.n == values.size
+    np.testing.assert_array_equal(acc.quantile(qs), np.quantile(values, qs, method="linear"))
+
+
+def test_no_numeric_values():
+    with pytest.raises(ValueError):
+        numeric_hierarchy([np.nan, "abc"])
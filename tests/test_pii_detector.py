@@ -0,0 +1,66 @@
+import pytest
+
+from pii_detector import detect, iban_ok, luhn_ok, mask_value
+
+
+@pytest.mark.parametrize("value", [
+    "612345678",
+    "612 34 56 78",
+    "612-34-56-78",
+    "612.34.56.78",
+    "91-123-45-67",
+    "+34 612 34 56 78",
+    "+34 612.34.56.78",
+    "(+34) 612-34-56-78",
+    "0034 612345678",
+    "tlf: 612-34-56-78",
+])
+def test_phone_formats_are_tel(value):
+    assert detect(value) == "TEL"
+
+
+@pytest.mark.parametrize("value", [
+    "2020-01-01",
+    "01/02/2020",
+    "01-02-2020",
+    "01.02.20",
+    "2020-01-01 12:30:00",
+    "2020-01-01T12:30:00",
+    "12:30",
+    "3.1415926535",
+    "1234567",
+    "20200101",
+    "123456789",  # 9 dígitos que no empiezan por 6-9
+])
+def test_dates_and_plain_numbers_are_not_pii(value):
+    assert detect(value) is None
+
+
+@pytest.mark.parametrize("value, label", [
+    ("12345678Z", "DNI"),
+    ("X1234567L", "NIE"),
+    ("12345678A", None),  # letra de control incorrecta
+    ("X1234567A", None),
+])
+def test_dni_nie_control_letter(value, label):
+    assert detect(value) == label
+
+
+def test_iban():
+    assert iban_ok("ES91 2100 0418 4502 0005 1332")
+    assert not iban_ok("ES92 2100 0418 4502 0005 1332")
+    assert detect("ES9121000418450200051332") == "IBAN"
+
+
+def test_card_luhn():
+    assert luhn_ok("4111111111111111")
+    assert not luhn_ok("4111111111111112")
+    assert detect("4111 1111 1111 1111") == "TARJETA"
+    assert detect("4111 1111 1111 1112") is None
+
+
+def test_email_and_mask():
+    assert detect("ana.perez@example.com") == "EMAIL"
+    assert mask_value("ana.perez@example.com") == "<MASK:EMAIL>"
+    assert mask_value("612-34-56-78") == "<MASK:TEL>"
+    assert mask_value("x" * 100, max_chars=10) == "xxxxxxx..."
@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+from conftest import SqliteCursor
+from pii_scan import scan_report, scan_table, scan_tables
+
+
+@pytest.fixture
+def cur():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, email TEXT, nota TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?, ?)",
+                     [(i, f"user{i}@example.com" if i % 4 else None, f"nota {i}") for i in range(1, 1001)])
+    conn.execute("CREATE TABLE s (codigo TEXT, email TEXT)")
+    conn.executemany("INSERT INTO s VALUES (?, ?)", [(f"c{i}", f"u{i}@example.com") for i in range(500)])
+    return SqliteCursor(conn)
+
+
+def columns(int_pk=True):
+    return [
+        {"name": "id", "is_pk": True, "mysql_data_type": "int" if int_pk else "varchar"},
+        {"name": "email", "is_pk": False, "mysql_data_type": "varchar"},
+        {"name": "nota", "is_pk": False, "mysql_data_type": "text"},
+    ]
+
+
+def test_stratified_only_fetches_the_sample(cur):
+    used, n, values, rates, capped = scan_table(cur, "t", columns(), 50)
+    assert used == "stratified" and 45 <= n <= 50 and not capped
+    assert rates[1] == {"email_like": 1.0} and rates[2] == {}
+    assert "% " in cur.log[-1] and "LIMIT 50" in cur.log[-1]
+    ids = sorted(v for v in values[0])
+    assert ids[0] < 30 and ids[-1] > 950  # repartidas por todo el rango de la PK
+
+
+def test_stratified_without_int_pk_falls_back_to_capped_reservoir(cur):
+    used, n, _, _, capped = scan_table(cur, "t", columns(int_pk=False), 20, max_rows=300)
+    assert used == "reservoir" and n == 20 and capped
+    assert cur.log[-1].endswith("LIMIT 300")
+
+
+def test_reservoir_cap(cur):
+    assert scan_table(cur, "t", columns(), 20, "reservoir", max_rows=0)[4] is False
+    assert "LIMIT" not in cur.log[-1]
+    assert scan_table(cur, "t", columns(), 20, "reservoir", max_rows=5000)[4] is False
+    _, _, values, _, _ = scan_table(cur, "t", columns(), 20, "reservoir", max_rows=100)
+    assert max(values[0]) <= 100
+
+
+def test_scan_report_marks_capped_tables(cur):
+    tables = {
+        "t": {"columns": columns()},
+        "s": {"columns": [{"name": "codigo", "is_pk": True, "mysql_data_type": "varchar"},
+                          {"name": "email", "is_pk": False, "mysql_data_type": "varchar"}]},
+    }
+    scan_tables(cur, tables, 10, max_rows=200)
+    report = {r["table"]: r for r in scan_report(tables)}
+    assert report["t"]["strategy"] == "stratified" and "capped" not in report["t"]
+    assert report["s"] == {"table": "s", "strategy": "reservoir", "rows": 10, "capped": 200,
+                           "columns": {"email": {"email_like": 1.0}}}
+    assert len(tables["s"]["columns"][1]["samples"]) == 5
@@ -0,0 +1,87 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+from preclassifier import PreClassifier, load_name_rules, merge_table_items, normalize_name
+
+
+def write_chunks(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"text": text, "metadata": {"chunk_type": "ejemplos"}}, ensure_ascii=False) + "\n")
+        f.write(json.dumps({"text": "Ejemplos típicos de columnas no_sensible: dni.", "metadata": {}}) + "\n")
+
+
+@pytest.fixture
+def preclass(tmp_path):
+    chunks = tmp_path / "chunks.jsonl"
+    write_chunks(chunks, "Ejemplos típicos de columnas identificador_directo: dni, email, "
+                         "primer_apellido cuando se usa para identificar, codigo_cliente. Resto del texto.")
+    rules = tmp_path / "rules.json"
+    rules.write_text(json.dumps({"cuasi_identificador": ["Fecha-Nacimiento", "codigo_cliente"],
+                                 "no_sensible": ["created_at"], "otra": ["x"]}), encoding="utf-8")
+    return PreClassifier.from_sources(str(rules), str(chunks))
+
+
+def col(name, **kw):
+    return {"name": name, "llm_type": "string", "samples": [], **kw}
+
+
+def test_production_path_does_not_import_eval():
+    code = "import sys, preclassifier; print(any(m == 'eval' or m.startswith('eval.') for m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
+
+
+def test_normalize_name():
+    assert normalize_name(" Correo.Electrónico ") == "correo electronico"
+    assert normalize_name("num__SS") == "num ss"
+    assert normalize_name(None) == ""
+
+
+def test_load_name_rules_skips_unknown_categories(tmp_path, capsys):
+    path = tmp_path / "r.json"
+    path.write_text(json.dumps({"no_sensible": ["a", "b"], "otra": ["c"]}), encoding="utf-8")
+    assert load_name_rules(str(path)) == [("a", "no_sensible"), ("b", "no_sensible")]
+    assert "[WARN]" in capsys.readouterr().out
+
+
+def test_name_rules(preclass):
+    assert preclass.classify(col("DNI"))[:2] == ("identificador_directo", "rag_ejemplos")
+    assert preclass.classify(col("fecha_nacimiento"))[:2] == ("cuasi_identificador", "reglas")
+    assert preclass.classify(col("created_at"))[:2] == ("no_sensible", "reglas")
+    # categorías distintas según la fuente → ambigua, va al LLM
+    assert preclass.classify(col("codigo_cliente")) is None
+    # frases condicionales del corpus no son reglas
+    assert preclass.classify(col("primer_apellido")) is None
+
+
+def test_value_and_fk_rules(preclass):
+    masked = col("contacto", samples=["<MASK:EMAIL>"] * 3)
+    assert preclass.classify(masked)[:2] == ("identificador_directo", "valores")
+    assert preclass.classify(col("contacto", samples=["<MASK:EMAIL>", "<MASK:TEL>", "<MASK:EMAIL>"])) is None
+    assert preclass.classify(col("contacto", samples=["<MASK:EMAIL>"] * 2)) is None
+    assert preclass.classify(col("id_curso", llm_type="int", is_fk=True))[:2] == ("no_sensible", "fk")
+    assert preclass.classify(col("curso", is_fk=True)) is None
+
+
+def test_split_tags_preclassified_items(preclass):
+    decided, pending = preclass.split("t", [col("dni"), col("observaciones"), col("created_at")])
+    assert [c["name"] for c in pending] == ["observaciones"]
+    assert decided["dni"]["preclassified"] == "rag_ejemplos"
+    assert decided["created_at"]["preclassified"] == "reglas"
+    assert preclass.summary(1, 2) == {"columns": 3, "preclassified": 2,
+                                      "by_rule": {"reglas": 1, "rag_ejemplos": 1, "valores": 0, "fk": 0},
+                                      "llm_calls": 1, "cache_hits": 0, "llm_calls_avoided": 1}
+
+
+def test_merge_table_items_keeps_column_order_and_rule_wins():
+    columns = [col("a"), col("b"), col("c")]
+    decided = {"b": {"name": "b", "category": "no_sensible", "preclassified": "reglas"}}
+    llm = [{"name": "c", "category": "x"}, {"name": "b", "category": "y"}, {"name": "zz", "category": "z"},
+           {"name": "a", "category": "w"}]
+    assert [(it["name"], it["category"]) for it in merge_table_items(columns, decided, llm)] == [
+        ("a", "w"), ("b", "no_sensible"), ("c", "x"), ("zz", "z")]
+    assert merge_table_items(columns, {}, llm) == llm
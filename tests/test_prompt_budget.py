@@ -0,0 +1,143 @@
+import json
+
+import pytest
+
+from prompt_budget import EVIDENCE_LEVELS, TokenCounter, assemble, fit_context, format_samples
+
+SYSTEM = "Eres un clasificador de columnas.\nDevuelve SOLO JSON."
+INTRO = [
+    "Tienes acceso al siguiente CONTEXTO relevante sobre anonimización y clasificación de columnas:",
+    "[CONTEXTO]",
+]
+CHUNKS = [
+    {"text": "El DNI es un identificador directo de personas físicas. " * 8, "metadata": {"source": "guia.md"}},
+    {"text": "  Ejemplos: num_ss → NUM_SS, iban → IBAN.  ", "metadata": {"source": "ejemplos.md"}},
+    {"text": "Las fechas de alta no son identificadores por sí solas. " * 5, "metadata": {}},
+]
+COLUMNS = [
+    {"name": "id", "n_distinct": 500, "n_null": 0, "n_all": 500,
+     "samples": [1, 2, 3, 4, 5]},
+    {"name": "dni", "n_distinct": 498, "n_null": 2, "n_all": 500,
+     "samples": ["12345678Z", "87654321X", "11111111H", "22222222J", "33333333P"]},
+    {"name": "comentario", "n_distinct": 120, "n_null": 300, "n_all": 500,
+     "samples": ["texto libre bastante largo " * 4, "otro comentario", "ñandú", "", "x" * 90]},
+]
+TAIL = ["Tabla: clientes (filas ~ 500)", "Esquema (columnas en orden):", "1. id (int | int(11)) [PK]",
+        "2. dni (string | varchar(9))", "3. comentario (text | text)",
+        "\nEn esta tabla hay EXACTAMENTE 3 columnas."]
+
+
+def old_context_block(chunks, max_chunks=4, max_chars_per_chunk=500):
+    # build_context_block de antes del presupuesto de tokens
+    lines = []
+    for i, ch in enumerate(chunks[:max_chunks], start=1):
+        src = ch.get("metadata", {}).get("source", "desconocido")
+        text = ch["text"].strip()
+        if len(text) > max_chars_per_chunk:
+            text = text[:max_chars_per_chunk] + "..."
+        lines.append(f"--- CONTEXTO {i} (source={src}) ---")
+        lines.append(text)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def old_prompt(chunks):
+    # montaje del prompt de antes del presupuesto (chunks=None: sin RAG)
+    lines = [SYSTEM]
+    if chunks is not None:
+        lines += INTRO
+        lines.append(old_context_block(chunks))
+    lines += TAIL
+    lines.append("\nEvidencia por columna:")
+    for c in COLUMNS:
+        null_pct = round((c["n_null"] / c["n_all"] * 100), 2) if c["n_all"] else 0
+        lines.append(f"{c['name']}: distinct={c['n_distinct']}, null_pct={null_pct}, "
+                     f"muestras={json.dumps(c['samples'], ensure_ascii=False)}")
+    return "\n".join(lines)
+
+
+def blocks(chunks, max_chars_per_chunk=500):
+    # context_blocks de auto_request_mlx.py
+    out = []
+    for i, ch in enumerate(chunks[:4], start=1):
+        src = ch.get("metadata", {}).get("source", "desconocido")
+        text = ch["text"].strip()
+        if max_chars_per_chunk and len(text) > max_chars_per_chunk:
+            text = text[:max_chars_per_chunk] + "..."
+        out.append((f"--- CONTEXTO {i} (source={src}) ---", text))
+    return out
+
+
+def evidence(n_samples, max_chars):
+    # evidence() de build_table_prompt
+    lines = ["\nEvidencia por columna:"]
+    for c in COLUMNS:
+        null_pct = round((c["n_null"] / c["n_all"] * 100), 2) if c["n_all"] else 0
+        line = f"{c['name']}: distinct={c['n_distinct']}, null_pct={null_pct}"
+        if n_samples != 0:
+            line += f", muestras={format_samples(c['samples'], n_samples, max_chars)}"
+        lines.append(line)
+    return lines
+
+
+def build(chunks, max_tokens=0, counter=None):
+    counter = counter or TokenCounter()
+    intro = INTRO if chunks is not None else []
+    ctx = blocks(chunks, None if max_tokens else 500) if chunks is not None else []
+    return assemble(counter, max_tokens, [SYSTEM], intro, ctx, TAIL, evidence)
+
+
+@pytest.mark.parametrize("chunks", [None, [], CHUNKS[:1], CHUNKS], ids=["sin_rag", "0_chunks", "1_chunk", "3_chunks"])
+def test_no_budget_is_byte_identical_to_old_prompt(chunks):
+    prompt, report = build(chunks)
+    assert prompt == old_prompt(chunks)
+    assert not report["over_budget"] and report["context_dropped"] == 0 and report["evidence_level"] == 0
+
+
+def test_no_budget_keeps_context_intro_without_chunks():
+    prompt, _ = build([])
+    assert "[CONTEXTO]\n\nTabla: clientes" in prompt
+
+
+@pytest.mark.parametrize("max_tokens", range(60, 700, 20))
+def test_budget_is_respected(max_tokens):
+    counter = TokenCounter()
+    fixed = counter.count_lines([SYSTEM] + TAIL)
+    minimal = counter.count_lines(evidence(*EVIDENCE_LEVELS[-1]))
+    prompt, report = build(CHUNKS, max_tokens, counter)
+    assert report["total"] == counter.count(prompt)
+    if fixed + minimal + 1 <= max_tokens:
+        assert report["total"] <= max_tokens and not report["over_budget"]
+    else:
+        assert report["context"] == 0  # ni la evidencia mínima cabe: fuera el contexto
+    assert prompt.startswith(SYSTEM) and "Tabla: clientes" in prompt
+
+
+def test_budget_trims_context_from_the_end_before_evidence():
+    counter = TokenCounter()
+    _, full = build(CHUNKS, 10_000, counter)
+    assert full["context_dropped"] == 0 and full["evidence_level"] == 0
+    prompt, tight = build(CHUNKS, full["total"] - 40, counter)
+    assert tight["total"] <= full["total"] - 40
+    assert tight["evidence_level"] == 0 and tight["context"] < full["context"]
+    assert "--- CONTEXTO 1" in prompt and prompt.endswith(evidence(None, None)[-1])
+    prompt, tighter = build(CHUNKS, full["total"] - 150, counter)
+    assert tighter["context_dropped"] >= 1 and "--- CONTEXTO 3" not in prompt
+
+
+def test_fit_context():
+    counter = TokenCounter()
+    assert fit_context(counter, INTRO, [], 100) == ([], 0, 0)
+    assert fit_context(counter, INTRO, blocks(CHUNKS), 0) == ([], 0, 3)
+    lines, used, dropped = fit_context(counter, INTRO, blocks(CHUNKS, None), 80)
+    assert lines[:2] == INTRO and lines[-1] == "" and lines[-2].endswith("...")
+    assert used == counter.count_lines(lines) <= 80 and dropped == 2
+
+
+def test_truncate():
+    counter = TokenCounter()
+    text = "palabra " * 50
+    cut = counter.truncate(text, 10)
+    assert cut.endswith("...") and counter.count(cut) <= 10
+    assert counter.truncate("corto", 10) == "corto"
+    assert counter.truncate(text, 1) == ""
@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from rag_bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "El DNI identifica a una persona física.",
+    "La columna num_ss guarda el número de la Seguridad Social.",
+    "El IBAN identifica una cuenta bancaria; el IBAN no es un DNI.",
+    "Fechas de alta y baja del contrato.",
+    "",
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return BM25Index.build(TEXTS)
+
+
+def test_tokenize():
+    assert tokenize("Número de la Seguridad_Social: num_ss") == [
+        "numero", "de", "la", "seguridad_social", "seguridad", "social", "num_ss", "num", "ss"]
+    assert tokenize("a _ x1") == ["x1"]
+
+
+def test_search_ranks_by_bm25(index):
+    hits = index.search("dni", 10)
+    assert [d for d, _ in hits] == [0, 2]  # el chunk corto gana al largo con la misma frecuencia
+    assert hits[0][1] > hits[1][1] > 0
+    assert [d for d, _ in index.search("iban", 10)] == [2]
+    assert [d for d, _ in index.search("num_ss", 10)] == [1]
+    assert index.search("pasaporte", 10) == []
+    # un término raro pesa más que uno que aparece en todos lados
+    assert index.search("contrato", 1)[0][1] > index.search("el", 5)[0][1]
+
+
+def test_search_k(index):
+    assert len(index.search("el de la", 2)) == 2
+    assert [d for d, _ in index.search("el de la", 2)] == [d for d, _ in index.search("el de la", 10)][:2]
+
+
+def test_search_many_matches_search():
+    rng = random.Random(0)
+    words = ["dni", "iban", "num_ss", "el", "la", "cuenta", "fecha"] + [f"w{i}" for i in range(40)]
+    texts = [" ".join(rng.choice(words) for _ in range(rng.randint(0, 30))) for _ in range(400)]
+    index = BM25Index.build(texts)
+    queries = [" ".join(rng.choice(words) for _ in range(rng.randint(0, 3))) for _ in range(60)] + ["nada", ""]
+    for query, many in zip(queries, index.search_many(queries, 7)):
+        one = index.search(query, 7)
+        assert [d for d, _ in many] == [d for d, _ in one]
+        assert [s for _, s in many] == pytest.approx([s for _, s in one], rel=1e-5)
+
+
+def test_search_many_without_matches(index):
+    assert index.search_many(["pasaporte", ""], 5) == [[], []]
+    assert index.search_many([], 5) == []
+
+
+def test_save_load_signature(index, tmp_path):
+    path = str(tmp_path / "bm25.pkl")
+    index.save(path, signature=(1, 2))
+    loaded = BM25Index.load(path, signature=(1, 2))
+    assert loaded.search("iban dni", 5) == index.search("iban dni", 5)
+    assert BM25Index.load(path, signature=(1, 3)) is None
+    assert BM25Index.load(str(tmp_path / "no.pkl")) is None
+
+
+def test_rrf():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], rrf_k=60)
+    assert [d for d, _ in fused] == [1, 3, 2]
+    assert dict(fused)[1] == pytest.approx(1 / 61 + 1 / 62)
+    assert dict(fused)[3] == pytest.approx(1 / 63 + 1 / 61)
+    assert dict(fused)[2] == pytest.approx(1 / 62)
+
+
+def test_rrf_ties_keep_first_appearance():
+    assert [d for d, _ in reciprocal_rank_fusion([[5, 6], [6, 5]])] == [5, 6]
+    assert reciprocal_rank_fusion([]) == []
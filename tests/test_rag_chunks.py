@@ -0,0 +1,60 @@
+import json
+import pickle
+
+from rag_client import ChunkMetaBuilder, load_chunks, sidecar_path, write_chunk_sidecar
+
+CHUNKS = [
+    {"vid": 10, "text": "El DNI es un identificador directo.", "metadata": {"chunk_type": "definicion", "scope": "core"}},
+    {"vid": 11, "text": "Ejemplo: num_ss → NUM_SS", "metadata": {"chunk_type": "ejemplos", "domains": ["salud"]}},
+    {"vid": 15, "text": "IBAN de la cuenta: ñandú", "metadata": {"chunk_type": "ejemplos", "scope": "extra",
+                                                              "domains": ["finanzas", "salud"]}},
+]
+
+
+def write_jsonl(path, chunks):
+    with open(path, "wb") as f:
+        for ch in chunks:
+            f.write((json.dumps(ch, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+def test_load_chunks_writes_sidecar_without_texts(tmp_path):
+    path = str(tmp_path / "chunks.jsonl")
+    write_jsonl(path, CHUNKS)
+    data = load_chunks(path)
+    store = data["chunks"]
+    assert len(store) == 3
+    assert [store[i] for i in (2, 0, 1)] == [CHUNKS[2], CHUNKS[0], CHUNKS[1]]
+    assert list(store) == CHUNKS
+    assert data["pos_by_vid"] == {10: 0, 11: 1, 15: 2}
+    assert data["by_type"] == {"definicion": {0}, "ejemplos": {1, 2}}
+    assert data["by_scope"] == {"core": {0}, None: {1}, "extra": {2}}
+    assert data["by_domain"] == {None: {0}, "salud": {1, 2}, "finanzas": {2}}
+
+    with open(sidecar_path(path), "rb") as f:
+        side = pickle.load(f)
+    assert "chunks" not in side
+    assert b"identificador" not in pickle.dumps(side)
+    # el sidecar al día se reutiliza tal cual
+    assert load_chunks(path)["offsets"].tolist() == side["offsets"].tolist()
+    store.close()
+
+
+def test_stale_sidecar_is_rebuilt(tmp_path):
+    path = str(tmp_path / "chunks.jsonl")
+    write_jsonl(path, CHUNKS)
+    load_chunks(path)
+    write_jsonl(path, CHUNKS[:1])
+    data = load_chunks(path)
+    assert len(data["chunks"]) == 1 and data["chunks"][0] == CHUNKS[0]
+
+
+def test_streamed_meta_matches_scan(tmp_path):
+    # el builder alimenta ChunkMetaBuilder línea a línea mientras escribe
+    path = str(tmp_path / "chunks.jsonl")
+    write_jsonl(path, CHUNKS)
+    meta = ChunkMetaBuilder()
+    for ch in CHUNKS:
+        meta.add(ch, len((json.dumps(ch, ensure_ascii=False) + "\n").encode("utf-8")))
+    write_chunk_sidecar(path, meta.meta())
+    assert load_chunks(path)["chunks"][2] == CHUNKS[2]
+
@@ -0,0 +1,49 @@
+import pytest
+
+from rag_client import RAGClient
+
+
+class FakeRAG(RAGClient):
+    """RAGClient sin FAISS: el candidato de una query es el chunk cuyo texto la contiene."""
+
+    def __init__(self, texts):
+        super().__init__()
+        chunks = [{"text": t} for t in texts]
+        self._chunk_data = {"chunks": chunks, "by_type": {}, "by_scope": {}, "by_domain": {}}
+        self.batches = []
+
+    def _candidates_many(self, queries, k, retrieval=None):
+        self.batches.append(list(queries))
+        return [
+            [{"chunk": ch, "dist": 0.0, "idx": i} for i, ch in enumerate(self.chunks) if q in ch["text"]][:k]
+            for q in queries
+        ]
+
+
+TEXTS = ["dni nombre", "iban cuenta", "fecha alta", "email telefono", "dni iban"]
+TABLES = [["dni", "nombre"], ["iban", "fecha"], ["dni", "email", "telefono", "cuenta", "alta"], [], ["iban"]]
+
+
+def test_column_queries_are_searched_in_bounded_blocks():
+    rag = FakeRAG(TEXTS)
+    expected = FakeRAG(TEXTS).column_candidates_many(TABLES, query_batch=1000)
+    got = rag.column_candidates_many(TABLES, query_batch=3)
+    assert got == expected
+    assert all(len(b) <= 3 for b in rag.batches)
+    # las dos primeras no caben juntas (4 queries > 3); la ancha va sola, en dos tramos
+    assert rag.batches == [["dni", "nombre"], ["iban", "fecha"], ["dni", "email", "telefono"], ["cuenta", "alta"],
+                           ["iban"]]
+
+
+def test_column_queries_shared_within_a_block_are_searched_once():
+    rag = FakeRAG(TEXTS)
+    out = rag.column_candidates_many([["dni"], ["dni", "iban"], ["iban"]], query_batch=8)
+    assert rag.batches == [["dni", "iban"]]
+    assert [[c["idx"] for c in cands] for cands in out] == [[0, 4], [4, 0, 1], [1, 4]]
+
+
+@pytest.mark.parametrize("tables", [[], [[], []]])
+def test_column_queries_empty(tables):
+    rag = FakeRAG(TEXTS)
+    assert rag.column_candidates_many(tables) == [[] for _ in tables]
+    assert rag.batches == []
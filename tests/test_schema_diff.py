@@ -0,0 +1,81 @@
+import json
+
+from schema_diff import diff_schemas, load_previous, merge_items, schema_from_columns
+
+
+def col(table, name, data_type="int", column_type="int(11)"):
+    return {"table_name": table, "column_name": name, "data_type": data_type,
+            "column_type": column_type, "is_nullable": "YES"}
+
+
+def item(table, name, cat="OTRO"):
+    return {"table": table, "name": name, "category": cat}
+
+
+PREV = {
+    "clientes": [["id", "int", "int(11)"], ["email", "varchar", "varchar(255)"]],
+    "pedidos": [["id", "int", "int(11)"], ["total", "decimal", "decimal(10,2)"]],
+    "logs": [["id", "int", "int(11)"]],
+    "vieja": [["id", "int", "int(11)"]],
+}
+PREV_ITEMS = {t: [item(t, c[0]) for c in cols] for t, cols in PREV.items()}
+
+
+def test_schema_from_columns_keeps_order_and_upper_keys():
+    cols = [col("a", "id"), {k.upper(): v for k, v in col("a", "nombre", "varchar", "varchar(50)").items()}]
+    assert schema_from_columns(cols) == {"a": [["id", "int", "int(11)"], ["nombre", "varchar", "varchar(50)"]]}
+
+
+def test_diff_schemas():
+    cur = {
+        "clientes": PREV["clientes"],
+        "pedidos": [["id", "int", "int(11)"], ["total", "decimal", "decimal(12,2)"]],  # cambio de tipo
+        "logs": PREV["logs"] + [["msg", "text", "text"]],  # columna añadida
+        "nueva": [["id", "int", "int(11)"]],
+    }
+    assert diff_schemas(PREV, cur, PREV_ITEMS) == {
+        "added": ["nueva"],
+        "changed": ["pedidos", "logs"],
+        "unchanged": ["clientes"],
+        "removed": ["vieja"],
+    }
+
+
+def test_diff_schemas_renamed_or_reordered_column_is_a_change():
+    cur = {"clientes": [["id", "int", "int(11)"], ["correo", "varchar", "varchar(255)"]]}
+    assert diff_schemas(PREV, cur, PREV_ITEMS)["changed"] == ["clientes"]
+    cur = {"clientes": PREV["clientes"][::-1]}
+    assert diff_schemas(PREV, cur, PREV_ITEMS)["changed"] == ["clientes"]
+
+
+def test_diff_schemas_table_without_previous_items_is_changed():
+    cur = {"clientes": PREV["clientes"]}
+    assert diff_schemas(PREV, cur, {"clientes": []})["changed"] == ["clientes"]
+
+
+def test_old_predictions_without_schema_ignore_types(tmp_path):
+    path = tmp_path / "prev.json"
+    path.write_text(json.dumps({"items": PREV_ITEMS["clientes"]}), encoding="utf-8")
+    schema, items = load_previous(str(path))
+    assert schema == {"clientes": [["id", None, None], ["email", None, None]]}
+    cur = {"clientes": [["id", "bigint", "bigint(20)"], ["email", "text", "text"]]}
+    assert diff_schemas(schema, cur, items)["unchanged"] == ["clientes"]
+    cur = {"clientes": [["id", "bigint", "bigint(20)"]]}
+    assert diff_schemas(schema, cur, items)["changed"] == ["clientes"]
+
+
+def test_merge_items_follows_table_order():
+    new_items = [item("nueva", "id", "ID"), item("pedidos", "id", "ID"), item("pedidos", "total", "IMPORTE")]
+    merged = merge_items(["pedidos", "clientes", "nueva", "sin_items"], new_items, PREV_ITEMS, ["clientes"])
+    assert merged == [
+        item("pedidos", "id", "ID"),
+        item("pedidos", "total", "IMPORTE"),
+        *PREV_ITEMS["clientes"],
+        item("nueva", "id", "ID"),
+    ]
+
+
+def test_merge_items_new_items_win_for_non_reused_tables():
+    new_items = [item("clientes", "id", "ID")]
+    assert merge_items(["clientes"], new_items, PREV_ITEMS, []) == new_items
+    assert merge_items(["clientes"], new_items, PREV_ITEMS, ["clientes"]) == PREV_ITEMS["clientes"]
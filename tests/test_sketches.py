@@ -0,0 +1,35 @@
+import pytest
+
+from sketches import HyperLogLog
+
+
+@pytest.mark.parametrize("p", [12, 14])
+@pytest.mark.parametrize("n", [10, 1000, 20000, 100000])
+def test_estimate_within_error(p, n):
+    h = HyperLogLog(p)
+    h.update(f"valor-{i}" for i in range(n))
+    # 4 errores estándar: el hash es determinista, así que el test también
+    assert abs(h.estimate() - n) <= max(1, 4 * h.relative_error * n)
+
+
+def test_duplicates_do_not_count():
+    h = HyperLogLog(14)
+    for _ in range(5):
+        h.update(range(500))
+    assert abs(h.estimate() - 500) <= 4 * h.relative_error * 500
+
+
+def test_merge_is_union():
+    a, b, both = HyperLogLog(12), HyperLogLog(12), HyperLogLog(12)
+    a.update(range(0, 6000))
+    b.update(range(4000, 10000))
+    both.update(range(10000))
+    a.merge(b)
+    assert a.estimate() == both.estimate()
+
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        HyperLogLog(3)
+    with pytest.raises(ValueError):
+        HyperLogLog(12).merge(HyperLogLog(14))